@@ -1,18 +1,88 @@
 # GUI Application Code
-# zoom function
 # csv = ppm
 # txt = counts
+import time
+START = time.perf_counter() # for the time to the first window, see --startup-time
+import hashlib
+import importlib
+import io
+import os
 import sys
-from PyQt5 import uic, QtWidgets, QtGui
-import UQ_functions as UQF
-import csv
+from PyQt5 import QtWidgets, QtGui, QtCore
 from pathlib import Path
-import numpy as np
-import webbrowser
 
 qtCreatorFile = "uq_gui.ui" # Enter file here.
+uiModuleFile = "uq_gui_ui.py" # generated from qtCreatorFile by load_ui
 
-Ui_MainWindow, QtBaseClass = uic.loadUiType(qtCreatorFile)
+
+class LazyModule(object):
+    '''Module that is imported when one of its attributes is first used
+
+    numpy and open-cv take most of the start up time, the modules that
+    use them are only imported when the window is shown (see
+    MyApp.load_modules) or when they are used before that. Imports are
+    thread safe, so a background job may be the first to use a module.
+    '''
+    def __init__(self, name):
+        self._name = name
+    
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+def load_ui(ui_file=qtCreatorFile, module_file=uiModuleFile):
+    '''Gets the form class of the .ui file from its generated python module
+
+    The module is generated with pyuic5 when it does not exist or when it
+    was generated from another version of the .ui file, which is checked
+    with the hash of the .ui file in its first line. When the module can
+    not be written the .ui file is loaded directly, which is slower.
+    Input: ui_file, the name of the Qt Designer file next to this file
+    Input: module_file, the name of the generated module next to this file
+    Returns: the form class, Ui_<name of the main window>
+    '''
+    ui_path = Path(__file__).resolve().with_name(ui_file)
+    module_path = ui_path.with_name(module_file)
+    header = '# ui hash: {}\n'.format(hashlib.sha1(ui_path.read_bytes()).hexdigest())
+    try:
+        with module_path.open() as f:
+            current = f.readline() == header
+    except OSError:
+        current = False
+    if not current:
+        from PyQt5 import uic
+        code = io.StringIO()
+        ui = io.StringIO(ui_path.read_text())
+        ui.name = ui_path.name # the header of the module names the file, not the path on this machine
+        uic.compileUi(ui, code)
+        temp = module_path.with_name(module_path.name + '.tmp')
+        try:
+            temp.write_text(header + code.getvalue())
+            os.replace(str(temp), str(module_path))
+        except OSError:
+            if temp.exists():
+                temp.unlink()
+            return uic.loadUiType(str(ui_path))[0]
+        importlib.invalidate_caches()
+    if str(module_path.parent) not in sys.path:
+        sys.path.insert(0, str(module_path.parent))
+    module = importlib.import_module(module_path.stem)
+    return next(getattr(module, n) for n in dir(module) if n.startswith('Ui_'))
+
+
+UQF = LazyModule('UQ_functions')
+UQ_catalog = LazyModule('UQ_catalog')
+UQ_preview = LazyModule('UQ_preview')
+UQ_ratio = LazyModule('UQ_ratio')
+UQ_results = LazyModule('UQ_results')
+UQ_server = LazyModule('UQ_server')
+UQ_store = LazyModule('UQ_store')
+UQ_threshold = LazyModule('UQ_threshold')
+import UQ_workers as UQW
+import UQ_trace
+import UQ_viewer
+
+Ui_MainWindow = load_ui()
 
 
 class MyApp(QtWidgets.QMainWindow, Ui_MainWindow):
@@ -27,41 +97,140 @@ class MyApp(QtWidgets.QMainWindow, Ui_MainWindow):
         self.showMaximized()
         
         self.tifLoaded = False
-        self.all_img_paths = []
-        self.plant_el_dict = {}
-        self.plant_path_dict = {}
+        self._catalog = None # made on first use, see catalog
+        self._results = None # made on first use, see results
+        self._ratio_results = None
+        self.painted = False
         self.nr_img = 0
         self.ext = None
         self.showmask = False
+        # Background jobs, not on the global pool which Qt itself uses for image conversions:
+        self.pool = QtCore.QThreadPool(self)
+        self.jobs = []
+        self.jobs_total = 0
+        self.jobs_done = 0
+        self.mask_worker = None
+        self.mask_settings = None # the (element, manual threshold or None, method) of the shown mask, for UQ_server
+        self.previews = {} # key:path, value:UQ_preview.ThresholdPreview or None while it is built
+        self.mask_item = None
+        self.stats = [] # the UQ_functions.contour_statistics results of the last applied mask
+        self.stats_els = []
+        self.stats_ncon = 0
+        self.ratio_pairs = [] # the element pairs of menu_ratios
+        self.ratio_stats = [] # the UQ_ratio.plant_ratios results of the last applied mask
+        self.ratio_ncon = 0
+        self.ratio_views = [] # the tabs with the ratio maps
+        # the exact mask is calculated when the threshold slider stops moving:
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(300)
+        self.preview_timer.timeout.connect(self.show_mask)
+        self.progressbar = QtWidgets.QProgressBar()
+        self.progressbar.setMaximumWidth(200)
+        self.progressbar.hide()
+        self.statusbar.addPermanentWidget(self.progressbar)
         self.TB_imagefolder.clicked.connect(self.select_images)
         self.PB_clearimgs.clicked.connect(self.clear_images)
         self.CB_selectplant.currentIndexChanged.connect(self.select_plant)
         self.PB_showmask.clicked.connect(self.show_mask)
+        self.CB_selectel.currentIndexChanged.connect(self.build_preview)
+        self.ImgTabs.currentChanged.connect(self.show_tab)
+        self.SL_threshold.valueChanged.connect(self.SB_selectmanualth.setValue)
+        self.SB_selectmanualth.valueChanged.connect(self.SL_threshold.setValue)
+        self.SB_selectmanualth.valueChanged.connect(self.preview_threshold)
         self.PB_applymask.clicked.connect(self.apply_mask)
         self.PB_csvexport.clicked.connect(self.export_csv)
+        self.CB_selectstat.currentIndexChanged.connect(self.fill_table)
         self.menu_doc.triggered.connect(self.show_doc)
         self.menu_github.triggered.connect(self.open_github)
         self.menu_about.triggered.connect(self.show_about)
+        self.menu_opencatalog.triggered.connect(self.open_catalog)
+        self.menu_savecatalog.triggered.connect(self.save_catalog)
+        self.menu_ratios.triggered.connect(self.select_ratios)
+        self.menu_exportall.triggered.connect(self.export_all)
+        self.menu_trace.setChecked(UQ_trace.enabled())
+        self.menu_trace.toggled.connect(self.toggle_trace)
+        self.menu_tracesummary.triggered.connect(self.show_trace_summary)
+        self.menu_tracesave.triggered.connect(self.save_trace)
+    
+    def paintEvent(self, event):
+        '''Runs when the window is drawn: the first time the lazy modules are loaded next
+        
+        With --startup-time on the command line the time since the start of
+        this file is printed instead and the application quits, which is
+        used by benchmarks/bench_startup.py.
+        '''
+        QtWidgets.QMainWindow.paintEvent(self, event)
+        if self.painted:
+            return
+        self.painted = True
+        if '--startup-time' in sys.argv:
+            print('startup {:.6f}'.format(time.perf_counter() - START), flush=True)
+            QtCore.QTimer.singleShot(0, QtWidgets.QApplication.quit)
+        else:
+            QtCore.QTimer.singleShot(0, self.load_modules)
+    
+    @property
+    def catalog(self):
+        '''The UQ_catalog.Catalog of the loaded files, made on first use'''
+        if self._catalog is None:
+            self._catalog = UQ_catalog.Catalog()
+        return self._catalog
+    
+    @catalog.setter
+    def catalog(self, catalog):
+        self._catalog = catalog
+    
+    @property
+    def results(self):
+        '''The UQ_results.ResultTable with the statistics of every quantified plant, made on first use'''
+        if self._results is None:
+            self._results = UQ_results.ResultTable(UQ_results.STATISTIC_COLUMNS)
+        return self._results
+    
+    @property
+    def ratio_results(self):
+        '''The UQ_results.ResultTable with the ratios of every plant, made on first use'''
+        if self._ratio_results is None:
+            self._ratio_results = UQ_results.ResultTable(UQ_ratio.RATIO_COLUMNS, key='pair')
+        return self._ratio_results
+    
+    def load_modules(self):
+        '''Runs right after the window is shown: imports the lazy modules
+        
+        Imports numpy and open-cv with the modules that use them, which
+        makes the first job fast, and creates the empty catalog.
+        '''
+        self.catalog
+        self.fill_statistics()
+    
+    def fill_statistics(self):
+        '''Adds the statistics of UQ_functions to CB_selectstat, once'''
+        if self.CB_selectstat.count() == 0:
+            self.CB_selectstat.blockSignals(True)
+            self.CB_selectstat.addItems(UQF.STATISTICS + ['All'])
+            self.CB_selectstat.setCurrentText('sum')
+            self.CB_selectstat.blockSignals(False)
     
     def select_images(self):
         '''Runs when TB_imagefolder is clicked: selects images
         
-        Opens a QFileDialog screen to select images (.tif or .txt), checks
-        if the filenames are valid and saves the valid imagepaths in a list.
-        From this list the names are extracted and a dictionary is created
-        with the elements for each plant. 
+        Opens a QFileDialog screen to select images (.tif or .txt) or
+        containers (.uqs, which add all their element maps), checks
+        if the filenames are valid and adds the valid imagepaths to the catalog,
+        which keeps the elements and files of each plant.
         Plant names are added to CB_selectplant, which runs select_plant()
         '''
-        img_paths, ext = QtWidgets.QFileDialog.getOpenFileNames(self, 'Select Images', '', "CSV Files (*.csv);; Text Files (*.txt);; Images (*.tif)")
+        img_paths, ext = QtWidgets.QFileDialog.getOpenFileNames(self, 'Select Images', '', "CSV Files (*.csv);; Text Files (*.txt);; Images (*.tif);; Containers (*.uqs)")
         #img_paths, ext = QtWidgets.QFileDialog.getOpenFileNames(self, 'Select Images', '')
         # check the selected filenames are valid:
-        for img_path in img_paths:
+        valid_paths = []
+        for img_path in UQ_catalog.expand_containers(img_paths):
             if UQF.is_valid_filename(img_path) == False:
                 msg = '{} is not a valid filename and is therefore removed'.format(img_path)
                 self.LW_imgpaths.addItem(msg)
                 msg = "Make sure files are in format: <plantname> - <element>.<suffix>"
                 self.LW_imgpaths.addItem(msg)
-                img_paths.remove(img_path)
             else:
                 cur_ext = Path(img_path).suffix
                 if self.ext == None:
@@ -69,193 +238,471 @@ class MyApp(QtWidgets.QMainWindow, Ui_MainWindow):
                 if cur_ext != self.ext:
                     msg = 'Please only add {} files. To use another extension first clear images'.format(self.ext)
                     self.LW_imgpaths.addItem(msg)
-                    img_paths.remove(img_path)
-                else:
+                elif img_path not in self.catalog:
+                    valid_paths.append(img_path)
                     self.nr_img += 1
+        duplicates = len(self.catalog.duplicates)
+        self.catalog.add_files(valid_paths)
+        for used, ignored in self.catalog.duplicates[duplicates:]:
+            self.LW_imgpaths.addItem('{} is another file of the same element as {} and is not used'.format(ignored, used))
+            self.nr_img -= 1
         self.LW_imgpaths.addItem(str(self.nr_img) + ' images loaded total')
-        self.all_img_paths.extend(img_paths)
-        names, self.plant_el_dict = UQF.names_dict_from_filenames(img_paths, self.plant_el_dict)
+        self.update_plants()
+    
+    def update_plants(self):
+        '''Shows the plants of the catalog in CB_selectplant, which runs select_plant()'''
         self.CB_selectplant.clear()
-        self.CB_selectplant.addItems(self.plant_el_dict.keys())
-        # also runs select_plant()
+        self.CB_selectplant.addItems(self.catalog.plants())
         
     def clear_images(self):
         '''Runs when PB_clearimgs is clicked: clears images
         
         Clears every trace of the selected images
         '''
+        self.cancel_jobs()
         self.tifLoaded = False
         self.nr_img = 0
         self.ext = None
         self.LW_imgpaths.clear()
         self.CB_selectplant.clear()
         self.CB_selectel.clear()
-        self.all_img_paths = []
-        self.plant_el_dict = {}
+        self.catalog.clear()
         self.LW_imgpaths.addItem('All images cleared')
-        self.ImgTabs.clear()
+        self.clear_tabs()
         self.Table.clear()
+        self.stats = []
+        self.stats_els = []
+        self.stats_ncon = 0
+        self.ratio_stats = []
+        self.ratio_ncon = 0
+        self.results.clear()
+        self.ratio_results.clear()
         self.showmask = False
+        self.previews = {}
         
     def select_plant(self):
         ''''Runs when CB_selectplant index is changed
         
         Loads information of the current plant and for each element
-        creates a tab which shows an image of that element
+        creates a tab which shows an image of that element. The image of
+        a tab is loaded when the tab is shown for the first time.
         '''
         if self.CB_selectplant.currentText() == '':
             return
+        # Stop loading the previous plant:
+        self.cancel_jobs()
         # Clear current images:
-        self.CB_selectel.clear()
-        self.ImgTabs.clear()
+        self.previews = {}
         self.cur_plant = self.CB_selectplant.currentText()
-        els = self.plant_el_dict[self.cur_plant]
+        self.CB_selectel.clear()
+        self.clear_tabs()
+        els = self.catalog.elements(self.cur_plant)
         self.CB_selectel.addItems(els)
-        # Get filepaths of current plant:
-        self.plant_path_dict = UQF.group_plants_files(self.all_img_paths)
-        self.plant_path_dict = self.plant_path_dict[self.cur_plant]
-        # Add image for each element:
+        # Add a tab for each element:
         for el in els:
-            # Create a new tab:
-            tab = QtWidgets.QWidget()
-            layout = QtWidgets.QVBoxLayout()
-            label = QtWidgets.QLabel()
-            sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-            sizePolicy.setHeightForWidth(True)
-            label.setSizePolicy(sizePolicy)
-            label.setMinimumSize(1, 1)
-            layout.addWidget(label)
-            path = UQF.get_el_file_from_working_files(self.plant_path_dict, el)
-            if path.endswith(".tif"):
-                #msg = "Calculating minerals makes no sense on image files do not use apply mask"
-                #self.LW_imgpaths.addItem(msg)
-                self.tifLoaded = True
-                pixmap = QtGui.QPixmap(path)
-            elif path.endswith(".txt"):
-                array = np.loadtxt(path, delimiter = ",", skiprows = 1, dtype = "uint16")
-                max_array = np.max(array)
-                array = array * (255/max_array)
-                array = array.astype("uint8")
-                qImg = QtGui.QImage(array.data, array.shape[1], array.shape[0], QtGui.QImage.Format_Grayscale8)
-                pixmap = QtGui.QPixmap.fromImage(qImg)
-            elif path.endswith(".csv"):
-                array = np.loadtxt(path, delimiter = ",", skiprows = 0, dtype = "uint16")
-                max_array = np.max(array)
-                array = array * (255/max_array)
-                array = array.astype("uint8")
-                qImg = QtGui.QImage(array.data, array.shape[1], array.shape[0], QtGui.QImage.Format_Grayscale8)
-                pixmap = QtGui.QPixmap.fromImage(qImg)
-            #label.setPixmap(pixmap.scaled(label.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
-            label.setScaledContents(True)
-            label.setPixmap(pixmap)
-            tab.setLayout(layout)
-            self.ImgTabs.addTab(tab, el)
-        self.LW_imgpaths.addItem('Loaded information and images of ' + self.cur_plant)
+            view = UQ_viewer.ZoomView()
+            view.show_text('Loading...')
+            view.path = self.catalog.path(self.cur_plant, el)
+            self.ImgTabs.addTab(view, el)
+        self.show_tab(self.ImgTabs.currentIndex())
+        self.LW_imgpaths.addItem('Loaded information of ' + self.cur_plant)
+    
+    def clear_tabs(self):
+        '''Removes and deletes all element tabs with their images'''
+        while self.ImgTabs.count():
+            view = self.ImgTabs.widget(0)
+            self.ImgTabs.removeTab(0)
+            view.deleteLater()
+        self.ratio_views = []
+    
+    def show_tab(self, index):
+        '''Runs when an element tab is shown: loads its image the first time
+        
+        The image and its pyramid are made in the background.
+        '''
+        view = self.ImgTabs.widget(index)
+        if view is None or view.path is None or view.loaded:
+            return
+        view.loaded = True
+        self.run_job(UQ_viewer.load_pyramid, (view.path,), lambda levels, view=view: self.show_element(view, levels))
+    
+    def show_element(self, view, levels):
+        '''Runs when the image of an element is loaded
+        
+        Shows the image pyramid in the view of its tab.
+        '''
+        view.set_pyramid(levels)
     
     def show_mask(self):
         '''Runs when PB_showmask is clicked
         
         Loads selected threshold and creates a mask with this threshold,
-        which is then showed in GV_mask.
+        which is then showed in GV_mask. Other modes than Manual are
+        automatic threshold methods of UQ_threshold. A mask that was made
+        before with the same file and threshold is read from UQ_store.
         '''
-        if self.all_img_paths == []:
+        if len(self.catalog) == 0:
             self.LW_imgpaths.addItem('Please select a file first')
             return
         # Load threshold:
         th_mode = self.CB_selectthreshold.currentText()
         th_manual = self.SB_selectmanualth.value()
         th_el = self.CB_selectel.currentText()
-        if th_mode == 'Auto':
+        method = UQ_threshold.DEFAULT_METHOD
+        settings = (th_el, th_manual if th_mode == 'Manual' else None, method)
+        if th_mode != 'Manual':
+            method = UQ_threshold.GUI_METHODS[th_mode]
+            settings = (th_el, None, method)
+            th_manual = th_mode
             th_mode = th_el
-            th_manual = 'Auto'
-        cur_path = UQF.get_el_file_from_working_files(self.plant_path_dict, th_el)
-        # Create mask:
-        mask, con = UQF.get_mask(th_mode, th_manual, cur_path, self.all_img_paths)
+        cur_path = self.catalog.path(self.cur_plant, th_el)
+        # Create mask in the background, a mask that is still calculated is replaced:
+        self.showmask = False
+        if self.mask_worker is not None:
+            self.mask_worker.cancel()
+        args = (th_mode, th_manual, cur_path, self.catalog.plant_paths(self.cur_plant), method)
+        self.mask_worker = self.run_job(UQ_store.get_mask, args, lambda result: self.mask_ready(result, th_el, th_manual, settings))
+    
+    def mask_ready(self, result, th_el, th_manual, settings=None):
+        '''Runs when the mask of show_mask is calculated
+        
+        Shows the mask in GV_mask.
+        '''
+        mask, con = result
+        self.mask_settings = settings
         # Load mask as an image in GV_mask:
-        qImg = QtGui.QImage(mask.data, mask.shape[1], mask.shape[0], QtGui.QImage.Format_Grayscale8)
-        pixmap = QtGui.QPixmap.fromImage(qImg)
-        item = QtWidgets.QGraphicsPixmapItem()
-        item.setPixmap(pixmap)
-        scene = QtWidgets.QGraphicsScene()
-        scene.addItem(item)
-        self.GV_mask.setScene(scene)
-        self.GV_mask.fitInView(item)
+        self.show_mask_image(mask)
         self.mask = mask
         self.con = con
         self.showmask = True
         msg = 'Calculated mask for {} using {} with threshold {}'.format(self.cur_plant, th_el, th_manual)
         self.LW_imgpaths.addItem(msg)
         
+    def show_mask_image(self, img):
+        '''Shows an 8-bit image in GV_mask
+        
+        The scene is kept when an image of the same size is shown, so the
+        view does not jump while the threshold slider is moved.
+        '''
+        qImg = QtGui.QImage(img.data, img.shape[1], img.shape[0], img.strides[0], QtGui.QImage.Format_Grayscale8)
+        pixmap = QtGui.QPixmap.fromImage(qImg)
+        if self.mask_item is not None and self.GV_mask.scene() is self.mask_item.scene() and self.mask_item.pixmap().size() == pixmap.size():
+            self.mask_item.setPixmap(pixmap)
+            return
+        self.mask_item = QtWidgets.QGraphicsPixmapItem()
+        self.mask_item.setPixmap(pixmap)
+        scene = QtWidgets.QGraphicsScene()
+        scene.addItem(self.mask_item)
+        self.GV_mask.setScene(scene)
+        self.GV_mask.fit()
+    
+    def build_preview(self):
+        '''Runs when an element is selected: prepares the threshold preview of that element
+        
+        The preview is built in the background, after that moving the
+        threshold slider shows the mask of every threshold immediately.
+        '''
+        el = self.CB_selectel.currentText()
+        if el == '':
+            return
+        path = self.catalog.path(self.cur_plant, el)
+        if path in self.previews:
+            return
+        self.previews[path] = None
+        self.run_job(UQ_preview.preview_from_file, (path,), lambda preview: self.previews.__setitem__(path, preview))
+    
+    def preview_threshold(self, th):
+        '''Runs when the manual threshold changes: shows the preview mask of that threshold
+        
+        The exact mask and contours are calculated by show_mask when the
+        threshold has not changed for a moment.
+        '''
+        if len(self.catalog) == 0 or self.CB_selectel.currentText() == '':
+            return
+        if self.CB_selectthreshold.currentText() != 'Manual':
+            self.CB_selectthreshold.setCurrentText('Manual')
+        preview = self.previews.get(self.catalog.path(self.cur_plant, self.CB_selectel.currentText()))
+        if preview is not None:
+            self.showmask = False
+            self.show_mask_image(preview.mask(th))
+        self.preview_timer.start()
+    
     def apply_mask(self):
         '''Runs when PB_applymask is clicked
         
         Creates a table which for each plant (contour) found in the image
-        shows the total counts for each element.
+        shows the statistics (total counts by default) for each element.
+        Statistics that were calculated before are read from UQ_store.
+        With the environment variable UQ_SERVER the statistics are
+        calculated by the job server (see UQ_server.py).
         This does not work for .tif images.
         '''
         if self.showmask == False:
             self.LW_imgpaths.addItem('Please select a mask first')
             return
-        els = self.plant_el_dict[self.cur_plant]
-        self.Table.setRowCount(len(els))
-        self.Table.setVerticalHeaderLabels(els)
-        self.Table.setColumnCount(len(self.con))
-        self.Table.setHorizontalHeaderLabels([str(i) for i in range(len(self.con))])
-        counts, img = UQF.area_contours(self.con, self.plant_path_dict)
-        #
-        qImg = QtGui.QImage(img.data, img.shape[1], img.shape[0], QtGui.QImage.Format_Grayscale8)
-        pixmap = QtGui.QPixmap.fromImage(qImg)
-        item = QtWidgets.QGraphicsPixmapItem()
-        item.setPixmap(pixmap)
-        scene = QtWidgets.QGraphicsScene()
-        scene.addItem(item)
-        self.GV_mask.setScene(scene)
-        self.GV_mask.fitInView(item)
+        els = self.catalog.elements(self.cur_plant)
+        con = self.con
+        paths = self.catalog.plant_paths(self.cur_plant)
+        if UQ_server.SERVER and self.mask_settings is not None:
+            args = (con, paths, self.mask_settings, UQ_server.SERVER)
+            self.run_job(server_job, args, lambda result: self.server_ready(result, els, con))
+        else:
+            self.run_job(counts_job, (con, paths), lambda result: self.counts_ready(result, els, con))
+        self.apply_ratios()
+    
+    def server_ready(self, result, els, con):
+        '''Runs when the counts of apply_mask are calculated with the job server
+        
+        Shows why the counts were calculated here if the server could not be used.
+        '''
+        result, error, scaled = result
+        if error is not None:
+            self.LW_imgpaths.addItem('Could not use the job server {}, calculated here: {}'.format(UQ_server.SERVER, error))
+        self.counts_ready((result, scaled), els, con)
+    
+    def counts_ready(self, result, els, con):
+        '''Runs when the counts of apply_mask are calculated
+        
+        Shows the numbered contours in GV_mask and the statistics in the
+        table, and keeps the statistics for the export.
+        '''
+        (self.stats, img), self.tifLoaded = result
+        self.results.add_statistics(self.cur_plant, self.stats)
+        self.stats_els = els
+        self.stats_ncon = len(con)
+        self.fill_table()
         #
+        self.show_mask_image(img)
         if self.tifLoaded:
-            msg = ".tif images are scaled, so results are not comparable with other images. Please use .csv or .txt files for absolute results"
+            msg = "8-bit .tif images are scaled, so results are not comparable with other images. Please use .csv, .txt or 16-bit .tif files for absolute results"
             self.LW_imgpaths.addItem(msg)
-        for el, connr, count in counts:
-            self.Table.setItem(els.index(el), connr, QtWidgets.QTableWidgetItem(str(int(count))))
         self.LE_csvfilename.setText(self.cur_plant + ' - total counts')
-        msg = 'Calculated total counts for all {} plants found on the image'.format(len(self.con))
+        msg = 'Calculated total counts for all {} plants found on the image'.format(len(con))
         self.LW_imgpaths.addItem(msg)
+    
+    def select_ratios(self):
+        '''Runs when menu_ratios is clicked: asks for the element pairs to compare
+        
+        The ratios and co-localization of the pairs are calculated for the
+        applied mask and for every mask that is applied after this.
+        '''
+        current = ', '.join(UQ_ratio.pair_name(pair) for pair in self.ratio_pairs)
+        text, ok = QtWidgets.QInputDialog.getText(self, 'Ratios and co-localization', 'Element pairs, for example Zn/K, Ca/K:', text=current)
+        if not ok:
+            return
+        try:
+            self.ratio_pairs = UQ_ratio.parse_pairs(text)
+        except ValueError as error:
+            self.LW_imgpaths.addItem('Could not read the pairs: {}'.format(error))
+            return
+        if self.stats:
+            self.apply_ratios()
+    
+    def apply_ratios(self):
+        '''Calculates the ratio maps and co-localization of the selected pairs for the applied mask
+        
+        All elements are loaded once in the background, the maps are shown
+        in extra tabs and the statistics as extra rows in the table.
+        '''
+        self.remove_ratio_tabs()
+        self.ratio_stats = []
+        self.ratio_ncon = 0
+        self.ratio_results.remove(self.cur_plant)
+        if self.ratio_pairs == [] or self.showmask == False:
+            self.fill_table()
+            return
+        args = (self.con, self.catalog.plant_paths(self.cur_plant), self.ratio_pairs)
+        self.run_job(ratio_job, args, self.ratios_ready)
+    
+    def ratios_ready(self, result):
+        '''Runs when the ratios of apply_ratios are calculated
+        
+        Adds a tab with the map of every pair and shows the statistics in the table.
+        '''
+        self.ratio_stats, maps = result
+        self.ratio_results.add_statistics(self.cur_plant, self.ratio_stats)
+        self.ratio_ncon = len({entry['contour'] for entry in self.ratio_stats})
+        for name, levels in maps:
+            view = UQ_viewer.ZoomView()
+            view.loaded = True
+            view.set_pyramid(levels)
+            self.ImgTabs.addTab(view, name)
+            self.ratio_views.append(view)
+        self.fill_table()
+        self.LW_imgpaths.addItem('Calculated the ratios of {} for {}'.format(', '.join(name for name, _ in maps), self.cur_plant))
+    
+    def remove_ratio_tabs(self):
+        '''Removes and deletes the tabs with ratio maps'''
+        for view in self.ratio_views:
+            self.ImgTabs.removeTab(self.ImgTabs.indexOf(view))
+            view.deleteLater()
+        self.ratio_views = []
+    
+    def fill_table(self):
+        '''Shows the statistic selected in CB_selectstat in the table
+        
+        The rows are the elements and the columns the contours. With All
+        there is a row for every element and statistic. The ratio
+        statistics of the selected pairs are added below the elements.
+        '''
+        self.fill_statistics()
+        stat = self.CB_selectstat.currentText()
+        names = UQF.STATISTICS if stat == 'All' else [stat]
+        rows = [(el, name) for el in self.stats_els for name in names]
+        pairs = [UQ_ratio.pair_name(pair) for pair in self.ratio_pairs] if self.ratio_stats else []
+        ratio_rows = [(pair, name) for pair in pairs for name in UQ_ratio.RATIO_STATISTICS]
+        row_nr = {row:i for i, row in enumerate(rows + ratio_rows)}
+        ncon = max(self.stats_ncon, self.ratio_ncon)
+        self.Table.clear()
+        self.Table.setRowCount(len(rows) + len(ratio_rows))
+        self.Table.setVerticalHeaderLabels([el if stat != 'All' else '{} {}'.format(el, name) for el, name in rows] +
+                                           ['{} {}'.format(pair, name) for pair, name in ratio_rows])
+        self.Table.setColumnCount(ncon)
+        self.Table.setHorizontalHeaderLabels([str(i) for i in range(ncon)])
+        for entry in self.stats:
+            for name in names:
+                value = entry[name]
+                text = str(value) if isinstance(value, int) else '{:.6g}'.format(value)
+                self.Table.setItem(row_nr[(entry['element'], name)], entry['contour'], QtWidgets.QTableWidgetItem(text))
+        for entry in self.ratio_stats:
+            for name in UQ_ratio.RATIO_STATISTICS:
+                self.Table.setItem(row_nr[(entry['pair'], name)], entry['contour'], QtWidgets.QTableWidgetItem('{:.6g}'.format(entry[name])))
+    
+    def run_job(self, fn, args, on_result):
+        '''Runs fn(*args) on the thread pool
+        
+        on_result is called with the result in the GUI thread, unless the
+        job is cancelled before the result arrives. Returns the worker.
+        '''
+        worker = UQW.Worker(fn, *args)
+        worker.signals.result.connect(lambda result: None if worker.cancelled else on_result(result))
+        worker.signals.error.connect(lambda msg: self.LW_imgpaths.addItem('Error: ' + msg))
+        worker.signals.done.connect(lambda: self.job_done(worker))
+        self.jobs.append(worker)
+        self.jobs_total += 1
+        self.update_progress()
+        self.pool.start(worker)
+        return worker
+    
+    def job_done(self, worker):
+        '''Runs when a job is finished: updates the progress bar'''
+        if worker in self.jobs:
+            self.jobs.remove(worker)
+            self.jobs_done += 1
+            self.update_progress()
+    
+    def cancel_jobs(self):
+        '''Cancels all jobs, jobs that are already running are finished but their results are ignored'''
+        for worker in self.jobs:
+            worker.cancel()
+        self.pool.clear()
+        self.jobs = []
+        self.jobs_total = 0
+        self.jobs_done = 0
+        self.update_progress()
+    
+    def update_progress(self):
+        '''Shows the number of finished jobs in the progress bar'''
+        if self.jobs_done >= self.jobs_total:
+            self.jobs_total = 0
+            self.jobs_done = 0
+            self.progressbar.hide()
+        else:
+            # a single job has no progress, show a busy bar:
+            self.progressbar.setRange(0, 0 if self.jobs_total == 1 else self.jobs_total)
+            self.progressbar.setValue(self.jobs_done)
+            self.progressbar.show()
             
     
     def export_csv(self):
-        '''Runs when PB_csvexport is clicked
+        '''Runs when PB_csvexport is clicked: exports the results of the current plant
+        
+        The statistics are written from the results, not from the table.
+        '''
+        if self.CB_selectplant.currentText() == '' or self.cur_plant not in self.results:
+            self.LW_imgpaths.addItem('Please apply a mask first')
+            return
+        self.export_results([self.cur_plant], self.LE_csvfilename.text())
+    
+    def export_all(self):
+        '''Runs when menu_exportall is clicked: exports the results of all plants quantified since the images were loaded'''
+        if len(self.results) == 0:
+            self.LW_imgpaths.addItem('Please apply a mask first')
+            return
+        self.export_results(None, 'UQ_results')
+    
+    def export_results(self, plants, name):
+        '''Opens a dialog window where a filename and directory can be chosen and writes the results
         
-        Opens a dialog window where a filename and directory can be chosen.
-        Then it writes the data in the table (including headers) to a csv file.
+        The results are written with one row per plant, contour and element,
+        to a csv file or a .uqr results file (see UQ_results.py). Ratios are
+        written to a second file, <name> - ratios.
+        Input: plants, a list of plantnames or None for all plants
+        Input: name, the suggested filename without suffix
         '''
-        filename = self.LE_csvfilename.text() + '.csv'
-        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save File', filename, 'CSV(*.csv)')
+        path, ext = QtWidgets.QFileDialog.getSaveFileName(self, 'Save File', name + '.csv', 'CSV(*.csv);; Results(*.uqr)')
+        if not path:
+            return
+        path = Path(path)
+        if path.suffix not in ('.csv', UQ_results.SUFFIX):
+            path = path.with_name(path.name + (UQ_results.SUFFIX if UQ_results.SUFFIX in ext else '.csv'))
+        rows = self.results.save(path, plants)
+        msg = 'Exported {} rows as {}'.format(rows, path)
+        if any(plant in self.ratio_results for plant in (self.ratio_results.plants if plants is None else plants)):
+            ratio_path = path.with_name('{} - ratios{}'.format(path.stem, path.suffix))
+            self.ratio_results.save(ratio_path, plants)
+            msg += ' and the ratios as {}'.format(ratio_path)
+        self.LW_imgpaths.addItem(msg)
+    
+    def open_catalog(self):
+        '''Runs when menu_opencatalog is clicked: opens a saved catalog instead of the current images'''
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Catalog', '', 'Catalog(*.json)')
+        if not path:
+            return
+        try:
+            catalog = UQ_catalog.Catalog.load(path)
+        except (OSError, ValueError, KeyError) as error:
+            self.LW_imgpaths.addItem('Could not open catalog {}: {}'.format(path, error))
+            return
+        self.clear_images()
+        self.catalog = catalog
+        self.nr_img = len(catalog)
+        paths = catalog.paths()
+        if paths:
+            self.ext = Path(paths[0]).suffix
+        self.LW_imgpaths.addItem('Opened catalog {} with {} images'.format(path, self.nr_img))
+        self.update_plants()
+    
+    def save_catalog(self):
+        '''Runs when menu_savecatalog is clicked: saves the loaded images as a catalog'''
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Catalog', 'UQ_catalog.json', 'Catalog(*.json)')
         if path:
-            with open(path, 'w') as stream:
-                writer = csv.writer(stream)
-                headers = ['',]
-                for column in range(self.Table.columnCount()):
-                    header = self.Table.horizontalHeaderItem(column)
-                    if header is not None:
-                         headers.append(header.text())
-                    else:
-                        headers.append("Column " + str(column))
-                writer.writerow(headers)
-                for row in range(self.Table.rowCount()):
-                    rowdata = []
-                    header = self.Table.verticalHeaderItem(row)
-                    if header is not None:
-                        rowdata.append(header.text())
-                    else:
-                        rowdata.append("Row " + str(row))
-                    for column in range(self.Table.columnCount()):
-                        item = self.Table.item(row, column)
-                        if item is not None:
-                            rowdata.append(item.text())
-                        else:
-                            rowdata.append('')
-                    writer.writerow(rowdata)
-            self.LW_imgpaths.addItem('Exported data as a csv file')
+            self.catalog.save(path)
+            self.LW_imgpaths.addItem('Saved catalog as ' + path)
+    
+    def toggle_trace(self, checked):
+        '''Runs when menu_trace is toggled: starts or stops recording timings'''
+        if checked:
+            UQ_trace.enable()
+            self.LW_imgpaths.addItem('Recording time and memory of every step')
+        else:
+            UQ_trace.disable()
+            self.LW_imgpaths.addItem('Stopped recording timings')
+    
+    def show_trace_summary(self):
+        '''Runs when menu_tracesummary is clicked: shows the recorded timings per step'''
+        lines = UQ_trace.summary_lines()
+        if lines == []:
+            self.LW_imgpaths.addItem('No timings recorded, enable Menu > Record timings first')
+        for line in lines:
+            self.LW_imgpaths.addItem(line)
+    
+    def save_trace(self):
+        '''Runs when menu_tracesave is clicked: saves the recorded timings as a Chrome trace or log'''
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save Timings', 'UQ_trace.json', 'Chrome trace(*.json);; JSON lines log(*.jsonl)')
+        if path:
+            UQ_trace.write(path)
+            self.LW_imgpaths.addItem('Saved timings as ' + path)
     
     def show_doc(self):
         doc_window = QtWidgets.QDialog(self)
@@ -269,6 +716,7 @@ class MyApp(QtWidgets.QMainWindow, Ui_MainWindow):
         doc_window.show()
     
     def open_github(self):
+        import webbrowser
         webbrowser.open('https://github.com/jancodemaster/UQ_program')
     
     def show_about(self):
@@ -283,6 +731,51 @@ class MyApp(QtWidgets.QMainWindow, Ui_MainWindow):
         about_window.show()
         
 
+def scaled_tifs(paths):
+    '''Checks if a plant has 8-bit .tif images, which are scaled instead of counts
+    
+    16-bit .tif images made by txt_tobitmap.py have counts.
+    Input: paths, the filepaths of the elements of a plant
+    Returns: True if one of the files is an 8-bit .tif image
+    '''
+    return any(UQF.load_image(p)[2] is None for p in paths if str(p).endswith(".tif"))
+
+
+def counts_job(contours, paths):
+    '''Calculates the statistics of a plant, runs in the background
+    
+    Input: contours, paths, see UQ_store.statistics
+    Returns: the result of UQ_store.statistics and the result of scaled_tifs
+    '''
+    return UQ_store.statistics(contours, paths), scaled_tifs(paths)
+
+
+def server_job(contours, paths, settings, address):
+    '''Calculates the statistics of a plant on the job server, runs in the background
+    
+    When the server can not be reached the statistics are calculated here.
+    Input: contours, paths, see UQ_store.statistics
+    Input: settings, the (element, manual threshold or None, method) of the mask
+    Input: address, the host:port of the server
+    Returns: the result of UQ_store.statistics, None or the error message of the server and the result of scaled_tifs
+    '''
+    element, manual, method = settings
+    try:
+        return UQ_server.statistics(contours, paths, element, manual, method, address), None, scaled_tifs(paths)
+    except OSError as error:
+        return UQ_store.statistics(contours, paths), '{}: {}'.format(type(error).__name__, error), scaled_tifs(paths)
+
+
+def ratio_job(contours, paths, pairs):
+    '''Calculates the ratios of a plant and the image pyramids of its ratio maps, runs in the background
+    
+    Input: contours, paths, pairs, see UQ_ratio.plant_ratios
+    Returns: results, see UQ_ratio.plant_ratios, and a list with the (pair name, pyramid) of every map
+    '''
+    results, maps = UQ_ratio.plant_ratios(contours, paths, pairs)
+    return results, [(name, UQ_viewer.build_pyramid(UQ_ratio.ratio_image(ratio))) for name, ratio in maps.items()]
+
+
 # Run program from command line:
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
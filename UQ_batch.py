@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Batch quantification of a whole directory of plant scans without the GUI.
+
+Every plant in the directory is masked and quantified like "Show mask" and
+"Apply mask" do in UQ_GUI_code.py. The plants are divided over a pool of
+worker processes and all results are written to one csv file with one
+row per plant, contour and element, or to a compact binary results file
+when the output ends with .uqr (see UQ_results.py). With --statistics the rows also have
+the area, mean, min, max, standard deviation and percentiles of every
+contour and element. Masks and results are kept in the result store (see
+UQ_store.py), so running the same plants with the same settings again
+reads them from the store. When there are fewer plants than workers, the
+plants are quantified one by one and the elements of a plant are divided
+over the workers instead, see UQ_stack.quantify_pool. With --open and --close the thresholded mask
+is cleaned up with a morphological opening and closing before the plants
+are labeled, see UQ_functions.plant_labels.
+
+Usage: UQ_batch.py <directory> [--element K] [--manual 40 | --method otsu] [--workers 4] [--output results.csv] [--trace trace.json] [--statistics] [--no-store] [--open 1] [--close 2]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import UQ_functions as UQF
+import UQ_catalog
+import UQ_results
+import UQ_stack
+import UQ_store
+import UQ_threshold
+import UQ_tiled
+import UQ_trace
+
+#settings
+RESULT_HEADER = ["plant", "contour", "element", "count"]
+STATISTICS = [name for name in UQF.STATISTICS if name != "sum"] # the columns after count with --statistics
+
+#functions
+def quantify_plant(plantname, files, element, manual=None, tiled=False, method=UQ_threshold.DEFAULT_METHOD, statistics=False, store=True, cleanup=None, progress=None, pool=None):
+    """Masks and quantifies all elements of one plant.
+
+    Input: plantname, the name of the plant.
+    Input: files, a list of filepaths with all elements of the plant.
+    Input: element, the element used to create the mask, for example "K".
+    Input: manual, a threshold value for the mask or None to find the threshold automatically.
+    Input: tiled, if True the plant is processed in bands of rows, see UQ_tiled.py.
+    Input: method, the automatic threshold method, see UQ_threshold.py.
+    Input: statistics, if True the rows also have the STATISTICS, see UQ_functions.contour_statistics.
+    Input: store, if True masks and results are read from and written to the result store.
+    Input: cleanup, None or the (opening, closing) radius of the mask, see UQ_functions.plant_labels.
+    Input: progress, None or a function that is called with the name of every stage, "mask" and "quantify".
+    Input: pool, None or a ProcessPoolExecutor that quantifies the elements, see UQ_stack.quantify_pool.
+    Returns: rows, a list of tuples with (plant, contour, element, count) and the STATISTICS if asked.
+    """
+    if tiled and statistics:
+        raise ValueError("statistics are not available for tiled processing")
+    if tiled and cleanup:
+        raise ValueError("the mask can not be cleaned up in tiled processing")
+    progress = progress or (lambda stage: None)
+    if tiled:
+        progress("quantify")
+        counts, _ = UQ_tiled.quantify_tiled(files, element, manual, method=method)
+        return [(plantname, connr, el, count) for el, connr, count in counts]
+    el_file = UQF.get_el_file_from_working_files(files, element)
+    if el_file == "Element not found":
+        raise ValueError("element {} not found for plant {}".format(element, plantname))
+    store = UQ_store.default_store() if store else False
+    progress("mask")
+    if manual is None:
+        mask, con = UQ_store.get_mask(element, None, el_file, files, method, store, cleanup)
+    else:
+        mask, con = UQ_store.get_mask("Manual", manual, el_file, files, store=store, cleanup=cleanup)
+    progress("quantify")
+    if statistics:
+        stats, _ = UQ_store.statistics(con, files, store, pool)
+        return [(plantname, s["contour"], s["element"], s["sum"]) + tuple(s[name] for name in STATISTICS) for s in stats]
+    if store:
+        stats, _ = UQ_store.statistics(con, files, store, pool)
+        return [(plantname, s["contour"], s["element"], s["sum"]) for s in stats]
+    if pool is not None:
+        counts, _ = UQ_stack.quantify_pool(UQ_stack.PlantStack.load(files), con, pool)
+    else:
+        counts, _ = UQF.area_contours(con, UQ_stack.PlantStack.load(files))
+    return [(plantname, connr, el, count) for el, connr, count in counts]
+
+def run_plant(plantname, files, element, manual, tiled=False, method=UQ_threshold.DEFAULT_METHOD, statistics=False, store=True, cleanup=None, pool=None):
+    """Runs quantify_plant in a worker and catches all errors.
+
+    Input: see quantify_plant.
+    Returns: plantname, rows (list of result tuples) and error (None or a string with the error message).
+    """
+    try:
+        return plantname, quantify_plant(plantname, files, element, manual, tiled, method, statistics, store, cleanup, pool=pool), None
+    except Exception as error:
+        return plantname, [], "{}: {}".format(type(error).__name__, error)
+
+def plant_groups(dirname, log=None):
+    """Groups all valid files in a directory per plant, with one file per element.
+
+    Input: dirname, a string with the path to the directory.
+    Input: log, None or the stream to report elements with several files to, see UQ_catalog.SUFFIX_ORDER.
+    Returns: plantdict, a dictionary with key:plantname, value: sorted list of plant paths, sorted on plantname.
+    """
+    catalog = UQ_catalog.Catalog()
+    catalog.add_directory(dirname)
+    if log is not None:
+        for used, ignored in catalog.duplicates:
+            print("Ignored {}, using {}".format(ignored, used), file=log, flush=True)
+    return {plant:sorted(catalog.plant_paths(plant)) for plant in sorted(catalog.plants())}
+
+def run_batch(dirname, output, element="K", manual=None, workers=None, log=sys.stderr, trace=None, tiled=False, method=UQ_threshold.DEFAULT_METHOD, statistics=False, store=True, cleanup=None):
+    """Quantifies all plants of a directory and writes the results.
+
+    Results are collected in a UQ_results.ResultTable and written at once
+    in the order of the plant names, no matter in which order the workers
+    finish. With fewer plants than workers the plants are run here and only
+    their elements are quantified by the workers. A plant that fails is reported and skipped, the other plants
+    are still processed.
+    Input: dirname, a string with the path to the directory.
+    Input: output, a string with the path of the csv or .uqr file to write.
+    Input: element, the element used to create the masks.
+    Input: manual, a threshold value or None for automatic thresholds.
+    Input: workers, the number of worker processes, by default the number of cpus.
+    Input: log, the stream to write progress to.
+    Input: trace, an optional filename to write a trace of all stages to, see UQ_trace.py.
+    Input: tiled, if True the plants are processed in bands of rows, for scans that do not fit in memory.
+    Input: method, the automatic threshold method, see UQ_threshold.py.
+    Input: statistics, if True the STATISTICS of every contour are written as well.
+    Input: store, if True the result store is used, see UQ_store.py.
+    Input: cleanup, None or the (opening, closing) radius of the masks, see UQ_functions.plant_labels.
+    Returns: failed, a dictionary with key:plantname, value: error message.
+    """
+    plantdict = plant_groups(dirname, log)
+    plants = list(plantdict)
+    workers = workers or os.cpu_count() or 1
+    failed = {}
+    if trace:
+        UQ_trace.enable()
+        UQ_trace.clear()
+    table = UQ_results.ResultTable(UQ_results.STATISTIC_COLUMNS if statistics else UQ_results.COUNT_COLUMNS)
+    if workers == 1:
+        results = (run_plant(p, plantdict[p], element, manual, tiled, method, statistics, store, cleanup) for p in plants)
+        collect_results(results, plants, table, failed, log)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            if len(plants) < workers and not tiled:
+                results = (run_plant(p, plantdict[p], element, manual, tiled, method, statistics, store, cleanup, pool) for p in plants)
+            elif trace:
+                futures = [pool.submit(UQ_trace.run_traced, run_plant, p, plantdict[p], element, manual, tiled, method, statistics, store, cleanup) for p in plants]
+                results = (collect_trace(*f.result()) for f in as_completed(futures))
+            else:
+                futures = [pool.submit(run_plant, p, plantdict[p], element, manual, tiled, method, statistics, store, cleanup) for p in plants]
+                results = (f.result() for f in as_completed(futures))
+            collect_results(results, plants, table, failed, log)
+    table.save(output, plants)
+    if trace:
+        UQ_trace.write(trace)
+        for line in UQ_trace.summary_lines():
+            print(line, file=log)
+    return failed
+
+def collect_trace(result, records):
+    """Adds the trace records of a worker process to the records of this process.
+
+    Input: result, the result of run_plant.
+    Input: records, the trace records of the worker.
+    Returns: result, unchanged.
+    """
+    UQ_trace.records.extend(records)
+    return result
+
+def collect_results(results, plants, table, failed, log):
+    """Reports the progress of all plants and adds their results to a table.
+
+    Input: results, an iterator with run_plant results in order of finishing.
+    Input: plants, the list of plantnames.
+    Input: table, a UQ_results.ResultTable.
+    Input: failed, a dictionary in which failed plants are stored.
+    Input: log, the stream to write progress to.
+    """
+    for done, (plantname, rows, error) in enumerate(results, 1):
+        if error is None:
+            msg = "{} contours".format(len({row[1] for row in rows}))
+            table.add_rows(rows)
+        else:
+            failed[plantname] = error
+            msg = "failed, {}".format(error)
+        print("[{}/{}] {}: {}".format(done, len(plants), plantname, msg), file=log, flush=True)
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Quantify all plant scans in a directory.")
+    parser.add_argument("directory", help="directory with <plantname> - <element>.<suffix> files")
+    parser.add_argument("-e", "--element", default="K", help="element used to create the mask (default: K)")
+    parser.add_argument("-m", "--manual", type=int, default=None, help="manual threshold (0-255) instead of an automatic threshold")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    parser.add_argument("-o", "--output", default="UQ_results.csv", help="csv file, or .uqr results file, to write the results to")
+    parser.add_argument("--trace", default=None, help="write the time and memory of every stage to this file (.json Chrome trace or .jsonl log)")
+    parser.add_argument("--method", default=UQ_threshold.DEFAULT_METHOD, choices=list(UQ_threshold.METHODS), help="automatic threshold method (default: first_valley)")
+    parser.add_argument("--tiled", action="store_true", help="process the scans in bands of rows, for scans that do not fit in memory")
+    parser.add_argument("--no-store", dest="store", action="store_false", help="do not read or write the result store")
+    parser.add_argument("--statistics", action="store_true", help="also write the area, mean, min, max, std and percentiles of every contour")
+    parser.add_argument("--open", type=int, default=0, help="radius in pixels of a morphological opening of the mask, removes specks and thin bridges (default: 0, none)")
+    parser.add_argument("--close", type=int, default=0, help="radius in pixels of a morphological closing of the mask, closes small gaps (default: 0, none)")
+    args = parser.parse_args(args)
+    if args.tiled and args.statistics:
+        parser.error("--statistics can not be combined with --tiled")
+    if args.open < 0 or args.close < 0:
+        parser.error("--open and --close must be 0 or more")
+    args.cleanup = (args.open, args.close) if args.open or args.close else None
+    if args.tiled and args.cleanup:
+        parser.error("--open and --close can not be combined with --tiled")
+    return args
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    failed = run_batch(args.directory, args.output, args.element, args.manual, args.workers, trace=args.trace, tiled=args.tiled, method=args.method, statistics=args.statistics, store=args.store, cleanup=args.cleanup)
+    if failed:
+        print("{} plants failed".format(len(failed)), file=sys.stderr)
+        sys.exit(1)
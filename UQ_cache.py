@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""Caches of loaded element maps used by UQ_functions.py
+
+Parsing a comma separated count map is slow, so the decoded uint16 array
+of every .txt/.csv file is stored as a .npy sidecar in a cache directory.
+A reload then only costs a memory map of the sidecar.
+On top of that, the images that were loaded last are kept in memory by
+image_cache, so switching between plants does not touch the disk at all.
+Arrays that are memory maps of sidecars do not count for the memory budget
+of image_cache, the operating system keeps or drops their pages itself.
+Temporary sidecars that were left behind by a process that stopped while
+writing are removed by evict when they are older than TEMP_MAX_AGE.
+
+The cache directory can be changed with the environment variable
+UQ_CACHE_DIR (an empty value disables the cache) and the maximum size in
+bytes with UQ_CACHE_MAX_BYTES. The memory budget of image_cache is set
+with UQ_MEMORY_CACHE_BYTES (0 disables it).
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import UQ_container
+
+#settings
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "UQ_program"
+DEFAULT_MAX_BYTES = 2 * 1024**3 # 2 GB
+DEFAULT_MEMORY_BYTES = 1024**3 # 1 GB
+TEMP_MAX_AGE = 10 * 60 # seconds after which a temporary sidecar is left behind and removed
+
+CACHE_DIR = os.environ.get("UQ_CACHE_DIR", str(DEFAULT_CACHE_DIR))
+MAX_BYTES = int(os.environ.get("UQ_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+MEMORY_BYTES = int(os.environ.get("UQ_MEMORY_CACHE_BYTES", DEFAULT_MEMORY_BYTES))
+
+#classes
+class ImageCache:
+    """Least recently used cache of loaded images within one process.
+
+    Every entry holds the 8-bit image and the count array (None for image
+    files) of one file, keyed by the path, size and modification time of
+    the file. The cached arrays are read-only because they are shared.
+    nbytes counts the arrays in memory, mapped_bytes the memory mapped sidecars.
+    """
+    def __init__(self, max_bytes):
+        """Creates an empty cache.
+
+        Input: max_bytes, the memory budget in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.mapped_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Gets the cached image of a file.
+
+        Input: filename, a string or Path of the source file.
+        Returns: a tuple (img, array) or None if the file is not cached.
+        """
+        key = file_state(filename)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, filename, img, array):
+        """Adds the image of a file and evicts the least recently used entries.
+
+        Input: filename, a string or Path of the source file.
+        Input: img, the 8-bit image.
+        Input: array, the count array or None.
+        Returns: a tuple (img, array) with the read-only cached arrays.
+        """
+        for a in (img, array):
+            if a is not None:
+                a.flags.writeable = False
+        entry = (img, array)
+        size = entry_size(entry)
+        if size > self.max_bytes:
+            return entry
+        key = file_state(filename)
+        with self._lock:
+            if key in self.entries:
+                self.remove(self.entries.pop(key))
+            self.entries[key] = entry
+            self.nbytes += size
+            self.mapped_bytes += entry_size(entry, mapped=True)
+            self.shrink(self.max_bytes)
+        return entry
+
+    def shrink(self, max_bytes):
+        """Removes the least recently used entries until the cache fits in max_bytes.
+
+        Input: max_bytes, the memory budget in bytes.
+        """
+        while self.nbytes > max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.remove(entry)
+            self.evictions += 1
+
+    def remove(self, entry):
+        """Subtracts the size of an entry that was taken out of entries.
+
+        Input: entry, a tuple (img, array).
+        """
+        self.nbytes -= entry_size(entry)
+        self.mapped_bytes -= entry_size(entry, mapped=True)
+
+    def set_max_bytes(self, max_bytes):
+        """Changes the memory budget.
+
+        Input: max_bytes, the memory budget in bytes.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.shrink(max_bytes)
+
+    def clear(self):
+        """Removes all entries, the counters are kept."""
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+            self.mapped_bytes = 0
+
+    def stats(self):
+        """Gets the counters of the cache.
+
+        Returns: a dictionary with the entries, bytes, mapped bytes, hits, misses and evictions.
+        """
+        return {"entries":len(self.entries), "bytes":self.nbytes, "mapped_bytes":self.mapped_bytes, "max_bytes":self.max_bytes,
+                "hits":self.hits, "misses":self.misses, "evictions":self.evictions}
+
+#functions
+def set_cache_dir(dirname, max_bytes=None):
+    """Changes the directory (and optionally the size limit) of the disk cache.
+
+    Input: dirname, a string with the cache directory. None or "" disables the cache.
+    Input: max_bytes, the maximum total size of the cache in bytes.
+    """
+    global CACHE_DIR, MAX_BYTES
+    CACHE_DIR = dirname or ""
+    if max_bytes is not None:
+        MAX_BYTES = int(max_bytes)
+
+def cache_enabled():
+    """Returns True if the disk cache is enabled."""
+    return bool(CACHE_DIR)
+
+def file_state(filename):
+    """Gets the identity of a file as used for the cache keys.
+
+    The size and modification time of a member of a container are those of the container.
+    Input: filename, a string or Path of the source file.
+    Returns: a tuple (resolved path, size in bytes, modification time in ns).
+    """
+    stat = UQ_container.source_file(filename).resolve().stat()
+    return str(Path(filename).resolve()), stat.st_size, stat.st_mtime_ns
+
+def sidecar_path(filename):
+    """Gets the sidecar path of a source file.
+
+    The sidecar name consists of a hash of the path and a hash of the size
+    and modification time, so an edited file automatically gets a new sidecar.
+    Input: filename, a string or Path of the source file.
+    Returns: a Path to the .npy sidecar in the cache directory.
+    """
+    path, size, mtime = file_state(filename)
+    path_key = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+    state_key = hashlib.sha1("{}|{}".format(size, mtime).encode("utf-8")).hexdigest()[:16]
+    return Path(CACHE_DIR) / "{}-{}.npy".format(path_key, state_key)
+
+def load_cached_array(filename):
+    """Loads the cached array of a source file as a read-only memory map.
+
+    Input: filename, a string or Path of the source file.
+    Returns: the cached numpy array or None if there is no valid sidecar.
+    """
+    if not cache_enabled():
+        return None
+    sidecar = sidecar_path(filename)
+    try:
+        array = np.load(sidecar, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(sidecar) # mark as recently used for the eviction
+    except OSError:
+        pass
+    return array
+
+def store_cached_array(filename, array):
+    """Stores the parsed array of a source file as a sidecar.
+
+    Old sidecars of the same source file are removed and the cache is
+    trimmed to its maximum size afterwards.
+    Input: filename, a string or Path of the source file.
+    Input: array, the numpy array parsed from the source file.
+    """
+    if not cache_enabled():
+        return
+    try:
+        temp, sidecar = sidecar_temp_path(filename)
+        with open(temp, "wb") as stream:
+            np.save(stream, np.ascontiguousarray(array))
+    except OSError:
+        return
+    commit_sidecar(temp, sidecar)
+
+def sidecar_temp_path(filename):
+    """Gets a temporary path to write the sidecar of a source file to.
+
+    A sidecar can be written there directly, for example as a memory
+    mapped .npy file, and is moved in place with commit_sidecar.
+    Input: filename, a string or Path of the source file.
+    Returns: temp, the temporary Path in the cache directory.
+    Returns: sidecar, the Path of the sidecar.
+    """
+    sidecar = sidecar_path(filename)
+    sidecar.parent.mkdir(parents=True, exist_ok=True)
+    temp = sidecar.with_name("{}.{}-{}.tmp".format(sidecar.name, os.getpid(), threading.get_ident()))
+    return temp, sidecar
+
+def commit_sidecar(temp, sidecar):
+    """Moves a written sidecar in place and removes older sidecars of the same source file.
+
+    The cache is trimmed to its maximum size afterwards.
+    Input: temp, the Path of the written temporary file.
+    Input: sidecar, the Path of the sidecar.
+    """
+    try:
+        os.replace(temp, sidecar)
+    except OSError:
+        remove_file(temp)
+        return
+    path_key = sidecar.name.split("-")[0]
+    for old in sidecar.parent.glob("{}-*.npy".format(path_key)):
+        if old != sidecar:
+            remove_file(old)
+    evict(MAX_BYTES)
+
+def remove_file(path):
+    """Removes a file, ignoring files that are gone or still opened elsewhere.
+
+    Input: path, a Path to the file.
+    """
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+def cache_entries():
+    """Lists all sidecars in the cache directory.
+
+    Returns: entries, a list of tuples (last used time, size, path) sorted from least to most recently used.
+    """
+    entries = []
+    if not cache_enabled():
+        return entries
+    for f in Path(CACHE_DIR).glob("*.npy"):
+        try:
+            stat = f.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, f))
+    entries.sort()
+    return entries
+
+def remove_stale_temps(max_age=TEMP_MAX_AGE):
+    """Removes the temporary sidecars that were not changed for max_age seconds.
+
+    A temporary sidecar is moved in place as soon as it is written, so an
+    old one was left behind by a process that stopped while writing it.
+    Input: max_age, the age in seconds.
+    Returns: removed, the number of removed files.
+    """
+    removed = 0
+    if not cache_enabled():
+        return removed
+    now = time.time()
+    for f in Path(CACHE_DIR).glob("*.tmp"):
+        try:
+            if now - f.stat().st_mtime < max_age:
+                continue
+        except OSError:
+            continue
+        remove_file(f)
+        removed += 1
+    return removed
+
+def evict(max_bytes):
+    """Removes the least recently used sidecars until the cache fits in max_bytes.
+
+    Old temporary sidecars are removed as well, see remove_stale_temps.
+    Input: max_bytes, the maximum total size of the cache in bytes.
+    Returns: removed, the number of removed files.
+    """
+    removed = remove_stale_temps()
+    entries = cache_entries()
+    total = sum(size for _, size, _ in entries)
+    for _, size, f in entries:
+        if total <= max_bytes:
+            break
+        remove_file(f)
+        total -= size
+        removed += 1
+    return removed
+
+def clear_cache():
+    """Removes all sidecars from the cache directory."""
+    return evict(0)
+
+def entry_size(entry, mapped=False):
+    """Calculates the memory used by the arrays of an image cache entry.
+
+    Input: entry, a tuple of numpy arrays or None values.
+    Input: mapped, if True the size of the memory mapped arrays instead of the arrays in memory.
+    Returns: the size in bytes.
+    """
+    return sum(a.nbytes for a in entry if a is not None and is_mapped(a) == mapped)
+
+def is_mapped(array):
+    """Checks if an array is (a view on) a memory mapped file.
+
+    Input: array, a numpy array.
+    Returns: True if the data of the array is in a memory mapped file.
+    """
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+image_cache = ImageCache(MEMORY_BYTES)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Catalog of the loaded plant files.
+
+The catalog is built once from the selected files and is updated when
+files are added or removed. It gives the file of a (plant, element) pair
+directly, instead of grouping all filenames again for every lookup.
+A catalog can be saved as JSON and opened again, for example to reopen a
+directory of scans without selecting all files again. A container (see
+UQ_container.py) is added as all its members. When a plant has several
+files of one element, for example "P - K.txt" and the "P - K.tif" that
+txt_tobitmap.py writes next to it, the file with the first suffix in
+SUFFIX_ORDER is used, no matter in which order the files are added, and
+the other file is recorded in Catalog.duplicates.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import json
+from pathlib import Path
+import UQ_container
+import UQ_functions as UQF
+
+#settings
+UNITS = {".txt":"counts", ".csv":"ppm", ".tif":"scaled"}
+SUFFIX_ORDER = [".txt", ".csv", ".tif"] # the preferred file of an element that has several files
+
+#classes
+class PlantFile:
+    """Record of one element file of a plant."""
+    __slots__ = ("path", "plant", "element", "suffix", "shape", "size", "mtime")
+
+    def __init__(self, path, plant, element, shape=None, size=None, mtime=None):
+        """Creates the record.
+
+        Input: path, a string with the path of the file.
+        Input: plant, the plantname.
+        Input: element, the element, for example "K".
+        Input: shape, the shape of the image if known.
+        Input: size, mtime, the size and modification time of the file when the shape was determined.
+        """
+        self.path = path
+        self.plant = plant
+        self.element = element
+        self.suffix = Path(path).suffix
+        self.shape = shape
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def units(self):
+        """The units of the values: counts for .txt, ppm for .csv and scaled for images."""
+        return UNITS.get(self.suffix, "scaled")
+
+    def to_dict(self):
+        """Returns the record as a dictionary for JSON."""
+        return {"path":self.path, "plant":self.plant, "element":self.element,
+                "shape":list(self.shape) if self.shape else None, "size":self.size, "mtime":self.mtime}
+
+class Catalog:
+    """All loaded plant files, indexed on plant and element.
+
+    Usage:
+        catalog = Catalog()
+        catalog.add_files(paths)
+        catalog.path("Shoot T33b", "K")
+    """
+    def __init__(self):
+        """Creates an empty catalog."""
+        self.records = {} # key:(plant, element), value:PlantFile
+        self.plant_elements = {} # key:plant, value:list of elements in the order they were added
+        self.by_path = {} # key:path, value:PlantFile
+        self.duplicates = [] # (used path, ignored path) of the elements that were added with several files
+
+    def add_files(self, files):
+        """Adds files to the catalog.
+
+        A file of a (plant, element) pair that is already in the catalog is
+        replaced, unless that file has a preferred suffix, see add.
+        Input: files, a list of strings with filepaths, containers are replaced by their members.
+        Returns: added, a list of the valid filepaths that were added, see duplicates for the files that were not used.
+        Returns: rejected, a list of the filepaths without a valid filename.
+        """
+        added, rejected = [], []
+        for f in expand_containers(files):
+            if not UQF.is_valid_filename(f):
+                rejected.append(f)
+                continue
+            plant, el = UQF.plantname_from_filename(f)
+            if self.add(PlantFile(f, plant, el)):
+                added.append(f)
+        return [f for f in added if f in self.by_path], rejected
+
+    def add(self, record):
+        """Adds a PlantFile record to the catalog.
+
+        When the catalog already has a file of the plant and element, the
+        file with the first suffix in SUFFIX_ORDER is used, or the new file
+        if they have the same suffix. The other file is added to duplicates.
+        Input: record, a PlantFile.
+        Returns: True if the record is used, False if it is ignored.
+        """
+        key = (record.plant, record.element)
+        current = self.records.get(key)
+        if current is not None and current.path != record.path:
+            if suffix_rank(record.path) > suffix_rank(current.path):
+                self.duplicates.append((current.path, record.path))
+                return False
+            self.duplicates.append((record.path, current.path))
+        if current is not None:
+            del self.by_path[current.path]
+        else:
+            self.plant_elements.setdefault(record.plant, []).append(record.element)
+        self.records[key] = record
+        self.by_path[record.path] = record
+        return True
+
+    def add_directory(self, dirname):
+        """Adds all valid files of a directory, sorted on filename.
+
+        Input: dirname, a string with the path to the directory.
+        Returns: added, rejected, see add_files.
+        """
+        return self.add_files(sorted(UQF.load_images_directory(dirname)))
+
+    def remove(self, path):
+        """Removes a file from the catalog.
+
+        Input: path, a string with the filepath.
+        """
+        record = self.by_path.pop(str(path), None)
+        if record is None:
+            return
+        del self.records[(record.plant, record.element)]
+        els = self.plant_elements[record.plant]
+        els.remove(record.element)
+        if els == []:
+            del self.plant_elements[record.plant]
+
+    def clear(self):
+        """Removes all files from the catalog."""
+        self.records.clear()
+        self.plant_elements.clear()
+        self.by_path.clear()
+        self.duplicates = []
+
+    def get(self, plant, element):
+        """Gets the record of a plant and element.
+
+        Input: plant, the plantname.
+        Input: element, the element.
+        Returns: the PlantFile or None if it is not in the catalog.
+        """
+        return self.records.get((plant, element))
+
+    def path(self, plant, element):
+        """Gets the filepath of a plant and element.
+
+        Input: plant, the plantname.
+        Input: element, the element.
+        Returns: the filepath as string or "Element not found" like UQ_functions.get_el_file_from_working_files.
+        """
+        record = self.records.get((plant, element))
+        return record.path if record is not None else "Element not found"
+
+    def plants(self):
+        """Returns a list of all plantnames in the order they were added."""
+        return list(self.plant_elements)
+
+    def elements(self, plant):
+        """Returns a list of the elements of a plant in the order they were added."""
+        return list(self.plant_elements.get(plant, []))
+
+    def plant_paths(self, plant):
+        """Returns a list of the filepaths of all elements of a plant."""
+        return [self.records[(plant, el)].path for el in self.plant_elements.get(plant, [])]
+
+    def paths(self):
+        """Returns a list of all filepaths in the catalog."""
+        return list(self.by_path)
+
+    def plant_of(self, path):
+        """Gets the plantname of a filepath in the catalog.
+
+        Input: path, a string with the filepath.
+        Returns: the plantname or None.
+        """
+        record = self.by_path.get(str(path))
+        return record.plant if record is not None else None
+
+    def shape(self, plant, element):
+        """Gets the shape of the image of a plant and element.
+
+        The shape is determined once and stored in the record, it is
+        determined again when the file has changed.
+        Input: plant, the plantname.
+        Input: element, the element.
+        Returns: the shape as tuple.
+        """
+        record = self.records[(plant, element)]
+        stat = UQ_container.source_file(record.path).stat()
+        if record.shape is None or (record.size, record.mtime) != (stat.st_size, stat.st_mtime_ns):
+            record.shape = tuple(UQF.calc_shape(record.path))
+            record.size, record.mtime = stat.st_size, stat.st_mtime_ns
+        return record.shape
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, path):
+        return str(path) in self.by_path
+
+    def save(self, filename):
+        """Saves the catalog as JSON.
+
+        Input: filename, the path of the JSON file.
+        """
+        with open(filename, "w") as stream:
+            json.dump({"files":[r.to_dict() for r in self.records.values()]}, stream, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        """Opens a catalog saved with save.
+
+        Files that do not exist anymore are left out.
+        Input: filename, the path of the JSON file.
+        Returns: catalog, the Catalog.
+        """
+        with open(filename) as stream:
+            data = json.load(stream)
+        catalog = cls()
+        for d in data["files"]:
+            if UQ_container.exists(d["path"]):
+                shape = tuple(d["shape"]) if d["shape"] else None
+                catalog.add(PlantFile(d["path"], d["plant"], d["element"], shape, d["size"], d["mtime"]))
+        return catalog
+
+#functions
+def suffix_rank(path):
+    """Returns: the position of the suffix of a path in SUFFIX_ORDER, other suffixes come last."""
+    suffix = Path(path).suffix
+    return SUFFIX_ORDER.index(suffix) if suffix in SUFFIX_ORDER else len(SUFFIX_ORDER)
+
+def expand_containers(files):
+    """Replaces the containers in a list of files by the virtual paths of their members.
+
+    Input: files, a list of filepaths.
+    Returns: a list of strings with filepaths.
+    """
+    expanded = []
+    for f in files:
+        if UQ_container.is_container(f):
+            expanded.extend(UQ_container.member_paths(f))
+        else:
+            expanded.append(str(f))
+    return expanded
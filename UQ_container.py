@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Compact container with all element maps of a scan or a directory.
+
+A container (.uqs) holds the count maps of many .txt and .csv files as
+zlib compressed chunks of CHUNK x CHUNK uint16 values, so any element or
+part of an element is read without decoding the rest. The layout is:
+- 8 bytes MAGIC, then the offset and length of the header as two little endian uint64.
+- the compressed chunks.
+- the header, JSON with for every member its name, plant, element, units
+  (counts for .txt, ppm for .csv), original filename, shape, chunk size
+  and the (offset, length) of every chunk in row major order.
+
+A member has the virtual path <container>/<original filename>, for example
+"scan.uqs/Shoot T33b - K.txt". UQ_functions.load_image and the catalog
+read these paths like normal files.
+
+Usage:
+    UQ_container.py pack <directory> <output.uqs> [--per-plant]
+    UQ_container.py list <file.uqs>
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+#settings
+SUFFIX = ".uqs"
+MAGIC = b"UQSCAN01"
+PREFIX = struct.Struct("<8sQQ") # magic, header offset, header length
+CHUNK = 256
+LEVEL = 6 # zlib compression level
+UNITS = {".txt":"counts", ".csv":"ppm"}
+
+_containers = {} # key:resolved path of the container, value:open Container
+_lock = threading.Lock()
+
+#classes
+class Container:
+    """A container opened for reading.
+
+    The file is memory mapped, so chunks can be read from several threads.
+
+    Usage:
+        with Container("scan.uqs") as container:
+            container.read("Shoot T33b - K.txt", rows=(0, 512))
+    """
+    def __init__(self, filename):
+        """Opens a container and reads its header.
+
+        Input: filename, a string or Path of the .uqs file.
+        """
+        self.filename = Path(filename)
+        self.stream = open(str(self.filename), "rb")
+        try:
+            self.data = mmap.mmap(self.stream.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, offset, length = PREFIX.unpack(self.data[:PREFIX.size])
+            if magic != MAGIC:
+                raise ValueError("{} is not a {} container".format(self.filename.name, SUFFIX))
+            header = json.loads(self.data[offset:offset + length].decode("utf-8"))
+        except Exception:
+            self.close()
+            raise
+        self.members = {m["name"]:m for m in header["members"]}
+        stat = self.filename.stat()
+        self.state = (stat.st_size, stat.st_mtime_ns)
+
+    def names(self):
+        """Returns a list of the member names in the order they were packed."""
+        return list(self.members)
+
+    def info(self, name):
+        """Gets the metadata of a member.
+
+        Input: name, the member name.
+        Returns: a dictionary with name, plant, element, units, source, shape, dtype and chunk.
+        """
+        member = self.member(name)
+        return {key:value for key, value in member.items() if key != "chunks"}
+
+    def member(self, name):
+        """Gets the header entry of a member, raises FileNotFoundError if it is not in the container."""
+        try:
+            return self.members[name]
+        except KeyError:
+            raise FileNotFoundError("{} is not in {}".format(name, self.filename))
+
+    def read(self, name, rows=None, cols=None):
+        """Reads a member or a part of it.
+
+        Only the chunks that overlap the part are decoded.
+        Input: name, the member name.
+        Input: rows, cols, optional (start, stop) of the part, by default the whole map.
+        Returns: array, a uint16 numpy array.
+        """
+        member = self.member(name)
+        n_rows, n_cols = member["shape"]
+        chunk = member["chunk"]
+        r0, r1 = clip(rows, n_rows)
+        c0, c1 = clip(cols, n_cols)
+        out = np.empty((r1 - r0, c1 - c0), dtype=np.dtype(member["dtype"]))
+        chunks_per_row = -(-n_cols // chunk)
+        tasks = [(i, j) for i in range(r0 // chunk, -(-r1 // chunk)) for j in range(c0 // chunk, -(-c1 // chunk))]
+        def copy(task):
+            i, j = task
+            block = self.chunk(member, i * chunks_per_row + j, i, j)
+            top, left = i * chunk, j * chunk
+            y0, y1 = max(r0, top), min(r1, top + block.shape[0])
+            x0, x1 = max(c0, left), min(c1, left + block.shape[1])
+            out[y0 - r0:y1 - r0, x0 - c0:x1 - c0] = block[y0 - top:y1 - top, x0 - left:x1 - left]
+        if len(tasks) > 16:
+            # zlib releases the GIL, so large reads are decoded by several threads
+            with ThreadPoolExecutor(os.cpu_count() or 1) as pool:
+                list(pool.map(copy, tasks))
+        else:
+            for task in tasks:
+                copy(task)
+        return out
+
+    def chunk(self, member, index, i, j):
+        """Decodes one chunk of a member.
+
+        Input: member, the header entry of the member.
+        Input: index, the number of the chunk in row major order.
+        Input: i, j, the row and column of the chunk.
+        Returns: block, a numpy array with the values of the chunk.
+        """
+        n_rows, n_cols = member["shape"]
+        chunk = member["chunk"]
+        offset, length = member["chunks"][index]
+        shape = (min(chunk, n_rows - i * chunk), min(chunk, n_cols - j * chunk))
+        return np.frombuffer(zlib.decompress(self.data[offset:offset + length]), dtype=np.dtype(member["dtype"])).reshape(shape)
+
+    def close(self):
+        """Closes the file."""
+        if getattr(self, "data", None) is not None:
+            self.data.close()
+            self.data = None
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class MemberArray:
+    """Array-like view of a member that reads rows when they are sliced.
+
+    Used by UQ_tiled to process a member band by band without decoding
+    the whole map.
+    """
+    def __init__(self, path):
+        """Creates the view.
+
+        Input: path, the virtual path of a member.
+        """
+        self.container, self.name = open_member(path)
+        self.shape = tuple(self.container.member(self.name)["shape"])
+        self.dtype = np.dtype(self.container.member(self.name)["dtype"])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        """Reads the rows of a slice (with step 1) as a numpy array."""
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("a member can only be sliced on rows")
+        start, stop, _ = index.indices(self.shape[0])
+        return self.container.read(self.name, rows=(start, max(start, stop)))
+
+#functions
+def clip(part, size):
+    """Gets the (start, stop) of a part within 0 and size.
+
+    Input: part, None or (start, stop).
+    Input: size, the length of the axis.
+    Returns: start, stop.
+    """
+    if part is None:
+        return 0, size
+    start, stop = part
+    return max(0, min(start, size)), max(0, min(stop, size))
+
+def is_container(path):
+    """Returns True if the path is a container file."""
+    path = Path(path)
+    return path.suffix == SUFFIX and path.is_file()
+
+def split_member(path):
+    """Splits the virtual path of a member.
+
+    Input: path, a string or Path.
+    Returns: (container path, member name) or None if the path is not in a container.
+    """
+    path = Path(path)
+    if path.parent.suffix == SUFFIX and path.parent.is_file():
+        return path.parent, path.name
+    return None
+
+def is_member(path):
+    """Returns True if the path is the virtual path of a member."""
+    return split_member(path) is not None
+
+def source_file(path):
+    """Gets the file on disk that holds a path: the container of a member or the path itself.
+
+    Input: path, a string or Path.
+    Returns: a Path.
+    """
+    parts = split_member(path)
+    return parts[0] if parts is not None else Path(path)
+
+def open_container(filename):
+    """Opens a container once per process, it is opened again when the file changed.
+
+    Input: filename, a string or Path of the .uqs file.
+    Returns: the open Container.
+    """
+    key = str(Path(filename).resolve())
+    stat = Path(key).stat()
+    with _lock:
+        container = _containers.get(key)
+        if container is not None and container.state == (stat.st_size, stat.st_mtime_ns):
+            return container
+        if container is not None:
+            container.close()
+        container = Container(key)
+        _containers[key] = container
+        return container
+
+def close_all():
+    """Closes all containers opened with open_container."""
+    with _lock:
+        for container in _containers.values():
+            container.close()
+        _containers.clear()
+
+def open_member(path):
+    """Opens the container of a member.
+
+    Input: path, the virtual path of a member.
+    Returns: container, name.
+    """
+    parts = split_member(path)
+    if parts is None:
+        raise FileNotFoundError("{} is not in a {} container".format(path, SUFFIX))
+    container = open_container(parts[0])
+    container.member(parts[1])
+    return container, parts[1]
+
+def read_member(path, rows=None, cols=None):
+    """Reads a member or a part of it, see Container.read.
+
+    Input: path, the virtual path of a member.
+    Input: rows, cols, optional (start, stop) of the part.
+    Returns: array, a uint16 numpy array.
+    """
+    container, name = open_member(path)
+    return container.read(name, rows, cols)
+
+def member_shape(path):
+    """Gets the shape of a member from the header, without decoding it.
+
+    Input: path, the virtual path of a member.
+    Returns: shape, a tuple (rows, columns).
+    """
+    container, name = open_member(path)
+    return tuple(container.member(name)["shape"])
+
+def member_paths(filename):
+    """Gets the virtual paths of all members of a container.
+
+    Input: filename, a string or Path of the .uqs file.
+    Returns: a list of strings.
+    """
+    return [str(Path(filename) / name) for name in open_container(filename).names()]
+
+def exists(path):
+    """Returns True if a file or the member of a container exists."""
+    parts = split_member(path)
+    if parts is None:
+        return Path(path).is_file()
+    return parts[1] in open_container(parts[0]).members
+
+def compress_chunks(array, chunk=CHUNK, level=LEVEL):
+    """Compresses an array in chunks.
+
+    Input: array, a 2D numpy array.
+    Input: chunk, the width and height of the chunks.
+    Input: level, the zlib compression level.
+    Returns: a list of bytes with the compressed chunks in row major order.
+    """
+    n_rows, n_cols = array.shape
+    blocks = [array[top:top + chunk, left:left + chunk] for top in range(0, n_rows, chunk) for left in range(0, n_cols, chunk)]
+    with ThreadPoolExecutor(os.cpu_count() or 1) as pool:
+        return list(pool.map(lambda block: zlib.compress(np.ascontiguousarray(block).tobytes(), level), blocks))
+
+def pack(files, output, chunk=CHUNK, level=LEVEL):
+    """Packs count files into one container.
+
+    The container is written to a temporary file first, so a container
+    that is being written is never read.
+    Input: files, a list of paths of .txt and .csv files.
+    Input: output, the path of the .uqs file to write.
+    Input: chunk, the width and height of the chunks.
+    Input: level, the zlib compression level.
+    Returns: names, a list of the member names.
+    """
+    import UQ_functions as UQF # UQ_functions reads containers, so it is imported here
+    output = Path(output)
+    temp = output.with_name(output.name + ".tmp")
+    members = []
+    try:
+        with open(str(temp), "wb") as stream:
+            stream.write(PREFIX.pack(MAGIC, 0, 0))
+            for f in files:
+                f = Path(f)
+                if f.suffix not in UNITS:
+                    raise ValueError("only .txt and .csv files can be packed, not {}".format(f.name))
+                if any(m["name"] == f.name for m in members):
+                    raise ValueError("{} is packed twice".format(f.name))
+                plant, el = UQF.plantname_from_filename(f)
+                array = UQF.load_array(f)
+                chunks = []
+                for data in compress_chunks(array, chunk, level):
+                    chunks.append([stream.tell(), len(data)])
+                    stream.write(data)
+                members.append({"name":f.name, "plant":plant, "element":el, "units":UNITS[f.suffix], "source":str(f),
+                                "shape":list(array.shape), "dtype":str(array.dtype), "chunk":chunk, "chunks":chunks})
+            header = json.dumps({"version":1, "members":members}).encode("utf-8")
+            offset = stream.tell()
+            stream.write(header)
+            stream.seek(0)
+            stream.write(PREFIX.pack(MAGIC, offset, len(header)))
+        os.replace(str(temp), str(output))
+    except BaseException:
+        if temp.exists():
+            temp.unlink()
+        raise
+    return [m["name"] for m in members]
+
+def pack_directory(dirname, output, per_plant=False):
+    """Packs all valid .txt and .csv files of a directory.
+
+    Input: dirname, a string with the path to the directory.
+    Input: output, the .uqs file, or with per_plant the directory for the containers.
+    Input: per_plant, if True every plant gets its own container <plant>.uqs.
+    Returns: containers, a dictionary with key:container path, value:list of member names.
+    """
+    import UQ_functions as UQF
+    files = sorted(f for f in UQF.load_images_directory(dirname) if Path(f).suffix in UNITS and UQF.is_valid_filename(f))
+    if not per_plant:
+        return {str(output):pack(files, output)}
+    plants = {}
+    for f in files:
+        plants.setdefault(UQF.plantname_from_filename(f)[0], []).append(f)
+    Path(output).mkdir(parents=True, exist_ok=True)
+    containers = {}
+    for plant, plant_files in plants.items():
+        filename = str(Path(output) / (plant + SUFFIX))
+        containers[filename] = pack(plant_files, filename)
+    return containers
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pack count files into {} containers or list a container.".format(SUFFIX))
+    commands = parser.add_subparsers(dest="command")
+    pack_parser = commands.add_parser("pack", help="pack all .txt and .csv files of a directory")
+    pack_parser.add_argument("directory", help="directory with <plantname> - <element>.<suffix> files")
+    pack_parser.add_argument("output", help="the container to write, or the output directory with --per-plant")
+    pack_parser.add_argument("--per-plant", action="store_true", help="write one container per plant")
+    list_parser = commands.add_parser("list", help="list the members of a container")
+    list_parser.add_argument("container", help="the {} file".format(SUFFIX))
+    args = parser.parse_args(args)
+    if args.command is None:
+        parser.error("use pack or list")
+    return args
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.command == "pack":
+        for filename, names in pack_directory(args.directory, args.output, args.per_plant).items():
+            print("{}: {} element maps, {} bytes".format(filename, len(names), os.path.getsize(filename)))
+    else:
+        with Container(args.container) as container:
+            for name in container.names():
+                info = container.info(name)
+                print("{}\t{}\t{}\t{}\t{}x{}".format(name, info["plant"], info["element"], info["units"], *info["shape"]))
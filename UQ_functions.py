@@ -9,6 +9,18 @@ from sys import argv
 import cv2
 import numpy as np
 from pathlib import Path
+import UQ_cache
+import UQ_container
+import UQ_parser
+import UQ_threshold
+
+#settings
+PERCENTILES = [25, 50, 75, 95]
+STATISTICS = ["area", "sum", "mean", "min", "max", "std"] + ["p{}".format(p) for p in PERCENTILES]
+SCALE_BLOCK = 1 << 20 # number of pixels scaled at once by array_to_img
+LUT_MAX = 1 << 16 # largest maximum that array_to_img scales with a lookup table
+EXACT_FLOAT = 1 << 53 # float64 holds every integer below this exactly
+MIN_AREA = 0.0001 # fraction of the image, smaller plants are noise
 
 #functions
 def balanced_hist_thresholding(b):#source: https://theailearner.com/tag/image-thresholding/
@@ -47,6 +59,14 @@ def hist_thresholding(array):
     """
     #vals, counts = np.unique(array, return_counts=True)
     hist, bins = np.histogram(array, bins=25)
+    return first_valley(hist, bins)
+
+def first_valley(hist, bins):
+    """Finds the start of the bin after the first valley of a histogram.
+    
+    Input: hist, bins, a histogram as returned by np.histogram.
+    Returns: th, the left edge of the first bin that is higher than the bin before it.
+    """
     lastval = 0
     down = False
     th = None
@@ -63,32 +83,97 @@ def hist_thresholding(array):
         i += 1
     return th
 
+def load_array(filename):
+    """Loads the count array of a .txt or .csv file.
+    
+    The parsed array is stored in the disk cache (see UQ_cache.py), so loading
+    the same unchanged file again only memory maps the cached array. A
+    member of a container (see UQ_container.py) is read from the container.
+    Input: filename, a string or Path of a .txt (with header) or .csv file.
+    Returns: array, a uint16 numpy array with the counts.
+    """
+    if UQ_container.is_member(filename):
+        return UQ_container.read_member(filename)
+    array = UQ_cache.load_cached_array(filename)
+    if array is not None:
+        return array
+    array = UQ_parser.parse_count_file(filename, UQ_parser.count_file_skiprows(filename))
+    UQ_cache.store_cached_array(filename, array)
+    return array
+
+def array_to_img(array, max_array=None):
+    """Scales a count array to an 8-bit image.
+    
+    A count becomes count * 255 // max_array, calculated exactly with
+    integers. Counts up to LUT_MAX are scaled with a lookup table, larger
+    counts with 64-bit integers, in blocks of rows so there is no full
+    size temporary array. Arrays with floats are scaled with floats.
+    Input: array, a numpy array with counts.
+    Input: max_array, the count that becomes 255, by default the maximum of array (give it to scale a part of a larger array).
+    Returns: img, a uint8 numpy array where the maximum count is 255.
+    """
+    if max_array is None:
+        max_array = np.max(array)
+    if not np.issubdtype(array.dtype, np.integer):
+        return (array * (255/max_array)).astype("uint8")
+    max_array = int(max_array)
+    img = np.zeros(array.shape, dtype=np.uint8)
+    if max_array <= 0 or img.size == 0:
+        return img
+    block = max(1, SCALE_BLOCK // max(1, img[0].size))
+    if max_array <= LUT_MAX:
+        lut = (np.arange(max_array + 1, dtype=np.int64) * 255 // max_array).astype(np.uint8)
+        for start in range(0, len(array), block):
+            np.take(lut, array[start:start + block], out=img[start:start + block], mode="clip")
+    else:
+        for start in range(0, len(array), block):
+            part = np.clip(array[start:start + block], 0, max_array).astype(np.int64)
+            part *= 255
+            part //= max_array
+            img[start:start + block] = part
+    return img
+
+def read_image(filename):
+    """Reads an image file, a single channel 16 or 32-bit .tif is read as counts.
+    
+    Input: filename, a Path of the image file.
+    Returns: image, the 8-bit gray image.
+    Returns: array, the counts of a 16/32-bit .tif, None for other images.
+    """
+    if filename.suffix in [".tif", ".tiff"]:
+        image = cv2.imread(filename.as_posix(), cv2.IMREAD_UNCHANGED)
+        if image is not None and image.ndim == 2:
+            if image.dtype == np.uint8:
+                return image, None
+            return array_to_img(image), image
+    return cv2.imread(filename.as_posix(), 0), None
+
 def load_image(filename):
     """Loads a image file from .tif or .txt/.csv
     
+    Images are kept in UQ_cache.image_cache, so loading the same file again
+    returns the same read-only arrays without reading the file. A 16 or 32-bit
+    .tif (see txt_tobitmap.py) holds counts and is loaded like a .txt file.
     Input: filename, a string containing the path to the image file.
     Returns: image, a cv image as numpy array
     Returns: name, the name of the image
-    Returns: array, the actual array loaded from a .txt or .csv file. None if input is an image. 
+    Returns: array, the actual array loaded from a .txt or .csv file or a 16/32-bit .tif. None if input is an 8-bit image. 
     """
     filename = Path(filename)
     if filename.suffix in [".tif", ".tiff", ".png", ".jpeg", ".jpg"]:
-        image = cv2.imread(filename.as_posix(), 0)
+        entry = UQ_cache.image_cache.get(filename)
+        if entry is None:
+            image, array = read_image(filename)
+            entry = UQ_cache.image_cache.put(filename, image, array)
         name = filename.name
-        return image, name, None
-    elif filename.suffix in [".txt"]:
-        #convert txt to tif
-        array = np.loadtxt(filename, delimiter = ",", skiprows = 1, dtype = "uint16")
-        max_array = np.max(array)
-        img = array * (255/max_array)
-        img = img.astype("uint8")
-        name = filename.name
-        return img, name, array
-    elif filename.suffix in [".csv"]:
-        array = np.loadtxt(filename, delimiter = ",", skiprows = 0, dtype = "uint16")
-        max_array = np.max(array)
-        img = array * (255/max_array)
-        img = img.astype("uint8")
+        return entry[0], name, entry[1]
+    elif filename.suffix in [".txt", ".csv"]:
+        entry = UQ_cache.image_cache.get(filename)
+        if entry is None:
+            array = load_array(filename)
+            img = array_to_img(array)
+            entry = UQ_cache.image_cache.put(filename, img, array)
+        img, array = entry
         name = filename.name
         return img, name, array
     else:
@@ -110,7 +195,7 @@ def contouring(img):
     for c in contours:
         if cv2.contourArea(c) > int(total_area * 0.0001): #0.01 percent of total image
             large_contours.append(c)
-    large_contours = np.array(large_contours)
+    # a list, np.array() of contours with different lengths fails on numpy >= 1.24
     return large_contours
 
 def create_mask(img, contours):
@@ -144,41 +229,42 @@ def load_images_directory(dirname):
     files = [str(x) for x in dirname.iterdir() if not x.is_dir()]
     return files
 
-def mask_from_threshold(imgname, th_value):
+def mask_from_threshold(imgname, th_value, cleanup=None):
     """Creates a mask based on a threshold value.
     
     Input: imgname, the filename of an image.
     Input: th_value, an integer containing the threshold value.
-    Returns: binary_mask, a numpy array with the white contours drawn on a black image.
-    Returns: con, open-cv contours based on the threshold.
+    Input: cleanup, see plant_labels.
+    Returns: binary_mask, a numpy array with the white plants on a black image.
+    Returns: con, the PlantLabels of the plants.
     """
     img, name, _ = load_image(imgname)
     _, th1 = cv2.threshold(img, th_value, 255, cv2.THRESH_BINARY)
-    con = contouring(th1)
-    binary_mask = create_mask(img, con)
-    return binary_mask, con
+    con = plant_labels(th1, cleanup)
+    return con.mask(), con
 
-def mask_from_k(kfile):
+def mask_from_k(kfile, method=UQ_threshold.DEFAULT_METHOD, cleanup=None):
     """Creates a mask from an element image.
     
     For example create a mask for all plants with name x based on x-K.txt
     K is generally a good element to create a mask from.
     
     Input: kfile, a string containing the path to a image file.
-    Returns: binary_mask, a numpy array with the white contours drawn on a black image.
-    Returns: con, open-cv contours based on the threshold.
+    Input: method, the threshold method, see UQ_threshold.py.
+    Input: cleanup, see plant_labels.
+    Returns: binary_mask, a numpy array with the white plants on a black image.
+    Returns: con, the PlantLabels of the plants.
     """
     img, name, _ = load_image(kfile)
     
     #b1 = create_hist(img)
     #thresh_value = balanced_hist_thresholding(b1)
     
-    thresh_value = hist_thresholding(img)
+    thresh_value = UQ_threshold.threshold(img, method)
     _, th1 = cv2.threshold(img, thresh_value, 255, cv2.THRESH_BINARY)
     
-    con = contouring(th1)
-    binary_mask = create_mask(img, con)
-    return binary_mask, con
+    con = plant_labels(th1, cleanup)
+    return con.mask(), con
 
 def names_dict_from_filenames(f_list, dic):
     """This function creates a dictionary with key:plantname, value:element
@@ -251,7 +337,7 @@ def calc_area_using_mask(mask):
     Input: mask, a numpy array containing a mask.
     Returns: the sum of all pixels in the mask.
     """
-    return int(np.sum(mask)/255) # all black pixels are 255 instead of 1
+    return int(np.count_nonzero(mask)) # all black pixels are 255 instead of 1
 
 def string_to_paths(files):
     """Function to convert strings with a path to pathlib Paths.
@@ -290,27 +376,42 @@ def group_plants_files(files):
         update_dict(plantdict, plantname, str(f))
     return plantdict
 
-def get_mask(th_mode, th_manual, cur_path, files):
+def get_mask(th_mode, th_manual, cur_path, files, method=UQ_threshold.DEFAULT_METHOD, cleanup=None):
     """Makes a mask from the current file based on the mode.
     
     Input:th_mode, either Manual or a selected element.
     Input:th_manual, if th_mode is Manual then this contains the threshold value as integer.
     Input:cur_path, a string with the path of the current file selected.
-    Input:files, a list of all filepaths loaded.
+    Input:files, a list of all filepaths loaded or a UQ_catalog.Catalog.
+    Input:method, the threshold method if th_mode is an element, see UQ_threshold.py.
+    Input:cleanup, see plant_labels.
     Returns: mask, the mask of the plant.
-    Returns:con, the open-cv contours of the plant.
+    Returns:con, the PlantLabels of the plants, which area_contours and contour_statistics use instead of contours.
     """
-    plantdict = group_plants_files(files)
-    cur_path = Path(cur_path)
-    curplantname, _ = plantname_from_filename(cur_path)
-    working_files = plantdict[curplantname]
     if th_mode =="Manual":
-        mask, con = mask_from_threshold(cur_path, th_manual)
+        mask, con = mask_from_threshold(Path(cur_path), th_manual, cleanup)
         return mask, con
     else:
-        el_file = get_el_file_from_working_files(working_files, th_mode)
-        mask, con = mask_from_k(el_file)
+        el_file = mask_source(th_mode, cur_path, files)
+        mask, con = mask_from_k(el_file, method, cleanup)
         return mask, con
+
+def mask_source(th_mode, cur_path, files):
+    """Gets the file from which get_mask makes the mask.
+    
+    Input:th_mode, either Manual or a selected element.
+    Input:cur_path, a string with the path of the current file selected.
+    Input:files, a list of all filepaths loaded or a UQ_catalog.Catalog.
+    Returns: the current file for Manual, otherwise the file of the element th_mode of the same plant.
+    """
+    if th_mode == "Manual":
+        return cur_path
+    curplantname, _ = plantname_from_filename(Path(cur_path))
+    if hasattr(files, "plant_paths"):# a catalog, no need to group all files again
+        working_files = files.plant_paths(curplantname)
+    else:
+        working_files = group_plants_files(files)[curplantname]
+    return get_el_file_from_working_files(working_files, th_mode)
         
 def get_el_file_from_working_files(working_files, th_mode):
     """Gets the needed element from all plant files.
@@ -320,10 +421,8 @@ def get_el_file_from_working_files(working_files, th_mode):
     Returns: the file which contains the required element.
     """
     for f in working_files:
-        fp = Path(f)
-        temp = fp.with_suffix('')
-        name = temp.name
-        if name.endswith("{}".format(th_mode)):
+        _, el = plantname_from_filename(f)
+        if el == th_mode:
             return f
     return "Element not found"
 
@@ -365,6 +464,8 @@ def calc_shape(filename):
     Input: filename, a string containing the path to an image file.
     Returns: np.shape(img), the np.shape of the given image file.
     """
+    if UQ_container.is_member(filename):
+        return UQ_container.member_shape(filename)
     img, _, _ = load_image(filename)
     return np.shape(img)
 
@@ -376,49 +477,381 @@ def get_contour_precedence(contour, cols):#maybe change tolerance factor based o
     Input: cols, the columns of the shape of the image.
     Returns: the precedence of the contours.
     """
-    tolerance_factor = 50
     origin = cv2.boundingRect(contour)
-    return ((origin[1] // tolerance_factor) * tolerance_factor) * cols + origin[0]
+    return box_precedence(origin[0], origin[1], cols)
+
+def box_precedence(x, y, cols, tolerance_factor=50):
+    """The precedence of get_contour_precedence from the top left corner of a bounding box.
+    
+    Input: x, y, the column and row of the corner, numbers or numpy arrays.
+    Input: cols, the columns of the shape of the image.
+    Returns: the precedence, a number or numpy array.
+    """
+    return ((y // tolerance_factor) * tolerance_factor) * cols + x
+
+def label_sums(labels, array, n):
+    """Sums an integer array for every label, exactly.
+    
+    np.bincount only adds float64 weights, which stay exact integers as
+    long as a sum is below EXACT_FLOAT. The pixels are summed in blocks
+    that can not reach that and the blocks are added as int64.
+    Input: labels, a non-negative integer numpy array.
+    Input: array, an integer numpy array with the same size as labels.
+    Input: n, the number of labels.
+    Returns: sums, an int64 numpy array with the sum of every label.
+    """
+    labels = labels.ravel()
+    values = array.ravel()
+    sums = np.zeros(n, dtype=np.int64)
+    if len(values) == 0:
+        return sums
+    largest = max(int(values.max()), -int(values.min()), 1)
+    block = max(1, (EXACT_FLOAT - 1) // largest)
+    for start in range(0, len(values), block):
+        sums += np.bincount(labels[start:start + block], weights=values[start:start + block], minlength=n).astype(np.int64)
+    return sums
+
+class ContourLabels:
+    """All contours of an image drawn filled in one label image.
+    
+    Contours are drawn from large to small, so a contour inside another
+    contour (for example a hole found by RETR_TREE) is drawn on top of it
+    and every pixel gets the label of the innermost contour it belongs to.
+    The filled area of a contour is then its own label plus the labels of
+    the contours inside it. Contours next to each other can share border
+    pixels, these are kept per contour in extra.
+    
+    Attributes:
+    labels, an int32 numpy array with 0 for background and i+1 for contour i.
+    parents, a list with for each contour the index of the contour around it or -1.
+    inside, a boolean numpy array where inside[l, i] is True if label l is part of contour i.
+    extra, a list with for each contour the (rows, columns) of its pixels that have another label.
+    order, bounds, the positions of all labeled pixels sorted on label, label l is order[bounds[l]:bounds[l+1]].
+    """
+    def __init__(self, contours, shape):
+        """Draws the contours.
+        
+        Input: contours, open-cv contours.
+        Input: shape, the np.shape of the image.
+        """
+        n = len(contours)
+        self.labels = np.zeros(shape, dtype=np.int32)
+        self.parents = [-1] * n
+        order = sorted(range(n), key=lambda i:cv2.contourArea(contours[i]), reverse=True)
+        for i in order:
+            covered = np.unique(self.labels[filled_pixels(contours, i)]) - 1
+            self.parents[i] = common_parent(covered.tolist(), self.parents)
+            cv2.drawContours(self.labels, contours, i, i + 1, -1)
+        self.inside = np.zeros((n + 1, n), dtype=bool)
+        for j in range(n):
+            i = j
+            while i >= 0:
+                self.inside[j + 1, i] = True
+                i = self.parents[i]
+        self.extra = []
+        for i in range(n):
+            rows, cols = filled_pixels(contours, i)
+            other = ~self.inside[self.labels[rows, cols], i]
+            self.extra.append((rows[other], cols[other]))
+        self.order = None
+        self.bounds = None
+
+    def sums(self, array):
+        """Sums an image for every contour in one pass.
+        
+        Input: array, a numpy array with an image or counts.
+        Returns: totals, an int64 numpy array with the sum for every contour.
+        """
+        n = len(self.parents)
+        own = label_sums(self.labels, array, n + 1)
+        totals = own @ self.inside
+        for i, (rows, cols) in enumerate(self.extra):
+            totals[i] += int(np.sum(array[rows, cols], dtype=np.int64))
+        return totals
+    
+    def group_pixels(self):
+        """Sorts the positions of all labeled pixels on label, this is done once for all elements."""
+        if self.order is None:
+            flat = self.labels.ravel()
+            positions = np.flatnonzero(flat)
+            self.order = positions[np.argsort(flat[positions], kind="stable")]
+            self.bounds = np.searchsorted(flat[self.order], np.arange(len(self.parents) + 2))
+    
+    def statistics(self, array, percentiles=PERCENTILES):
+        """Calculates the statistics of an image for every contour.
+        
+        The pixels are grouped on label once, so the values of a contour are
+        the groups of its labels plus its extra pixels, without a mask.
+        Input: array, a numpy array with an image or counts.
+        Input: percentiles, a list of percentiles to calculate.
+        Returns: stats, a list with for every contour a dictionary with the area, sum, mean, min, max, std and percentiles (p<percentile>).
+        """
+        self.group_pixels()
+        values = array.ravel()[self.order]
+        stats = []
+        for i, (rows, cols) in enumerate(self.extra):
+            labels = np.nonzero(self.inside[:, i])[0]
+            parts = [values[self.bounds[l]:self.bounds[l + 1]] for l in labels]
+            parts.append(array[rows, cols])
+            v = np.concatenate(parts)
+            entry = {"area":len(v), "sum":int(np.sum(v, dtype=np.int64)), "mean":float(np.mean(v, dtype=np.float64)),
+                     "min":int(v.min()), "max":int(v.max()), "std":float(np.std(v, dtype=np.float64))}
+            for p, value in zip(percentiles, np.percentile(v, percentiles)):
+                entry["p{}".format(p)] = float(value)
+            stats.append(entry)
+        return stats
+
+class PlantLabels(ContourLabels):
+    """The plants of a mask as a label image, made by plant_labels.
+    
+    A plant is a connected component of the foreground (8-connected, as
+    the contours of open-cv) with its holes, the background components
+    (4-connected) that do not touch the border of the image, and anything
+    inside them. Every pixel belongs to at most one plant, so the plants
+    have no parents and share no pixels. The label image is used directly
+    for the mask, the order, the numbered image and the sums, no contours
+    are drawn. PlantLabels can be given instead of open-cv contours to
+    area_contours, contour_statistics and label_contours.
+    
+    Attributes:
+    labels, an int32 numpy array with 0 for background and i+1 for plant i, plants are in the order of get_contour_precedence.
+    boxes, an int64 numpy array with the (x, y, width, height) of every plant.
+    areas, an int64 numpy array with the number of pixels of every plant.
+    parents, inside, extra, order, bounds, see ContourLabels.
+    """
+    def __init__(self, labels, boxes, areas):
+        """Creates the plants from a label image.
+        
+        Input: labels, boxes, areas, see the attributes.
+        """
+        n = len(boxes)
+        self.labels = labels
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(n, 4)
+        self.areas = np.asarray(areas, dtype=np.int64).reshape(n)
+        self.parents = [-1] * n
+        self.inside = np.eye(n + 1, n, -1, dtype=bool)
+        empty = np.zeros(0, dtype=np.intp)
+        self.extra = [(empty, empty)] * n
+        self.order = None
+        self.bounds = None
+    
+    def __len__(self):
+        return len(self.boxes)
+    
+    @property
+    def shape(self):
+        """The np.shape of the image."""
+        return self.labels.shape
+    
+    def mask(self):
+        """Returns: binary_mask, a uint8 numpy array with 255 for the plants and 0 for the background."""
+        return np.where(self.labels > 0, 255, 0).astype(np.uint8)
+    
+    def sums(self, array):
+        """Sums an image for every plant in one pass.
+        
+        Input: array, a numpy array with an image or counts.
+        Returns: totals, an int64 numpy array with the sum for every plant.
+        """
+        return label_sums(self.labels, array, len(self) + 1)[1:]
+
+def fill_holes(foreground):
+    """Fills the holes of a binary image.
+    
+    Holes are the background components (4-connected) that do not touch the border.
+    Input: foreground, a boolean or 0/1 numpy array.
+    Returns: filled, a boolean numpy array with the foreground and its holes.
+    """
+    foreground = foreground.astype(bool)
+    n, background = cv2.connectedComponents((~foreground).astype(np.uint8), connectivity=4)
+    hole = np.ones(n, dtype=bool)
+    hole[0] = False
+    hole[background[[0, -1], :]] = False
+    hole[background[:, [0, -1]]] = False
+    return foreground | hole[background]
+
+def plant_labels(binary, cleanup=None, min_area=MIN_AREA):
+    """Finds the plants of a thresholded image with connected component labeling.
+    
+    The holes of the foreground are filled with the background components
+    that do not touch the border, after which every component of the
+    filled image is a plant with its holes. Plants with fewer pixels than
+    min_area of the image are noise and removed in one step on the areas of
+    all components. The plants are numbered as get_contour_precedence
+    orders contours.
+    Input: binary, a numpy array with an image that is 0 for the background.
+    Input: cleanup, None or a tuple with the radius in pixels of a morphological opening (removes specks and thin bridges) and closing (closes small gaps), done first.
+    Input: min_area, the fraction of the image that a plant must be larger than.
+    Returns: plants, a PlantLabels.
+    """
+    foreground = (binary > 0).astype(np.uint8)
+    for radius, operation in zip(cleanup or (), [cv2.MORPH_OPEN, cv2.MORPH_CLOSE]):
+        if radius > 0:
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+            foreground = cv2.morphologyEx(foreground, operation, kernel)
+    rows, cols = foreground.shape
+    filled = fill_holes(foreground).astype(np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(filled, connectivity=8)
+    stats = stats[1:].astype(np.int64)
+    keep = np.nonzero(stats[:, cv2.CC_STAT_AREA] > int(rows * cols * min_area))[0]
+    left, top = stats[keep, cv2.CC_STAT_LEFT], stats[keep, cv2.CC_STAT_TOP]
+    # plants with the same precedence in the order open-cv finds contours, last first pixel first:
+    first = np.array([np.argmax(labels[y, x:] == i + 1) for i, x, y in zip(keep, left, top)], dtype=np.int64) + left
+    keep = keep[np.lexsort((-(top * cols + first), box_precedence(left, top, cols)))]
+    index = np.zeros(len(stats) + 1, dtype=np.int32)
+    index[keep + 1] = np.arange(1, len(keep) + 1)
+    return PlantLabels(index[labels], stats[keep, :4], stats[keep, cv2.CC_STAT_AREA])
+
+def filled_pixels(contours, i):
+    """Gets the pixels of a filled contour without drawing on a full size image.
+    
+    Input: contours, open-cv contours.
+    Input: i, the index of the contour.
+    Returns: rows, cols, numpy arrays with the pixel coordinates.
+    """
+    x, y, w, h = cv2.boundingRect(contours[i])
+    canvas = np.zeros((h, w), dtype=np.uint8)
+    cv2.drawContours(canvas, contours, i, 1, -1, offset=(-x, -y))
+    rows, cols = np.nonzero(canvas)
+    return rows + y, cols + x
+
+def common_parent(covered, parents):
+    """Finds the innermost contour that contains all covered contours.
+    
+    Input: covered, a list of contour indices, -1 for background.
+    Input: parents, a list with for each contour the index of the contour around it or -1.
+    Returns: the index of the common contour or -1.
+    """
+    if not covered or -1 in covered:
+        return -1
+    chains = []
+    for i in covered:
+        chain = []
+        while i >= 0:
+            chain.append(i)
+            i = parents[i]
+        chains.append(chain)
+    for i in chains[0]:
+        if all(i in chain for chain in chains[1:]):
+            return i
+    return -1
 
 def area_contours(contours, filepaths):
     """
     Calculated the area of each contours and gives them a number to order them.
     
-    Input: contours, open-cv contours
-    Input:filepaths, a list containing strings of image files.
+    All contours are drawn once in a label image and every element file is
+    loaded once and summed for all contours in a single pass.
+    Input: contours, open-cv contours or PlantLabels
+    Input:filepaths, a list containing strings of image files or a UQ_stack.PlantStack.
     Returns: results, a list of tuples with (element, index, sum)
     Returns: img, the images with the drawn order on it.
     """
     results = []
-    shape = calc_shape(filepaths[0])
-    #sort contours on (x, y)
-    contours = sorted(contours, key=lambda x:get_contour_precedence(x, shape[1]))
+    contours, contour_labels, shape = label_contours(contours, filepaths)
+    
+    totals = []
+    for el, img in element_arrays(filepaths):
+        totals.append((el, contour_labels.sums(img)))
+    for i in range(0, len(contours)):
+        for el, sums in totals:
+            entry = (el, i, int(sums[i]))
+            results.append(entry)
+    return results, order_img(contours, shape)
+
+def contour_statistics(contours, filepaths, percentiles=PERCENTILES):
+    """
+    Calculates the statistics of every contour for every element.
+    
+    The contours are numbered as in area_contours. The pixels of the
+    contours are grouped once and every element file is loaded once.
+    Input: contours, open-cv contours or PlantLabels
+    Input: filepaths, a list containing strings of image files or a UQ_stack.PlantStack.
+    Input: percentiles, a list of percentiles to calculate.
+    Returns: results, a list of dictionaries with the element, contour and the STATISTICS.
+    Returns: img, the images with the drawn order on it.
+    """
+    results = []
+    contours, contour_labels, shape = label_contours(contours, filepaths)
     
+    totals = []
+    for el, img in element_arrays(filepaths):
+        totals.append((el, contour_labels.statistics(img, percentiles)))
     for i in range(0, len(contours)):
-        empty_mask = np.zeros(shape, dtype=np.uint8)
-        cv2.drawContours(empty_mask, contours, i, (255,255,255), -1)
-        for f in filepaths:
-            img, name, array = load_image(f)
-            #check if array is not None
-            if array is not None:
-                img = array
-            plantname, el = plantname_from_filename(name)
-            con_on_image = img * empty_mask
-            total = calc_area_element(con_on_image)
-            sum_real = int(total/255)
-            entry = (el, i, sum_real)
+        for el, stats in totals:
+            entry = {"element":el, "contour":i}
+            entry.update(stats[i])
             results.append(entry)
+    return results, order_img(contours, shape)
+
+def label_contours(contours, filepaths):
+    """
+    Sorts the contours and draws them in a label image.
+    
+    PlantLabels are already a sorted label image and are returned as they are.
+    Input: contours, open-cv contours or PlantLabels
+    Input: filepaths, a list containing strings of image files or a UQ_stack.PlantStack.
+    Returns: contours, the contours sorted on (x, y).
+    Returns: contour_labels, the ContourLabels of the sorted contours.
+    Returns: shape, the shape of the images.
+    """
+    if hasattr(filepaths, "image_shape"):# a stack, the shape is known
+        shape = filepaths.image_shape
+    elif hasattr(contours, "labels"):# plants, the label image has the shape
+        shape = contours.shape
+    else:
+        shape = calc_shape(filepaths[0])
+    if hasattr(contours, "labels"):
+        if tuple(shape) != contours.shape:
+            raise ValueError("the mask has shape {}, but the element maps have shape {}".format(contours.shape, tuple(shape)))
+        return contours, contours, shape
+    #sort contours on (x, y)
+    contours = sorted(contours, key=lambda x:get_contour_precedence(x, shape[1]))
+    return contours, ContourLabels(contours, shape), shape
 
+def element_arrays(filepaths):
+    """
+    Loads the element files one by one, or gets the layers of a stack.
+    
+    Input: filepaths, a list containing strings of image files or a UQ_stack.PlantStack.
+    Returns: a generator of (element, array) with the counts or the image if there are no counts.
+    """
+    if hasattr(filepaths, "layers"):# a stack, already loaded
+        return filepaths.layers()
+    return (load_element(f) for f in filepaths)
+
+def load_element(filename):
+    """
+    Loads one element file.
+    
+    Input: filename, a string with the path of an image file.
+    Returns: el, the element, and the counts or the image if there are no counts.
+    """
+    img, name, array = load_image(filename)
+    #check if array is not None
+    if array is not None:
+        img = array
+    plantname, el = plantname_from_filename(name)
+    return el, img
 
-    #only if new picture is needed for frontend
-    img = np.zeros(shape, dtype=np.uint8)
-    cv2.drawContours(img, contours, -1, (255,255,255), -1)
+def order_img(contours, shape):
+    """
+    Draws the filled contours with their number.
+    
+    Input: contours, the sorted open-cv contours or PlantLabels.
+    Input: shape, the shape of the image.
+    Returns: img, the images with the drawn order on it.
+    """
+    if hasattr(contours, "labels"):# plants, the mask is the label image
+        img = contours.mask()
+        origins = [tuple(int(v) for v in box[:2]) for box in contours.boxes]
+    else:
+        img = np.zeros(shape, dtype=np.uint8)
+        cv2.drawContours(img, contours, -1, (255,255,255), -1)
+        origins = [cv2.boundingRect(c)[:2] for c in contours]
     for i in range(0, len(contours)):
-        img = cv2.putText(img, str(i),cv2.boundingRect(contours[i])[:2], cv2.FONT_HERSHEY_COMPLEX, 3, [125], 5)#cv2.boundingRect(contours[i])[:2]
-    #cv2.namedWindow("drawn contours", cv2.WINDOW_NORMAL)
-    #cv2.imshow("drawn contours", img)
-    #cv2.waitKey()
-    return results, img
+        img = cv2.putText(img, str(i), origins[i], cv2.FONT_HERSHEY_COMPLEX, 3, [125], 5)
+    return img
 
 #main
 if __name__ == "__main__":
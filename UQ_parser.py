@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Fast parser for the comma separated count maps of the MicroXRF.
+
+The instrument exports every element map as a .txt file (one header line)
+or a .csv file (no header) with one image row per line. This parser memory
+maps the file, splits it into row-aligned byte chunks and parses these
+chunks in parallel with vectorized numpy operations straight into a
+preallocated uint16 array. Only one chunk per thread is held as temporary
+data, so the file is never copied as a whole.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import io
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from sys import argv
+import numpy as np
+
+#settings
+CHUNK_BYTES = 2 * 1024**2
+MAX_DIGITS = 9
+POWERS_OF_TEN = 10 ** np.arange(MAX_DIGITS, dtype=np.int32)
+NEWLINE, COMMA = 10, 44
+
+#classes
+class CountFile:
+    """A comma separated count file split into row-aligned chunks.
+
+    Usage:
+        with CountFile("plant - K.txt", skiprows=1) as cf:
+            array = cf.read()
+    The shape is known before reading, so the array can also be read into
+    a preallocated output such as a memory mapped .npy file.
+    """
+    def __init__(self, filename, skiprows=0, chunk_bytes=CHUNK_BYTES, workers=None):
+        """Opens the file and determines the chunks, rows and columns.
+
+        Input: filename, a string or Path of the count file.
+        Input: skiprows, the number of header lines to skip.
+        Input: chunk_bytes, the approximate size of one chunk in bytes.
+        Input: workers, the number of threads, by default the number of cpus.
+        """
+        self.filename = Path(filename)
+        self.workers = workers or os.cpu_count() or 1
+        self._file = open(self.filename, "rb")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.close()
+            raise ValueError("{} is empty".format(self.filename.name))
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+        start = 0
+        for _ in range(skiprows):
+            start = self._mmap.find(b"\n", start) + 1
+            if start == 0:
+                start = len(self._mmap)
+                break
+        self.chunks = split_chunks(self._mmap, start, chunk_bytes)
+        with ThreadPoolExecutor(self.workers) as pool:
+            self.chunk_rows = list(pool.map(lambda c: count_rows(self._data[c[0]:c[1]]), self.chunks))
+        nrows = sum(self.chunk_rows)
+        if nrows == 0:
+            self.close()
+            raise ValueError("{} contains no data".format(self.filename.name))
+        self.shape = (nrows, count_columns(self._mmap, start))
+
+    def read(self, out=None):
+        """Parses all chunks in parallel.
+
+        Input: out, an optional preallocated uint16 array with the shape of the file.
+        Returns: out, a uint16 numpy array with the counts.
+        """
+        if out is None:
+            out = np.empty(self.shape, dtype=np.uint16)
+        elif out.shape != self.shape:
+            raise ValueError("output shape {} does not match {}".format(out.shape, self.shape))
+        offsets = np.concatenate([[0], np.cumsum(self.chunk_rows)])
+
+        def work(i):
+            first, last = self.chunks[i]
+            parse_chunk(self._data[first:last], out[offsets[i]:offsets[i + 1]], offsets[i])
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            list(pool.map(work, range(len(self.chunks))))
+        return out
+
+    def close(self):
+        """Releases the memory map and the file."""
+        self._data = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass # views kept alive by a traceback, the map is freed with them
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#functions
+def split_chunks(buf, start, chunk_bytes):
+    """Splits a buffer into chunks that end directly after a newline.
+
+    Input: buf, a mmap or bytes object.
+    Input: start, the offset of the first data byte.
+    Input: chunk_bytes, the approximate size of one chunk.
+    Returns: chunks, a list of tuples (first, last) of byte offsets.
+    """
+    chunks = []
+    end = len(buf)
+    while start < end:
+        stop = buf.find(b"\n", min(start + chunk_bytes, end) - 1) + 1
+        if stop == 0:
+            stop = end
+        chunks.append((start, stop))
+        start = stop
+    return chunks
+
+def content_mask(data):
+    """Marks the bytes that are not whitespace.
+
+    Input: data, a uint8 numpy array with text.
+    Returns: a boolean numpy array, True for every byte that is not a space, tab, \\r or \\n.
+    """
+    return data > 32
+
+def count_rows(data):
+    """Counts the lines of a chunk that are not blank.
+
+    Input: data, a uint8 numpy array with the text of a chunk.
+    Returns: the number of data rows in the chunk.
+    """
+    ends = np.flatnonzero(data == NEWLINE)
+    if len(ends) == 0 or ends[-1] != len(data) - 1:
+        ends = np.append(ends, len(data) - 1)
+    filled = np.cumsum(content_mask(data))[ends]
+    return int(np.count_nonzero(np.diff(filled, prepend=0)))
+
+def count_columns(buf, start):
+    """Counts the values in the first data row.
+
+    Input: buf, a mmap or bytes object with the text.
+    Input: start, the offset of the first data byte.
+    Returns: the number of columns.
+    """
+    while start < len(buf):
+        stop = buf.find(b"\n", start)
+        if stop == -1:
+            stop = len(buf)
+        line = buf[start:stop]
+        if line.strip():
+            return line.count(b",") + 1
+        start = stop + 1
+    return 0
+
+def parse_chunk(data, out, first_row=0):
+    """Parses one row-aligned chunk into a slice of the output array.
+
+    Integer values are parsed with vectorized byte arithmetic. Chunks
+    that contain other characters (for example decimals) are parsed as
+    floats and truncated, just like np.loadtxt did for integer types.
+    Input: data, a uint8 numpy array with the text of the chunk.
+    Input: out, the uint16 numpy array (rows x columns) to fill.
+    Input: first_row, the row number of the first row, used in error messages.
+    """
+    newline = data == NEWLINE
+    if np.count_nonzero(data <= 32) != np.count_nonzero(newline):
+        keep = content_mask(data) | newline
+        data = data[keep]
+        check_spaces(data, np.cumsum(keep)[~keep], first_row)
+        newline = data == NEWLINE
+    if len(data) == 0 or data[-1] != NEWLINE:
+        data = np.append(data, np.uint8(NEWLINE))
+        newline = np.append(newline, True)
+    blank = newline.copy()
+    blank[1:] &= newline[:-1]
+    if blank.any():
+        data = data[~blank]
+        newline = data == NEWLINE
+    if len(data) == 0: # only blank lines, for example the end of a file
+        return
+    separator = newline | (data == COMMA)
+    digit = (data >= 48) & (data <= 57)
+    if not np.all(digit | separator):
+        values = parse_chunk_float(data, out.shape[1], first_row)
+    else:
+        ends = np.flatnonzero(separator).astype(np.int32)
+        lengths = np.diff(ends, prepend=np.int32(-1)) - 1
+        check_row_widths(newline[ends], out.shape[1], first_row)
+        if np.any(lengths == 0):
+            raise ValueError("empty value in row {}".format(first_row + row_of_field(newline[ends], np.argmin(lengths))))
+        if np.any(lengths > MAX_DIGITS):
+            raise ValueError("value out of range in row {}".format(first_row + row_of_field(newline[ends], np.argmax(lengths))))
+        # add the digits of all values position by position, starting at the last digit
+        values = np.zeros(len(ends), dtype=np.int32)
+        for k in range(int(lengths.max())):
+            digits = data[ends - 1 - k].astype(np.int32) - 48
+            values += np.where(lengths > k, digits, 0) * POWERS_OF_TEN[k]
+    if values.size and (values.min() < 0 or values.max() > np.iinfo(np.uint16).max):
+        raise ValueError("value out of uint16 range in rows {}-{}".format(first_row, first_row + len(out) - 1))
+    out[...] = values.reshape(out.shape)
+
+def check_spaces(data, positions, first_row):
+    """Checks that removed whitespace only stood next to a comma or newline.
+
+    Whitespace between two characters of a value, like "1 2", would join
+    them into another value, so it is an error.
+    Input: data, a uint8 numpy array with the text of the chunk without whitespace.
+    Input: positions, for every removed byte the index in data of the first byte after it.
+    Input: first_row, the row number of the first row, used in error messages.
+    """
+    value = (data != NEWLINE) & (data != COMMA)
+    inside = (positions > 0) & (positions < len(data))
+    between = positions[inside]
+    joined = value[between - 1] & value[between]
+    if joined.any():
+        position = between[np.argmax(joined)]
+        newline = data[:position] == NEWLINE
+        row = np.count_nonzero(newline[1:] & ~newline[:-1]) # the ends of the rows before it, blank lines are no rows
+        raise ValueError("whitespace inside a value in row {}".format(first_row + int(row)))
+
+def parse_chunk_float(data, ncols, first_row):
+    """Parses a chunk with non integer values.
+
+    Input: data, a uint8 numpy array with the text of the chunk without blank lines.
+    Input: ncols, the expected number of columns.
+    Input: first_row, the row number of the first row, used in error messages.
+    Returns: values, an int64 numpy array with the truncated values.
+    """
+    separator = (data == NEWLINE) | (data == COMMA)
+    check_row_widths((data == NEWLINE)[separator], ncols, first_row)
+    values = np.loadtxt(io.BytesIO(data.tobytes()), delimiter=",", dtype=np.float64, ndmin=2)
+    return np.trunc(values).astype(np.int64)
+
+def check_row_widths(row_ends, ncols, first_row):
+    """Checks that every row of a chunk has the same number of values.
+
+    Input: row_ends, a boolean numpy array with per value whether it is the last of its row.
+    Input: ncols, the expected number of columns.
+    Input: first_row, the row number of the first row, used in error messages.
+    """
+    widths = np.diff(np.flatnonzero(row_ends), prepend=-1)
+    wrong = np.flatnonzero(widths != ncols)
+    if len(wrong):
+        raise ValueError("row {} has {} values, expected {}".format(first_row + wrong[0], widths[wrong[0]], ncols))
+
+def row_of_field(row_ends, field):
+    """Gets the row number (within the chunk) of a value.
+
+    Input: row_ends, a boolean numpy array with per value whether it is the last of its row.
+    Input: field, the index of the value.
+    Returns: the row number as int.
+    """
+    return int(np.count_nonzero(row_ends[:field]))
+
+def parse_count_file(filename, skiprows=0, workers=None, out=None):
+    """Parses a comma separated count file into a uint16 array.
+
+    Input: filename, a string or Path of the count file.
+    Input: skiprows, the number of header lines (1 for .txt, 0 for .csv).
+    Input: workers, the number of threads, by default the number of cpus.
+    Input: out, an optional preallocated output array.
+    Returns: array, a uint16 numpy array with the counts.
+    """
+    with CountFile(filename, skiprows, workers=workers) as cf:
+        return cf.read(out)
+
+def count_file_skiprows(filename):
+    """Gets the number of header lines for a count file based on the suffix.
+
+    Input: filename, a string or Path of a .txt or .csv file.
+    Returns: 1 for .txt files which have a header, 0 otherwise.
+    """
+    return 1 if Path(filename).suffix == ".txt" else 0
+
+#main
+if __name__ == "__main__":
+    filename = argv[1]
+    array = parse_count_file(filename, count_file_skiprows(filename))
+    print(filename, array.shape, array.min(), array.max())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Fast mask previews for every manual threshold of an image.
+
+For every pixel the preview stores the lowest threshold at which the pixel
+is no longer part of a large enough plant. It is built once per image by
+going over the gray values from low to high, so afterwards the mask of
+any threshold is a single comparison and filling the holes. A plant is
+large enough if it has more pixels, with its holes, than 0.01 percent of
+the image, as in UQ_functions.plant_labels, so the preview is the same as
+the real mask. The plants of a threshold are labeled with contours().
+
+Usage:
+    preview = ThresholdPreview(img)
+    mask = preview.mask(40)
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+from sys import argv
+import cv2
+import numpy as np
+import UQ_functions as UQF
+
+#settings
+MIN_AREA = UQF.MIN_AREA # fraction of the image
+
+#classes
+class ThresholdPreview:
+    """The masks of all thresholds of an 8-bit image.
+
+    Attributes:
+        img: the 8-bit image.
+        levels: a uint16 array, a pixel is in the mask of threshold t if levels > t.
+    """
+    def __init__(self, img, progress=None):
+        """Builds the preview.
+
+        Input: img, a uint8 numpy array.
+        Input: progress, an optional function called with the fraction of the gray values done.
+        """
+        self.img = img
+        self.min_area = int(img.size * MIN_AREA)
+        self.levels = build_levels(img, self.min_area, progress)
+
+    def mask(self, th):
+        """Gets the preview mask of a threshold.
+
+        Input: th, an integer threshold between 0 and 255.
+        Returns: mask, a uint8 array with 255 for the filled plants.
+        """
+        return np.where(UQF.fill_holes(self.levels > th), 255, 0).astype(np.uint8)
+
+    def contours(self, th):
+        """Labels the plants of a threshold, as UQ_functions.mask_from_threshold.
+
+        Input: th, an integer threshold between 0 and 255.
+        Returns: binary_mask, con, like UQ_functions.mask_from_threshold.
+        """
+        _, th1 = cv2.threshold(self.img, th, 255, cv2.THRESH_BINARY)
+        con = UQF.plant_labels(th1, min_area=MIN_AREA)
+        return con.mask(), con
+
+#functions
+def build_levels(img, min_area, progress=None):
+    """Finds for every pixel the lowest threshold at which it is not in a large component.
+
+    The foreground of threshold t are the pixels larger than t, so it only
+    changes at the gray values of the image. Only pixels that were in a large
+    component at the previous value can be in one at the next, so every value
+    is labeled within the bounding box of those pixels. A component is large
+    if it has more than min_area pixels after its holes are filled.
+    Input: img, a uint8 numpy array.
+    Input: min_area, the minimum number of pixels of a component.
+    Input: progress, an optional function called with the fraction of the gray values done.
+    Returns: levels, a uint16 array, a pixel is in a large component for every threshold t < levels.
+    """
+    values = np.nonzero(np.bincount(img.ravel(), minlength=256))[0]
+    levels = np.full(img.shape, values[0] if img.size > min_area else 0, dtype=np.uint16)
+    top, left = 0, 0
+    active = np.ones(img.shape, dtype=bool)
+    for i, value in enumerate(values[:-1]):
+        # the pixels that can still be in a large component are inside the previous box
+        rows, cols = np.nonzero(active.any(axis=1))[0], np.nonzero(active.any(axis=0))[0]
+        if len(rows) == 0:
+            break
+        top, left = top + rows[0], left + cols[0]
+        box = slice(top, top + rows[-1] - rows[0] + 1), slice(left, left + cols[-1] - cols[0] + 1)
+        foreground = (img[box] > value) & (levels[box] == value)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(UQF.fill_holes(foreground).astype(np.uint8), connectivity=8)
+        large = stats[:, cv2.CC_STAT_AREA] > min_area
+        large[0] = False
+        active = large[labels] & foreground
+        levels[box][active] = values[i + 1]
+        if progress is not None:
+            progress((i + 1) / len(values))
+    return levels
+
+def preview_from_file(filename):
+    """Loads an image and builds its preview.
+
+    Input: filename, a string with the path of the image file.
+    Returns: preview, a ThresholdPreview.
+    """
+    img, _, _ = UQF.load_image(filename)
+    return ThresholdPreview(img)
+
+#main
+if __name__ == "__main__":
+    img, _, _ = UQF.load_image(argv[1])
+    preview = ThresholdPreview(img)
+    for th in range(0, 256, 32):
+        print(th, np.count_nonzero(preview.mask(th)), np.count_nonzero(preview.contours(th)[0]))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Element ratio maps and co-localization of element pairs per contour.
+
+For a plant and a list of element pairs, for example Zn/K and Ca/K,
+plant_ratios loads all elements once into a UQ_stack.PlantStack and
+calculates in one pass over the stack:
+- a ratio map of every pair, numerator / denominator on every pixel of
+  the contours (NaN outside the contours and where the denominator is 0),
+- for every contour and pair the RATIO_STATISTICS:
+  ratio, the total counts of the numerator / the total counts of the denominator,
+  pearson, the Pearson correlation of the counts of the two elements,
+  m1, the part of the numerator counts on pixels where the denominator is above 0,
+  m2, the part of the denominator counts on pixels where the numerator is above 0,
+  overlap, the pixels where both are above 0 / the pixels where one of them is above 0.
+
+The contours are numbered as in UQ_functions.area_contours.
+
+Usage: UQ_ratio.py <plant files> --pairs Zn/K,Ca/K [--element K] [--manual 40]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import csv
+import sys
+import numpy as np
+import UQ_functions as UQF
+import UQ_stack
+import UQ_threshold
+
+#settings
+RATIO_STATISTICS = ["ratio", "pearson", "m1", "m2", "overlap"]
+RATIO_COLUMNS = [(name, "<f8") for name in RATIO_STATISTICS] # the value columns of a UQ_results.ResultTable with key pair
+ELEMENT_MOMENTS = 3 # sum, sum of squares and pixels above 0 of every element
+PAIR_MOMENTS = 4 # sum of products, pixels where both are above 0 and the sums of each where the other is above 0
+
+#functions
+def parse_pairs(text):
+    """Reads element pairs from a text like "Zn/K, Ca/K".
+
+    Input: text, a string with comma separated numerator/denominator pairs.
+    Returns: pairs, a list of (numerator, denominator) tuples without duplicates.
+    """
+    pairs = []
+    for part in text.split(","):
+        part = part.strip()
+        if part == "":
+            continue
+        elements = [el.strip() for el in part.split("/")]
+        if len(elements) != 2 or "" in elements:
+            raise ValueError("{} is not a pair of elements like Zn/K".format(part))
+        if tuple(elements) not in pairs:
+            pairs.append(tuple(elements))
+    return pairs
+
+def pair_name(pair):
+    """Returns: the name of a pair, for example "Zn/K"."""
+    return "{}/{}".format(*pair)
+
+def pair_layers(stack, pairs):
+    """Finds the layers of the elements of the pairs in a stack.
+
+    Input: stack, a UQ_stack.PlantStack.
+    Input: pairs, a list of (numerator, denominator) tuples.
+    Returns: used, the sorted layers used by the pairs, and num, den, numpy arrays with the index in used of the numerator and denominator of every pair.
+    """
+    missing = sorted({el for pair in pairs for el in pair} - set(stack.elements))
+    if missing:
+        raise ValueError("element {} not in the stack of {}".format(", ".join(missing), ", ".join(stack.elements)))
+    used = sorted({stack.elements.index(el) for pair in pairs for el in pair})
+    num = np.array([used.index(stack.elements.index(a)) for a, _ in pairs], dtype=np.intp)
+    den = np.array([used.index(stack.elements.index(b)) for _, b in pairs], dtype=np.intp)
+    return used, num, den
+
+def moments(values, num, den):
+    """Calculates the values that are summed per contour for all elements and pairs at once.
+
+    Input: values, a float64 numpy array with shape (elements, pixels).
+    Input: num, den, the index in values of the numerator and denominator of every pair.
+    Returns: a float64 numpy array with ELEMENT_MOMENTS rows per element followed by PAIR_MOMENTS rows per pair.
+    """
+    positive = values > 0
+    a, b = values[num], values[den]
+    pos_a, pos_b = positive[num], positive[den]
+    return np.concatenate([values, values * values, positive, a * b, pos_a & pos_b, a * pos_b, b * pos_a])
+
+def contour_moments(contour_labels, layers, num, den):
+    """Sums the moments of every contour, in blocks of pixels.
+
+    Every pixel is read once for all pairs: the moments of a block are
+    summed per label with a single bincount, the label sums are added per
+    contour with the inside matrix of UQ_functions.ContourLabels and the
+    pixels a contour shares with another contour are added separately.
+    Input: contour_labels, a UQ_functions.ContourLabels.
+    Input: layers, a numpy array with shape (elements, rows, columns).
+    Input: num, den, see moments.
+    Returns: area, a float64 numpy array with the pixels of every contour, and totals, a float64 numpy array with the moments (rows) of every contour (columns).
+    """
+    n = len(contour_labels.parents) + 1
+    q = ELEMENT_MOMENTS * len(layers) + PAIR_MOMENTS * len(num)
+    labels = contour_labels.labels.ravel()
+    flat = layers.reshape(len(layers), -1)
+    offsets = (np.arange(q) * n)[:, None]
+    own = np.zeros(q * n)
+    block = max(1, UQF.SCALE_BLOCK // q)
+    for start in range(0, len(labels), block):
+        lab = labels[start:start + block]
+        weights = moments(flat[:, start:start + block].astype(np.float64), num, den)
+        own += np.bincount((offsets + lab).ravel(), weights=weights.ravel(), minlength=q * n)
+    inside = contour_labels.inside.astype(np.float64)
+    totals = own.reshape(q, n) @ inside
+    area = np.bincount(labels, minlength=n) @ inside
+    for i, (rows, cols) in enumerate(contour_labels.extra):
+        if len(rows):
+            totals[:, i] += moments(layers[:, rows, cols].astype(np.float64), num, den).sum(axis=1)
+            area[i] += len(rows)
+    return area, totals
+
+def divide(a, b):
+    """Divides two numpy arrays, NaN where b is 0."""
+    return np.divide(a, b, out=np.full(np.shape(a), np.nan), where=b != 0)
+
+def colocalization(area, totals, nelements, num, den):
+    """Calculates the RATIO_STATISTICS from the summed moments.
+
+    Input: area, totals, see contour_moments.
+    Input: nelements, the number of elements in the moments.
+    Input: num, den, see moments.
+    Returns: stats, a dictionary with key:statistic, value:float64 numpy array with shape (pairs, contours).
+    """
+    e = nelements
+    sums, squares, positive = totals[:e], totals[e:2 * e], totals[2 * e:3 * e]
+    p = len(num)
+    products, both, a_on_b, b_on_a = (totals[3 * e + k * p:3 * e + (k + 1) * p] for k in range(PAIR_MOMENTS))
+    sa, sb = sums[num], sums[den]
+    covariance = area * products - sa * sb
+    variance = (area * squares[num] - sa * sa) * (area * squares[den] - sb * sb)
+    either = positive[num] + positive[den] - both
+    return {"ratio":divide(sa, sb), "pearson":divide(covariance, np.sqrt(np.maximum(variance, 0))),
+            "m1":divide(a_on_b, sa), "m2":divide(b_on_a, sb), "overlap":divide(both, either)}
+
+def ratio_maps(layers, mask, num, den):
+    """Divides the numerator by the denominator of all pairs at once.
+
+    Input: layers, a numpy array with shape (elements, rows, columns).
+    Input: mask, a boolean numpy array, the pixels that get a ratio.
+    Input: num, den, see moments.
+    Returns: maps, a float32 numpy array with shape (pairs, rows, columns), NaN outside the mask and where the denominator is 0.
+    """
+    denominator = layers[den]
+    maps = np.full(denominator.shape, np.nan, dtype=np.float32)
+    np.divide(layers[num], denominator, out=maps, where=(denominator > 0) & mask, casting="unsafe")
+    return maps
+
+def plant_ratios(contours, filepaths, pairs):
+    """Calculates the ratio maps and co-localization of element pairs for one plant.
+
+    The elements are loaded once for all pairs.
+    Input: contours, open-cv contours or UQ_functions.PlantLabels.
+    Input: filepaths, a list containing strings of image files or a UQ_stack.PlantStack.
+    Input: pairs, a list of (numerator, denominator) tuples, see parse_pairs.
+    Returns: results, a list of dictionaries with the pair, contour and the RATIO_STATISTICS.
+    Returns: maps, a dictionary with key:pair name, value:float32 ratio map, see ratio_maps.
+    """
+    stack = filepaths if hasattr(filepaths, "layers") else UQ_stack.PlantStack.load(filepaths)
+    used, num, den = pair_layers(stack, pairs)
+    contours, contour_labels, _ = UQF.label_contours(contours, stack)
+    layers = stack.array[used]
+    area, totals = contour_moments(contour_labels, layers, num, den)
+    stats = colocalization(area, totals, len(used), num, den)
+    results = []
+    for i in range(len(contours)):
+        for k, pair in enumerate(pairs):
+            entry = {"pair":pair_name(pair), "contour":i}
+            entry.update((name, float(stats[name][k, i])) for name in RATIO_STATISTICS)
+            results.append(entry)
+    maps = ratio_maps(layers, contour_labels.labels > 0, num, den)
+    return results, {pair_name(pair):maps[k] for k, pair in enumerate(pairs)}
+
+def ratio_image(ratio, percentile=99):
+    """Scales a ratio map to an 8-bit image to show it.
+
+    Input: ratio, a float numpy array with NaN for pixels without a ratio.
+    Input: percentile, the percentile of the ratios that becomes 255, higher ratios are clipped.
+    Returns: img, a uint8 numpy array, 0 for pixels without a ratio.
+    """
+    finite = ratio[np.isfinite(ratio)]
+    top = float(np.percentile(finite, percentile)) if len(finite) else 0.0
+    if top <= 0:
+        return np.zeros(ratio.shape, dtype=np.uint8)
+    img = np.nan_to_num(ratio / top * 255, nan=0.0)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Calculate the element ratios and co-localization of every contour of a plant.")
+    parser.add_argument("files", nargs="+", help="the element files of one plant")
+    parser.add_argument("-p", "--pairs", required=True, help="comma separated element pairs, for example Zn/K,Ca/K")
+    parser.add_argument("-e", "--element", default="K", help="element used to create the mask (default: K)")
+    parser.add_argument("-m", "--manual", type=int, default=None, help="manual threshold (0-255) instead of an automatic threshold")
+    parser.add_argument("--method", default=UQ_threshold.DEFAULT_METHOD, choices=list(UQ_threshold.METHODS), help="automatic threshold method (default: first_valley)")
+    return parser.parse_args(args)
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    el_file = UQF.get_el_file_from_working_files(args.files, args.element)
+    if args.manual is None:
+        _, con = UQF.get_mask(args.element, None, el_file, args.files, args.method)
+    else:
+        _, con = UQF.get_mask("Manual", args.manual, el_file, args.files)
+    results, _ = plant_ratios(con, args.files, parse_pairs(args.pairs))
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["contour", "pair"] + RATIO_STATISTICS)
+    for entry in results:
+        writer.writerow([entry["contour"], entry["pair"]] + ["{:.6g}".format(entry[name]) for name in RATIO_STATISTICS])
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Results of many plants in numpy columns, exported in one write.
+
+A ResultTable keeps the results of every quantified plant as numpy
+columns: the contour, the element (or element pair for ratios) and a
+column per statistic. Counts are int64 and the other statistics float64,
+so nothing is rounded through text. save writes the rows of all plants,
+or of some plants, in long format (one row per plant, contour and
+element) in a single write, as:
+- a csv file, with the same columns as UQ_batch.py writes, floats are
+  written with all their digits,
+- a results file (.uqr), a compact binary columnar format that is read
+  back with ResultTable.load without parsing. The layout is:
+  - 8 bytes MAGIC, then the offset and length of the header as two little endian uint64.
+  - the columns, each as raw little endian values starting at a multiple of 8 bytes.
+  - the header, JSON with the key column, the names of the plants and keys
+    and for every column its name, dtype and (offset, length). The plant and
+    key columns hold the index of the name.
+
+Usage:
+    table = ResultTable(COUNT_COLUMNS)
+    table.add_rows(rows)
+    table.save("results.uqr")
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import csv
+import io
+import json
+import struct
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import UQ_functions as UQF
+
+#settings
+SUFFIX = ".uqr"
+MAGIC = b"UQRES001"
+PREFIX = struct.Struct("<8sQQ") # magic, header offset, header length
+ALIGN = 8
+INTEGER_STATISTICS = {"area", "sum", "min", "max"}
+COUNT_COLUMNS = [("count", "<i8")]
+STATISTIC_COLUMNS = COUNT_COLUMNS + [(name, "<i8" if name in INTEGER_STATISTICS else "<f8") for name in UQF.STATISTICS if name != "sum"]
+CODE_DTYPE = "<i4"
+
+#classes
+class ResultTable:
+    """The results of the quantified plants, in the order they were added.
+
+    Attributes:
+    values, a list with the (name, dtype) of the value columns.
+    key, the name of the column after the contour, "element" or "pair".
+    plants, an OrderedDict with key:plantname, value:dictionary with the contour, key and value columns of the plant.
+    keys, a list with the names of the keys, the key column of a plant holds indices in this list.
+    """
+    def __init__(self, values=COUNT_COLUMNS, key="element"):
+        """Creates an empty table.
+
+        Input: values, a list with the (name, numpy dtype string) of the value columns.
+        Input: key, the name of the column after the contour.
+        """
+        self.values = [(name, np.dtype(dtype).newbyteorder("<").str) for name, dtype in values]
+        self.key = key
+        self.plants = OrderedDict()
+        self.keys = []
+        self.key_codes = {}
+
+    @property
+    def header(self):
+        """The column names of the exported rows."""
+        return ["plant", "contour", self.key] + [name for name, _ in self.values]
+
+    def __len__(self):
+        """Returns: the number of rows of all plants."""
+        return sum(len(part["contour"]) for part in self.plants.values())
+
+    def __contains__(self, plantname):
+        return plantname in self.plants
+
+    def add(self, plantname, contours, keys, values):
+        """Adds the results of a plant, earlier results of the plant are replaced.
+
+        Input: plantname, the name of the plant.
+        Input: contours, a sequence with the contour of every row.
+        Input: keys, a sequence with the element (or pair) of every row.
+        Input: values, a dictionary with key:column name, value:sequence with the value of every row.
+        """
+        part = {"contour":np.asarray(contours, dtype=CODE_DTYPE).reshape(-1)}
+        part[self.key] = np.array([self.key_code(k) for k in keys], dtype=CODE_DTYPE)
+        for name, dtype in self.values:
+            part[name] = np.asarray(values[name], dtype=dtype).reshape(-1)
+            if len(part[name]) != len(part["contour"]):
+                raise ValueError("column {} has {} rows instead of {}".format(name, len(part[name]), len(part["contour"])))
+        self.plants.pop(plantname, None)
+        self.plants[plantname] = part
+
+    def key_code(self, key):
+        """Gets the index of an element or pair in keys, it is added the first time.
+
+        Input: key, a string.
+        Returns: the index of key.
+        """
+        code = self.key_codes.get(key)
+        if code is None:
+            code = self.key_codes[key] = len(self.keys)
+            self.keys.append(key)
+        return code
+
+    def add_rows(self, rows):
+        """Adds rows like UQ_batch.quantify_plant returns them, grouped per plant.
+
+        Input: rows, a list of tuples with the plant, contour, key and the value columns.
+        """
+        grouped = OrderedDict()
+        for row in rows:
+            grouped.setdefault(row[0], []).append(row[1:])
+        for plantname, plant_rows in grouped.items():
+            columns = list(zip(*plant_rows))
+            self.add(plantname, columns[0], columns[1], {name:columns[i + 2] for i, (name, _) in enumerate(self.values)})
+
+    def add_statistics(self, plantname, stats, key=None):
+        """Adds the dictionaries of UQ_functions.contour_statistics or UQ_ratio.plant_ratios.
+
+        The sum of contour_statistics is the count column.
+        Input: plantname, the name of the plant.
+        Input: stats, a list of dictionaries with the key, contour and statistics.
+        Input: key, the dictionary key with the key of a row, by default the key of the table.
+        """
+        key = key or self.key
+        values = {name:[entry["sum" if name == "count" else name] for entry in stats] for name, _ in self.values}
+        self.add(plantname, [entry["contour"] for entry in stats], [entry[key] for entry in stats], values)
+
+    def remove(self, plantname):
+        """Removes the results of a plant, if it has results."""
+        self.plants.pop(plantname, None)
+
+    def clear(self):
+        """Removes the results of all plants."""
+        self.plants.clear()
+        self.keys = []
+        self.key_codes = {}
+
+    def columns(self, plants=None):
+        """Joins the columns of plants.
+
+        Input: plants, a list of plantnames, by default all plants in the order they were added.
+        Returns: names, the plantnames, and columns, an OrderedDict with key:column name, value:numpy array, plant holds indices in names.
+        """
+        names = list(self.plants) if plants is None else [p for p in plants if p in self.plants]
+        parts = [self.plants[p] for p in names]
+        columns = OrderedDict()
+        columns["plant"] = np.repeat(np.arange(len(names), dtype=CODE_DTYPE), [len(part["contour"]) for part in parts])
+        for name, dtype in [("contour", CODE_DTYPE), (self.key, CODE_DTYPE)] + self.values:
+            columns[name] = np.concatenate([part[name] for part in parts]) if parts else np.zeros(0, dtype=dtype)
+        return names, columns
+
+    def save(self, filename, plants=None):
+        """Writes the rows of plants to a csv file or, for a .uqr filename, a results file.
+
+        Input: filename, a string or Path.
+        Input: plants, a list of plantnames, by default all plants.
+        Returns: the number of written rows.
+        """
+        names, columns = self.columns(plants)
+        if Path(filename).suffix == SUFFIX:
+            with open(str(filename), "wb") as stream:
+                stream.write(encode_columns(self.key, names, self.keys, columns))
+        else:
+            with open(str(filename), "w", newline="") as stream:
+                stream.write(format_csv(self.header, names, self.keys, columns))
+        return len(columns["plant"])
+
+    @classmethod
+    def load(cls, filename):
+        """Reads a table that was written with save.
+
+        Input: filename, a string or Path of a .uqr or csv file.
+        Returns: table, a ResultTable.
+        """
+        if Path(filename).suffix == SUFFIX:
+            key, names, keys, columns = decode_columns(Path(filename).read_bytes())
+        else:
+            key, names, keys, columns = parse_csv(filename)
+        values = [(name, column.dtype.str) for name, column in columns.items() if name not in ("plant", "contour", key)]
+        table = cls(values, key)
+        plant = columns["plant"]
+        for code in unique_in_order(plant):
+            rows = plant == code
+            table.add(names[code], columns["contour"][rows], [keys[k] for k in columns[key][rows]],
+                      {name:columns[name][rows] for name, _ in values})
+        return table
+
+#functions
+def unique_in_order(codes):
+    """Returns: the unique values of a numpy array in the order they first appear."""
+    unique, first = np.unique(codes, return_index=True)
+    return unique[np.argsort(first)].tolist()
+
+def format_csv(header, names, keys, columns):
+    """Formats rows as csv text.
+
+    Integers are written exactly and floats with the shortest text that
+    reads back as the same float.
+    Input: header, the column names.
+    Input: names, keys, the names the plant and key columns refer to.
+    Input: columns, an OrderedDict with the columns in the order of header.
+    Returns: the csv text.
+    """
+    arrays = list(columns.values())
+    plant = np.array(names, dtype=object)[arrays[0]] if names else []
+    key = np.array(keys, dtype=object)[arrays[2]] if keys else []
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(zip(plant, arrays[1].tolist(), key, *[array.tolist() for array in arrays[3:]]))
+    return buffer.getvalue()
+
+def parse_csv(filename):
+    """Reads rows written by format_csv or UQ_batch.py.
+
+    Columns that only have integers become int64 columns, other value columns float64.
+    Input: filename, a string or Path.
+    Returns: key, the name of the key column, names, keys, the plant and key names, and columns, see ResultTable.columns.
+    """
+    with open(str(filename), newline="") as stream:
+        reader = csv.reader(stream)
+        header = next(reader)
+        rows = list(reader)
+    texts = list(zip(*rows)) if rows else [()] * len(header)
+    names, keys = {}, {}
+    columns = OrderedDict()
+    columns["plant"] = np.array([names.setdefault(t, len(names)) for t in texts[0]], dtype=CODE_DTYPE)
+    columns["contour"] = np.array([int(t) for t in texts[1]], dtype=CODE_DTYPE)
+    columns[header[2]] = np.array([keys.setdefault(t, len(keys)) for t in texts[2]], dtype=CODE_DTYPE)
+    for name, text in zip(header[3:], texts[3:]):
+        try:
+            columns[name] = np.array([int(t) for t in text], dtype="<i8")
+        except ValueError:
+            columns[name] = np.array(text, dtype="<f8")
+    return header[2], list(names), list(keys), columns
+
+def encode_columns(key, names, keys, columns):
+    """Lays out the columns in the results file format.
+
+    Input: key, the name of the key column.
+    Input: names, keys, the names the plant and key columns refer to.
+    Input: columns, an OrderedDict with the columns.
+    Returns: data, the bytes of the file.
+    """
+    parts = [b""]
+    offset = PREFIX.size
+    info = []
+    for name, array in columns.items():
+        data = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<")).tobytes()
+        info.append({"name":name, "dtype":array.dtype.newbyteorder("<").str, "offset":offset, "length":len(data)})
+        padding = -len(data) % ALIGN
+        parts.append(data + b"\0" * padding)
+        offset += len(data) + padding
+    header = json.dumps({"key":key, "rows":len(columns["plant"]), "plants":names, "keys":keys, "columns":info}).encode()
+    parts[0] = PREFIX.pack(MAGIC, offset, len(header))
+    parts.append(header)
+    return b"".join(parts)
+
+def decode_columns(data):
+    """Reads the columns of a results file without copying them.
+
+    Input: data, the bytes of the file.
+    Returns: key, names, keys and columns, see parse_csv.
+    """
+    magic, offset, length = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a results file")
+    header = json.loads(data[offset:offset + length].decode())
+    columns = OrderedDict()
+    for info in header["columns"]:
+        dtype = np.dtype(info["dtype"])
+        columns[info["name"]] = np.frombuffer(data, dtype=dtype, count=info["length"] // dtype.itemsize, offset=info["offset"])
+    return header["key"], header["plants"], header["keys"], columns
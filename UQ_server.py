@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""Job server that quantifies plants for everyone on a shared scan directory.
+
+The server runs UQ_batch.quantify_plant (load the elements, make the mask
+and quantify every contour) on a pool of worker processes and accepts
+jobs over a local TCP socket. The workers stay alive between jobs, so
+their in-memory image cache (see UQ_cache.py) stays warm, and masks and
+results are read from and written to the result store (see UQ_store.py).
+A job that is asked for while the same job (the same files, unchanged,
+and the same settings) is still running is not started again: the new
+client follows the running job and gets the same result.
+
+The protocol is JSON lines: the client sends one request per line and
+the server answers with events, one per line, for example
+    {"op": "quantify", "files": ["scans/P1 - K.txt", "scans/P1 - Ca.txt"], "element": "K", "statistics": true}
+    {"event": "queued", "job": "3f2a...", "shared": false}
+    {"event": "progress", "job": "3f2a...", "stage": "started"}
+    {"event": "progress", "job": "3f2a...", "stage": "mask"}
+    {"event": "progress", "job": "3f2a...", "stage": "quantify"}
+    {"event": "done", "job": "3f2a...", "rows": [["P1", 0, "Ca", 1234], ...]}
+A failed job ends with {"event": "failed", "job": ..., "error": ...} and
+a request that can not be read with {"event": "error", "error": ...}.
+{"op": "status"} answers with the workers, the running jobs and the number
+of finished and shared jobs. The files are paths on the server, so the
+server and its clients should see the scans at the same place.
+
+Clients use submit or UQ_server.py submit, the GUI submits its jobs to
+the server in the environment variable UQ_SERVER (host:port) if it is set.
+
+Usage:
+    UQ_server.py serve [--host 127.0.0.1] [--port 8765] [--workers 2] [--no-store]
+    UQ_server.py submit <plant files> [--element K] [--manual 40 | --method otsu] [--statistics] [--server host:port]
+    UQ_server.py status [--server host:port]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import UQ_batch
+import UQ_cache
+import UQ_functions as UQF
+import UQ_threshold
+
+#settings
+HOST = "127.0.0.1"
+PORT = 8765
+SERVER = os.environ.get("UQ_SERVER", "") # host:port of the server the GUI submits to, empty to quantify locally
+REQUEST_DEFAULTS = {"element":"K", "manual":None, "tiled":False, "method":UQ_threshold.DEFAULT_METHOD, "statistics":False, "cleanup":None}
+MAX_LINE = 1024**2 # the longest request in bytes
+
+_progress = None # the queue a worker process sends the progress of its jobs to
+
+#classes
+class Job:
+    """A quantification that is running, with the clients that follow it.
+
+    Attributes:
+    key, the job key made by job_key.
+    request, the request with all settings, see read_request.
+    events, the events of the job so far, a client that joins late gets these first.
+    followers, a list with an asyncio.Queue for every client that follows the job.
+    """
+    def __init__(self, key, request):
+        self.key = key
+        self.request = request
+        self.events = []
+        self.followers = []
+
+    def publish(self, event):
+        """Sends an event to all clients that follow the job.
+
+        Input: event, a dictionary.
+        """
+        event["job"] = self.key
+        self.events.append(event)
+        for queue in self.followers:
+            queue.put_nowait(event)
+
+    def follow(self):
+        """Returns: queue, an asyncio.Queue that gets the earlier and next events of the job."""
+        queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self.followers.append(queue)
+        return queue
+
+class JobServer:
+    """Accepts jobs over a socket and runs them on a pool of worker processes.
+
+    Attributes:
+    host, port, the address the server listens on, port 0 picks a free port.
+    workers, the number of worker processes.
+    store, if True masks and results are read from and written to the result store.
+    jobs, a dictionary with key:job key, value:Job of the running jobs.
+    finished, shared, the number of finished jobs and of requests that followed a running job.
+    """
+    def __init__(self, host=HOST, port=PORT, workers=None, store=True, log=sys.stderr):
+        """Creates the server, start starts it.
+
+        Input: host, port, workers, store, see the attributes.
+        Input: log, the stream to write the finished jobs to.
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.store = store
+        self.log = log
+        self.jobs = {}
+        self.finished = 0
+        self.shared = 0
+        self.pool = None
+        self.server = None
+        self.clients = set()
+
+    async def start(self):
+        """Starts the worker processes and listens for clients.
+
+        Returns: (host, port), the address the server listens on.
+        """
+        self.queue = multiprocessing.Queue()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.queue,))
+        self.forwarder = asyncio.ensure_future(self.forward_progress())
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_LINE)
+        self.host, self.port = self.server.sockets[0].getsockname()[:2]
+        return self.host, self.port
+
+    async def close(self):
+        """Stops listening, waits for the running jobs and stops the worker processes."""
+        self.server.close()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.pool.shutdown)
+        for writer in list(self.clients):
+            writer.close()
+        await self.server.wait_closed()
+        self.queue.put(None)
+        await self.forwarder
+
+    async def forward_progress(self):
+        """Publishes the progress that the worker processes send, until close."""
+        loop = asyncio.get_event_loop()
+        while True:
+            message = await loop.run_in_executor(None, self.queue.get)
+            if message is None:
+                return
+            key, stage = message
+            job = self.jobs.get(key)
+            if job is not None:
+                job.publish({"event":"progress", "stage":stage})
+
+    async def handle(self, reader, writer):
+        """Answers the requests of one client, runs for every connection.
+
+        Input: reader, writer, the asyncio streams of the connection.
+        """
+        self.clients.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # longer than MAX_LINE
+                    await send(writer, {"event":"error", "error":"a request can not be longer than {} bytes".format(MAX_LINE)})
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                    op = request.get("op") if isinstance(request, dict) else None
+                    if op == "quantify":
+                        await self.quantify(read_request(request), writer)
+                    elif op == "status":
+                        await send(writer, self.status())
+                    else:
+                        raise ValueError("unknown op {}, use quantify or status".format(op))
+                except (ValueError, TypeError) as error: # also invalid JSON
+                    await send(writer, {"event":"error", "error":str(error)})
+        except ConnectionError:
+            pass # the client is gone, its jobs continue for the other clients and the store
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def quantify(self, request, writer):
+        """Starts a job, or follows the same running job, and sends its events until it is done.
+
+        Input: request, see read_request.
+        Input: writer, the asyncio stream of the client.
+        """
+        key = job_key(request)
+        job = self.jobs.get(key)
+        shared = job is not None
+        if shared:
+            self.shared += 1
+        else:
+            job = self.jobs[key] = Job(key, request)
+            loop = asyncio.get_event_loop()
+            future = loop.run_in_executor(self.pool, run_job, key, request, self.store)
+            future.add_done_callback(lambda f, job=job: self.finish(job, f))
+        queue = job.follow()
+        try:
+            await send(writer, {"event":"queued", "job":key, "shared":shared})
+            while True:
+                event = await queue.get()
+                await send(writer, event)
+                if event["event"] in ("done", "failed"):
+                    return
+        finally:
+            job.followers.remove(queue)
+
+    def finish(self, job, future):
+        """Sends the result of a job to its clients, runs when the worker is done.
+
+        Input: job, the Job.
+        Input: future, the future of run_job.
+        """
+        del self.jobs[job.key]
+        self.finished += 1
+        error = future.exception()
+        if error is None:
+            rows = future.result()
+            job.publish({"event":"done", "rows":rows})
+            msg = "{} rows".format(len(rows))
+        else:
+            job.publish({"event":"failed", "error":"{}: {}".format(type(error).__name__, error)})
+            msg = "failed, {}".format(error)
+        print("{}: {}".format(job.request["plant"], msg), file=self.log, flush=True)
+
+    def status(self):
+        """Returns: a status event with the workers, the running jobs and the number of finished and shared jobs."""
+        return {"event":"status", "workers":self.workers, "store":self.store, "finished":self.finished, "shared":self.shared,
+                "running":[{"job":key, "plant":job.request["plant"], "followers":len(job.followers)} for key, job in self.jobs.items()]}
+
+    def serve(self):
+        """Runs the server until it is interrupted."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        host, port = loop.run_until_complete(self.start())
+        print("Serving on {}:{} with {} workers".format(host, port, self.workers), file=self.log, flush=True)
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.close())
+            loop.close()
+
+#functions
+def init_worker(queue):
+    """Runs once in every worker process: keeps the queue for the progress of the jobs.
+
+    Input: queue, a multiprocessing.Queue.
+    """
+    global _progress
+    _progress = queue
+
+def run_job(key, request, store=True):
+    """Quantifies a plant in a worker process and sends the progress of its stages.
+
+    Input: key, the job key.
+    Input: request, see read_request.
+    Input: store, see UQ_batch.quantify_plant.
+    Returns: rows, a list of lists, see UQ_batch.quantify_plant.
+    """
+    def progress(stage):
+        if _progress is not None:
+            _progress.put((key, stage))
+    progress("started")
+    rows = UQ_batch.quantify_plant(request["plant"], request["files"], request["element"], request["manual"], request["tiled"],
+                                   request["method"], request["statistics"], store, request["cleanup"], progress)
+    return [list(row) for row in rows]
+
+def read_request(request):
+    """Checks a quantify request and fills in the defaults.
+
+    Input: request, a dictionary with files and optionally plant and the keys of REQUEST_DEFAULTS.
+    Returns: request, a new dictionary with plant, files and all settings.
+    """
+    files = request.get("files")
+    if not isinstance(files, list) or files == [] or not all(isinstance(f, str) for f in files):
+        raise ValueError("files must be a list with the element files of one plant")
+    invalid = [f for f in files if not UQF.is_valid_filename(f)]
+    if invalid:
+        raise ValueError("{} is not a valid filename, use <plantname> - <element>.<suffix>".format(invalid[0]))
+    unknown = set(request) - set(REQUEST_DEFAULTS) - {"op", "plant", "files"}
+    if unknown:
+        raise ValueError("unknown settings {}".format(", ".join(sorted(unknown))))
+    checked = dict(REQUEST_DEFAULTS)
+    checked.update((name, value) for name, value in request.items() if name in REQUEST_DEFAULTS)
+    checked["files"] = sorted(files)
+    checked["plant"] = request.get("plant") or UQF.plantname_from_filename(checked["files"][0])[0]
+    if checked["method"] not in UQ_threshold.METHODS:
+        raise ValueError("unknown threshold method {}".format(checked["method"]))
+    if checked["cleanup"]:
+        cleanup = checked["cleanup"]
+        if not isinstance(cleanup, list) or len(cleanup) != 2 or not all(isinstance(radius, int) and radius >= 0 for radius in cleanup):
+            raise ValueError("cleanup must be the [opening, closing] radius in pixels")
+    return checked
+
+def job_key(request):
+    """Makes the key of a job, the same for the same unchanged files and settings.
+
+    Input: request, see read_request.
+    Returns: a hex string.
+    """
+    files = []
+    for f in request["files"]:
+        try:
+            files.append(list(UQ_cache.file_state(f)))
+        except OSError: # the job fails, it is still shared with the same requests
+            files.append([f])
+    settings = {name:request[name] for name in sorted(REQUEST_DEFAULTS)}
+    text = json.dumps({"plant":request["plant"], "files":files, "settings":settings}, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+async def send(writer, event):
+    """Sends an event to a client.
+
+    Input: writer, the asyncio stream of the client.
+    Input: event, a dictionary.
+    """
+    writer.write(json.dumps(event).encode("utf-8") + b"\n")
+    await writer.drain()
+
+def parse_address(address):
+    """Reads a host:port address.
+
+    Input: address, a string like "127.0.0.1:8765", the port may be left out.
+    Returns: (host, port).
+    """
+    host, _, port = address.rpartition(":") if ":" in address else (address, ":", "")
+    return host or HOST, int(port) if port else PORT
+
+def request_events(request, address=None, timeout=None):
+    """Sends one request to the server and reads its events.
+
+    Input: request, a dictionary, see the protocol at the top.
+    Input: address, the host:port of the server, by default SERVER or HOST:PORT.
+    Input: timeout, the seconds to wait for the server, None waits as long as the job takes.
+    Returns: a generator of the events, it ends after the last event of the request.
+    """
+    host, port = parse_address(address or SERVER or "{}:{}".format(HOST, PORT))
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        stream = sock.makefile("rwb")
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+        for line in stream:
+            event = json.loads(line.decode("utf-8"))
+            yield event
+            if event["event"] not in ("queued", "progress"):
+                return
+    raise ConnectionError("the server closed the connection")
+
+def submit(files, element="K", manual=None, method=UQ_threshold.DEFAULT_METHOD, statistics=False, cleanup=None,
+           address=None, progress=None, plant=None):
+    """Quantifies a plant on the server, like UQ_batch.quantify_plant.
+
+    Input: files, element, manual, method, statistics, cleanup, see UQ_batch.quantify_plant.
+    Input: address, see request_events.
+    Input: progress, None or a function that is called with the name of every stage of the job.
+    Input: plant, the name of the plant, by default from the filenames.
+    Returns: rows, a list of tuples, see UQ_batch.quantify_plant.
+    """
+    request = {"op":"quantify", "files":[str(f) for f in files], "element":element, "manual":manual,
+               "method":method, "statistics":statistics, "cleanup":list(cleanup) if cleanup else None, "plant":plant}
+    for event in request_events(request, address):
+        if event["event"] == "progress" and progress is not None:
+            progress(event["stage"])
+        elif event["event"] == "done":
+            return [tuple(row) for row in event["rows"]]
+        elif event["event"] == "failed":
+            raise RuntimeError(event["error"])
+        elif event["event"] == "error":
+            raise ValueError(event["error"])
+
+def status(address=None):
+    """Returns: the status event of the server, see JobServer.status."""
+    for event in request_events({"op":"status"}, address, timeout=10):
+        return event
+
+def statistics(con, files, element="K", manual=None, method=UQ_threshold.DEFAULT_METHOD, address=None):
+    """UQ_store.statistics for the GUI, calculated on the server.
+
+    The server makes the mask again with the same settings, so it finds
+    the same plants as con.
+    Input: con, the PlantLabels of the mask, for the numbered image.
+    Input: files, element, manual, method, see submit.
+    Input: address, see request_events.
+    Returns: results, img, see UQ_functions.contour_statistics.
+    """
+    rows = submit(files, element, manual, method, True, address=address)
+    stats = []
+    for row in rows:
+        entry = {"element":row[2], "contour":row[1], "sum":row[3]}
+        entry.update(zip(UQ_batch.STATISTICS, row[4:]))
+        stats.append(entry)
+    if len({entry["contour"] for entry in stats}) != len(con):
+        raise ValueError("the server found {} plants instead of {}".format(len({entry["contour"] for entry in stats}), len(con)))
+    return stats, UQF.order_img(con, con.shape)
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Run or use the job server that quantifies plants for several clients.")
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="run the server")
+    serve_parser.add_argument("--host", default=HOST, help="address to listen on (default: {}, only this machine)".format(HOST))
+    serve_parser.add_argument("--port", type=int, default=PORT, help="port to listen on (default: {})".format(PORT))
+    serve_parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    serve_parser.add_argument("--no-store", dest="store", action="store_false", help="do not read or write the result store")
+    submit_parser = commands.add_parser("submit", help="quantify a plant on the server and write the rows as csv")
+    submit_parser.add_argument("files", nargs="+", help="the element files of one plant")
+    submit_parser.add_argument("-e", "--element", default="K", help="element used to create the mask (default: K)")
+    submit_parser.add_argument("-m", "--manual", type=int, default=None, help="manual threshold (0-255) instead of an automatic threshold")
+    submit_parser.add_argument("--method", default=UQ_threshold.DEFAULT_METHOD, choices=list(UQ_threshold.METHODS), help="automatic threshold method (default: first_valley)")
+    submit_parser.add_argument("--statistics", action="store_true", help="also write the area, mean, min, max, std and percentiles of every contour")
+    status_parser = commands.add_parser("status", help="show the running jobs of the server")
+    for command_parser in (submit_parser, status_parser):
+        command_parser.add_argument("--server", default=None, help="host:port of the server (default: UQ_SERVER or {}:{})".format(HOST, PORT))
+    args = parser.parse_args(args)
+    if args.command is None:
+        parser.error("use serve, submit or status")
+    return args
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.command == "serve":
+        JobServer(args.host, args.port, args.workers, args.store).serve()
+    elif args.command == "submit":
+        files = [os.path.abspath(f) for f in args.files]
+        rows = submit(files, args.element, args.manual, args.method, args.statistics, address=args.server,
+                      progress=lambda stage: print(stage, file=sys.stderr, flush=True))
+        writer = csv.writer(sys.stdout)
+        writer.writerow(UQ_batch.RESULT_HEADER + UQ_batch.STATISTICS if args.statistics else UQ_batch.RESULT_HEADER)
+        writer.writerows(rows)
+    else:
+        print(json.dumps(status(args.server), indent=1))
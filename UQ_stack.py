@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""All element maps of one plant in one array.
+
+The elements of a plant are always used together, so PlantStack.load
+loads all element files of a plant at the same time in a pool of threads
+into one contiguous (element, rows, columns) array, and fails as soon as
+a file has another shape than the others. UQ_functions.area_contours and
+contour_statistics accept a PlantStack instead of a list of files.
+
+A stack can be moved to shared memory (Python 3.8 or newer), so worker
+processes can use it without a copy of the array being pickled:
+    info = stack.share()
+    pool.submit(quantify_shared, info, contours)
+    ...
+    stack.close()
+quantify_pool does this for the quantification of one plant, with one job
+per element. UQ_batch.py uses it when there are fewer plants than workers.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import UQ_functions as UQF
+import UQ_threshold
+
+#classes
+class PlantStack:
+    """The element maps of one plant.
+
+    Attributes:
+    elements, a list with the element of every layer.
+    paths, a list with the file of every layer.
+    array, a numpy array with shape (elements, rows, columns), the counts or the 8-bit image if a file has no counts.
+    shm, the SharedMemory that holds array, or None.
+    """
+    def __init__(self, elements, paths, array, shm=None, owner=False):
+        """Creates a stack of loaded arrays, use load or attach to make one.
+
+        Input: elements, paths, array, see the attributes.
+        Input: shm, the SharedMemory that holds array, or None.
+        Input: owner, True if close should also remove the shared memory.
+        """
+        self.elements = list(elements)
+        self.paths = [str(p) for p in paths]
+        self.array = array
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def load(cls, filepaths, workers=None):
+        """Loads the element files of a plant at the same time.
+
+        Every file is copied into its layer as soon as it is loaded.
+        Input: filepaths, a list with the files of the elements of one plant.
+        Input: workers, the number of threads, by default one per file up to the number of cpus.
+        Returns: stack, a PlantStack with the layers in the order of filepaths.
+        """
+        filepaths = [str(f) for f in filepaths]
+        if not filepaths:
+            raise ValueError("no element files to load")
+        workers = workers or min(len(filepaths), os.cpu_count() or 1)
+        elements = [None] * len(filepaths)
+        array = None
+        first = None
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {pool.submit(UQF.load_element, f):i for i, f in enumerate(filepaths)}
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    el, layer = future.result()
+                    if array is None:
+                        first = i
+                        array = np.empty((len(filepaths),) + layer.shape, dtype=layer.dtype)
+                    elif layer.shape != array.shape[1:]:
+                        raise ValueError("{} has shape {}, but {} has shape {}".format(
+                            filepaths[i], layer.shape, filepaths[first], array.shape[1:]))
+                    elif not np.can_cast(layer.dtype, array.dtype):
+                        array = array.astype(np.result_type(array.dtype, layer.dtype))
+                    array[i] = layer
+                    elements[i] = el
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return cls(elements, filepaths, array)
+
+    @classmethod
+    def attach(cls, info):
+        """Uses a stack that another process moved to shared memory, without copying it.
+
+        Input: info, the dictionary returned by share.
+        Returns: stack, a PlantStack, close it when it is not needed anymore.
+        """
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name=info["name"])
+        array = np.ndarray(tuple(info["shape"]), dtype=np.dtype(info["dtype"]), buffer=shm.buf)
+        return cls(info["elements"], info["paths"], array, shm)
+
+    @property
+    def image_shape(self):
+        """The (rows, columns) of every element map."""
+        return self.array.shape[1:]
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __getitem__(self, element):
+        """Gets the layer of an element, a view on the array.
+
+        Input: element, for example "K".
+        Returns: a 2D numpy array.
+        """
+        if element not in self.elements:
+            raise KeyError("element {} not in the stack of {}".format(element, ", ".join(self.elements)))
+        return self.array[self.elements.index(element)]
+
+    def layers(self):
+        """Returns: a generator of (element, array), like UQ_functions.element_arrays."""
+        return ((el, self.array[i]) for i, el in enumerate(self.elements))
+
+    def share(self):
+        """Moves the array to shared memory, the next calls only return the info.
+
+        Input: none.
+        Returns: info, a small dictionary for attach, it can be sent to other processes.
+        """
+        if self.shm is None:
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(create=True, size=max(1, self.array.nbytes))
+            array = np.ndarray(self.array.shape, dtype=self.array.dtype, buffer=shm.buf)
+            array[...] = self.array
+            self.array, self.shm, self.owner = array, shm, True
+        return {"name":self.shm.name, "shape":list(self.array.shape), "dtype":self.array.dtype.str,
+                "elements":self.elements, "paths":self.paths}
+
+    def close(self):
+        """Stops using the shared memory, the process that shared the stack also removes it.
+
+        Views on the layers can not be used after this.
+        """
+        if self.shm is None:
+            return
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError: # a view on a layer is still used, the memory is unmapped when it is gone
+            pass
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#functions
+def quantify_shared(info, contours, element=None, statistics=False):
+    """Runs UQ_functions.area_contours or contour_statistics on a shared stack, in a worker process.
+
+    Input: info, the dictionary returned by PlantStack.share.
+    Input: contours, open-cv contours or UQ_functions.PlantLabels.
+    Input: element, None for all elements or the only element to quantify.
+    Input: statistics, if True contour_statistics is used instead of area_contours.
+    Returns: results, a list of tuples with (element, index, sum), or of dictionaries with the statistics.
+    """
+    stack = PlantStack.attach(info)
+    try:
+        layers = stack
+        if element is not None:
+            i = stack.elements.index(element)
+            layers = PlantStack([element], stack.paths[i:i + 1], stack.array[i:i + 1])
+        if statistics:
+            results, _ = UQF.contour_statistics(contours, layers)
+        else:
+            results, _ = UQF.area_contours(contours, layers)
+        layers = None
+    finally:
+        stack.close()
+    return results
+
+def quantify_pool(stack, contours, pool, statistics=False):
+    """Quantifies a plant on a pool of worker processes, one element per job.
+
+    A copy of the stack is moved to shared memory for the workers, the
+    stack itself can still be used afterwards.
+    Input: stack, a PlantStack.
+    Input: contours, open-cv contours or UQ_functions.PlantLabels.
+    Input: pool, a ProcessPoolExecutor.
+    Input: statistics, if True the results are those of contour_statistics instead of area_contours.
+    Returns: results, img, in the same order as UQ_functions.area_contours or contour_statistics.
+    """
+    shared = PlantStack(stack.elements, stack.paths, stack.array)
+    try:
+        info = shared.share()
+        futures = [pool.submit(quantify_shared, info, contours, el, statistics) for el in stack.elements]
+        per_element = [future.result() for future in futures]
+    finally:
+        shared.close()
+    # every list is ordered on contour, the results are ordered on contour and then element
+    results = [entry for entries in zip(*per_element) for entry in entries]
+    shape = stack.image_shape
+    contours = contours if hasattr(contours, "labels") else sorted(contours, key=lambda x:UQF.get_contour_precedence(x, shape[1]))
+    return results, UQF.order_img(contours, shape)
+
+def threshold_shared(info, element, method=UQ_threshold.DEFAULT_METHOD):
+    """Finds the threshold of an element of a shared stack, in a worker process.
+
+    Input: info, the dictionary returned by PlantStack.share.
+    Input: element, the element to threshold.
+    Input: method, the threshold method, see UQ_threshold.py.
+    Returns: th, the threshold of the 8-bit image of the element, like the GUI shows it.
+    """
+    stack = PlantStack.attach(info)
+    try:
+        layer = stack[element]
+        img = layer if layer.dtype == np.uint8 else UQF.array_to_img(layer)
+        layer = None
+        return UQ_threshold.threshold(img, method)
+    finally:
+        stack.close()
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""Store of computed masks and results, keyed on the content of the input files.
+
+Making a mask and quantifying a plant again with the same files and
+settings returns the stored result instead of computing it again. The
+keys are hashes of the content of the element files (not their paths),
+the threshold settings and ENGINE_VERSION, so a changed file or a new
+version of the calculations never returns an old result. The store is a
+SQLite database:
+- files: the content hash of every (path, size, modification time), so a file is hashed once.
+- masks: the mask (PNG) and contours of every threshold setting, the
+  least recently used masks are removed when they take more than MAX_BYTES.
+- runs and results: the statistics of every contour and element, these
+  are kept and can be queried across all runs with query(). A run only
+  keeps the hash of its contours, the image with the order of the
+  contours is drawn again from the contours of the mask.
+
+The database is DEFAULT_STORE in the cache directory, it can be changed
+with the environment variable UQ_STORE (an empty value disables the store)
+and the size of the masks with UQ_STORE_MAX_BYTES.
+
+Usage:
+    mask, con = UQ_store.get_mask("K", "Auto", path, files)
+    stats, img = UQ_store.statistics(con, files)
+    UQ_store.py query [--plant name] [--element K] [--output results.csv]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+import cv2
+import numpy as np
+import UQ_cache
+import UQ_container
+import UQ_functions as UQF
+import UQ_stack
+import UQ_threshold
+
+#settings
+ENGINE_VERSION = 3 # increase when a change of the calculations changes masks or results
+DEFAULT_STORE = UQ_cache.DEFAULT_CACHE_DIR / "results.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024**2 # 256 MB of masks
+STORE = os.environ.get("UQ_STORE", str(DEFAULT_STORE))
+MAX_BYTES = int(os.environ.get("UQ_STORE_MAX_BYTES", DEFAULT_MAX_BYTES))
+STATISTICS = ["area", "sum", "mean", "min", "max", "std"] # columns of the results table, the percentiles are stored as JSON
+LABELS_MAGIC = b"UQLABEL1" # start of packed UQ_functions.PlantLabels, packed contours start with the numpy magic
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT, size INTEGER, mtime INTEGER, hash TEXT, PRIMARY KEY (path, size, mtime));
+CREATE TABLE IF NOT EXISTS masks (key TEXT PRIMARY KEY, source TEXT, source_hash TEXT, settings TEXT,
+    contours_hash TEXT, mask BLOB, contours BLOB, nbytes INTEGER, created REAL, used REAL);
+CREATE INDEX IF NOT EXISTS masks_contours ON masks (contours_hash);
+CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, plant TEXT, contours_hash TEXT, files TEXT,
+    shape TEXT, created REAL, used REAL);
+CREATE INDEX IF NOT EXISTS runs_plant ON runs (plant);
+CREATE TABLE IF NOT EXISTS results (run TEXT, contour INTEGER, element TEXT, area INTEGER, sum INTEGER, mean REAL,
+    min INTEGER, max INTEGER, std REAL, percentiles TEXT, PRIMARY KEY (run, contour, element));
+"""
+
+#classes
+class ResultStore:
+    """The SQLite database with masks and results.
+
+    Every thread gets its own connection, so the store can be used from
+    the background jobs of the GUI and from several batch processes. A
+    process made with fork opens new connections.
+    """
+    def __init__(self, filename, max_bytes=MAX_BYTES):
+        """Opens or creates the store.
+
+        Input: filename, the path of the database.
+        Input: max_bytes, the maximum size of the stored masks and contours.
+        """
+        self.filename = str(filename)
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.pid = os.getpid()
+        self.hashes = {} # key:(path, size, mtime), value:content hash
+        Path(self.filename).parent.mkdir(parents=True, exist_ok=True)
+        with self.connection() as db:
+            db.executescript(SCHEMA)
+
+    def connection(self):
+        """Gets the connection of this thread."""
+        if self.pid != os.getpid():
+            # the connections of the parent process can not be used after a fork
+            self.local = threading.local()
+            self.pid = os.getpid()
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.filename, timeout=60)
+            db.execute("PRAGMA journal_mode=WAL")
+            self.local.db = db
+        return db
+
+    def file_hash(self, path):
+        """Gets the content hash of a file or container member, it is calculated once per version of the file.
+
+        Input: path, a string or Path.
+        Returns: a hex string.
+        """
+        key = UQ_cache.file_state(path)
+        if key in self.hashes:
+            return self.hashes[key]
+        db = self.connection()
+        row = db.execute("SELECT hash FROM files WHERE path=? AND size=? AND mtime=?", key).fetchone()
+        if row is None:
+            digest = content_hash(path)
+            with db:
+                db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", key + (digest,))
+        else:
+            digest = row[0]
+        self.hashes[key] = digest
+        return digest
+
+    def get_mask(self, key):
+        """Gets a stored mask.
+
+        Input: key, the key made by mask_key.
+        Returns: (mask, contours) or None.
+        """
+        db = self.connection()
+        row = db.execute("SELECT mask, contours FROM masks WHERE key=? AND mask IS NOT NULL", (key,)).fetchone()
+        if row is None:
+            return None
+        with db:
+            db.execute("UPDATE masks SET used=? WHERE key=?", (time.time(), key))
+        return cv2.imdecode(np.frombuffer(row[0], dtype=np.uint8), cv2.IMREAD_UNCHANGED), unpack_contours(row[1])
+
+    def put_mask(self, key, source, source_hash, settings, mask, con):
+        """Stores a mask and removes the least recently used masks if the store is too large.
+
+        Input: key, the key made by mask_key.
+        Input: source, source_hash, the path and content hash of the file the mask is made from.
+        Input: settings, a dictionary with the threshold settings.
+        Input: mask, con, the mask and contours.
+        """
+        _, png = cv2.imencode(".png", mask)
+        contours = pack_contours(con)
+        now = time.time()
+        db = self.connection()
+        with db:
+            db.execute("INSERT OR REPLACE INTO masks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, str(source), source_hash, json.dumps(settings, sort_keys=True), contours_hash(con),
+                        png.tobytes(), contours, len(png) + len(contours), now, now))
+        self.evict(self.max_bytes)
+
+    def get_run(self, key, elements):
+        """Gets the stored statistics of a run.
+
+        Input: key, the key made by run_key.
+        Input: elements, the elements in the order of the files.
+        Returns: (stats, shape) or None, stats as UQ_functions.contour_statistics.
+        """
+        db = self.connection()
+        run = db.execute("SELECT shape FROM runs WHERE key=?", (key,)).fetchone()
+        if run is None:
+            return None
+        rows = db.execute("SELECT contour, element, {}, percentiles FROM results WHERE run=?".format(", ".join(STATISTICS)), (key,)).fetchall()
+        with db:
+            db.execute("UPDATE runs SET used=? WHERE key=?", (time.time(), key))
+        by_key = {(row[0], row[1]):row for row in rows}
+        stats = []
+        for i in range(1 + max((row[0] for row in rows), default=-1)):
+            for el in elements:
+                row = by_key[(i, el)]
+                entry = {"element":el, "contour":i}
+                entry.update(zip(STATISTICS, row[2:-1]))
+                entry.update(json.loads(row[-1]))
+                stats.append(entry)
+        return stats, tuple(json.loads(run[0]))
+
+    def put_run(self, key, plant, con, files, shape, stats):
+        """Stores the statistics of a run.
+
+        Input: key, the key made by run_key.
+        Input: plant, the plantname.
+        Input: con, the contours of the mask, which link the run to the mask.
+        Input: files, a dictionary with key:element, value:(path, content hash).
+        Input: shape, the shape of the images.
+        Input: stats, the statistics of UQ_functions.contour_statistics.
+        """
+        now = time.time()
+        rows = []
+        for s in stats:
+            percentiles = {name:value for name, value in s.items() if name not in STATISTICS and name not in ("element", "contour")}
+            rows.append((key, s["contour"], s["element"]) + tuple(s[name] for name in STATISTICS) + (json.dumps(percentiles),))
+        db = self.connection()
+        with db:
+            db.execute("INSERT OR REPLACE INTO runs (key, plant, contours_hash, files, shape, created, used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, plant, contours_hash(con), json.dumps(files, sort_keys=True), json.dumps(list(shape)), now, now))
+            db.execute("DELETE FROM results WHERE run=?", (key,))
+            db.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def query(self, plant=None, element=None, since=None):
+        """Gets stored results of all runs.
+
+        Input: plant, only results of this plant.
+        Input: element, only results of this element.
+        Input: since, only runs created after this time (seconds since the epoch).
+        Returns: a list of dictionaries with the run, plant, created time, threshold settings (if the mask is known),
+                 contour, element and statistics, ordered on time, run, contour and element.
+        """
+        conditions, values = [], []
+        for column, value in (("runs.plant", plant), ("results.element", element)):
+            if value is not None:
+                conditions.append("{}=?".format(column))
+                values.append(value)
+        if since is not None:
+            conditions.append("runs.created>?")
+            values.append(since)
+        sql = ("SELECT runs.key, runs.plant, runs.created, "
+               "(SELECT settings FROM masks WHERE masks.contours_hash=runs.contours_hash ORDER BY used DESC LIMIT 1), "
+               "results.contour, results.element, {}, results.percentiles "
+               "FROM runs JOIN results ON results.run=runs.key").format(", ".join("results." + name for name in STATISTICS))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY runs.created, runs.key, results.contour, results.element"
+        results = []
+        for row in self.connection().execute(sql, values):
+            entry = {"run":row[0], "plant":row[1], "created":row[2], "settings":json.loads(row[3]) if row[3] else None,
+                     "contour":row[4], "element":row[5]}
+            entry.update(zip(STATISTICS, row[6:-1]))
+            entry.update(json.loads(row[-1]))
+            results.append(entry)
+        return results
+
+    def evict(self, max_bytes):
+        """Removes the masks and contours that were used least recently until they fit in max_bytes.
+
+        The settings of a removed mask are kept, so query() still shows them.
+        Input: max_bytes, the maximum size in bytes.
+        """
+        db = self.connection()
+        total = db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM masks WHERE mask IS NOT NULL").fetchone()[0]
+        if total <= max_bytes:
+            return
+        remove = []
+        for key, nbytes in db.execute("SELECT key, nbytes FROM masks WHERE mask IS NOT NULL ORDER BY used"):
+            if total <= max_bytes:
+                break
+            remove.append((key,))
+            total -= nbytes
+        with db:
+            db.executemany("UPDATE masks SET mask=NULL, contours=NULL, nbytes=0 WHERE key=?", remove)
+
+    def clear(self):
+        """Removes everything from the store."""
+        db = self.connection()
+        with db:
+            for table in ["files", "masks", "runs", "results"]:
+                db.execute("DELETE FROM {}".format(table))
+        self.hashes.clear()
+
+    def stats(self):
+        """Gets the number of stored files, masks, runs and results and the size of the masks."""
+        db = self.connection()
+        counts = {table:db.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0] for table in ["files", "masks", "runs", "results"]}
+        counts["mask_bytes"] = db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM masks").fetchone()[0]
+        return counts
+
+_store = None
+_store_lock = threading.Lock()
+
+#functions
+def default_store():
+    """Gets the store of this process, or None if the store is disabled.
+
+    Returns: a ResultStore or None.
+    """
+    global _store
+    if not STORE:
+        return None
+    with _store_lock:
+        if _store is None or _store.filename != STORE:
+            try:
+                _store = ResultStore(STORE, MAX_BYTES)
+            except sqlite3.Error:
+                return None
+        return _store
+
+def set_store(filename, max_bytes=None):
+    """Changes the database (and optionally the size of the masks) of the store.
+
+    Input: filename, a string with the path. None or "" disables the store.
+    Input: max_bytes, the maximum size of the stored masks in bytes.
+    """
+    global STORE, MAX_BYTES, _store
+    STORE = str(filename) if filename else ""
+    if max_bytes is not None:
+        MAX_BYTES = int(max_bytes)
+    with _store_lock:
+        _store = None
+
+def content_hash(path):
+    """Calculates the hash of the content of a file or container member.
+
+    Input: path, a string or Path.
+    Returns: a hex string.
+    """
+    digest = hashlib.sha1()
+    if UQ_container.is_member(path):
+        container, name = UQ_container.open_member(path)
+        member = container.member(name)
+        digest.update(json.dumps([member["shape"], member["dtype"], member["chunk"]]).encode("utf-8"))
+        for offset, length in member["chunks"]:
+            digest.update(container.data[offset:offset + length])
+        return digest.hexdigest()
+    with open(str(path), "rb") as stream:
+        for block in iter(lambda: stream.read(1024**2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def pack_contours(con):
+    """Converts contours to bytes.
+
+    Input: con, a list of open-cv contours or UQ_functions.PlantLabels.
+    Returns: bytes with the number of points of every contour and all points, or see pack_labels.
+    """
+    if hasattr(con, "labels"):
+        return pack_labels(con)
+    lengths = np.array([len(c) for c in con], dtype=np.int64)
+    points = np.concatenate([np.asarray(c, dtype=np.int32).reshape(-1, 2) for c in con]) if len(con) else np.zeros((0, 2), dtype=np.int32)
+    buffer = io.BytesIO()
+    np.save(buffer, lengths)
+    np.save(buffer, points)
+    return buffer.getvalue()
+
+def unpack_contours(data):
+    """Converts bytes of pack_contours to contours.
+
+    Input: data, bytes.
+    Returns: con, a list of int32 arrays with shape (points, 1, 2) as open-cv gives, or PlantLabels.
+    """
+    if data.startswith(LABELS_MAGIC):
+        return unpack_labels(data)
+    buffer = io.BytesIO(data)
+    lengths = np.load(buffer)
+    points = np.load(buffer)
+    return [c.reshape(-1, 1, 2) for c in np.split(points, np.cumsum(lengths)[:-1])] if len(lengths) else []
+
+def pack_labels(plants):
+    """Converts PlantLabels to bytes.
+
+    Input: plants, a UQ_functions.PlantLabels.
+    Returns: LABELS_MAGIC and the compressed label image (in the smallest unsigned type), boxes and areas.
+    """
+    dtype = np.min_scalar_type(len(plants))
+    buffer = io.BytesIO()
+    np.save(buffer, plants.labels.astype(dtype))
+    np.save(buffer, plants.boxes)
+    np.save(buffer, plants.areas)
+    return LABELS_MAGIC + zlib.compress(buffer.getvalue(), 1)
+
+def unpack_labels(data):
+    """Converts bytes of pack_labels to PlantLabels.
+
+    Input: data, bytes.
+    Returns: plants, a UQ_functions.PlantLabels.
+    """
+    buffer = io.BytesIO(zlib.decompress(data[len(LABELS_MAGIC):]))
+    labels = np.load(buffer).astype(np.int32)
+    return UQF.PlantLabels(labels, np.load(buffer), np.load(buffer))
+
+def contours_hash(con):
+    """Calculates the hash of contours."""
+    return hashlib.sha1(pack_contours(con)).hexdigest()
+
+def mask_key(source_hash, settings):
+    """Makes the key of a mask.
+
+    Input: source_hash, the content hash of the file the mask is made from.
+    Input: settings, a dictionary with the threshold settings.
+    Returns: a hex string.
+    """
+    text = json.dumps({"engine":ENGINE_VERSION, "source":source_hash, "settings":settings}, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def run_key(con, files):
+    """Makes the key of the statistics of contours on element files.
+
+    Input: con, the contours.
+    Input: files, a dictionary with key:element, value:(path, content hash).
+    Returns: a hex string.
+    """
+    text = json.dumps({"engine":ENGINE_VERSION, "contours":contours_hash(con), "percentiles":UQF.PERCENTILES,
+                       "files":{el:h for el, (_, h) in files.items()}}, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def get_mask(th_mode, th_manual, cur_path, files, method=UQ_threshold.DEFAULT_METHOD, store=None, cleanup=None):
+    """UQ_functions.get_mask, answered from the store if the same mask was made before.
+
+    Input: th_mode, th_manual, cur_path, files, method, cleanup, see UQ_functions.get_mask.
+    Input: store, a ResultStore, by default default_store(), False to not use the store.
+    Returns: mask, con, see UQ_functions.get_mask.
+    """
+    if store is None:
+        store = default_store()
+    if not store:
+        return UQF.get_mask(th_mode, th_manual, cur_path, files, method, cleanup)
+    source = UQF.mask_source(th_mode, cur_path, files)
+    if source == "Element not found":
+        return UQF.get_mask(th_mode, th_manual, cur_path, files, method, cleanup)
+    if th_mode == "Manual":
+        settings = {"mode":"manual", "threshold":int(th_manual)}
+    else:
+        settings = {"mode":"auto", "element":th_mode, "method":method}
+    if cleanup:
+        settings["cleanup"] = list(cleanup)
+    source_hash = store.file_hash(source)
+    key = mask_key(source_hash, settings)
+    stored = store.get_mask(key)
+    if stored is not None:
+        return stored
+    mask, con = UQF.get_mask(th_mode, th_manual, cur_path, files, method, cleanup)
+    store.put_mask(key, source, source_hash, settings, mask, con)
+    return mask, con
+
+def load_stack(filepaths):
+    """Loads all element files at once, only when the statistics have to be calculated.
+
+    Input: filepaths, a list of files or a UQ_stack.PlantStack.
+    Returns: stack, a UQ_stack.PlantStack.
+    """
+    if hasattr(filepaths, "layers"):
+        return filepaths
+    return UQ_stack.PlantStack.load(filepaths)
+
+def calculate_statistics(con, filepaths, pool=None):
+    """Calculates UQ_functions.contour_statistics on a stack of all element files.
+
+    Input: con, filepaths, see UQ_functions.contour_statistics.
+    Input: pool, None or a ProcessPoolExecutor that quantifies the elements, see UQ_stack.quantify_pool.
+    Returns: results, img, see UQ_functions.contour_statistics.
+    """
+    if pool is None:
+        return UQF.contour_statistics(con, load_stack(filepaths))
+    return UQ_stack.quantify_pool(load_stack(filepaths), con, pool, statistics=True)
+
+def statistics(con, filepaths, store=None, pool=None):
+    """UQ_functions.contour_statistics, answered from the store if it was calculated before.
+
+    On a miss all element files are loaded at the same time, see UQ_stack.py.
+    Input: con, filepaths, see UQ_functions.contour_statistics.
+    Input: store, a ResultStore, by default default_store(), False to not use the store.
+    Input: pool, see calculate_statistics.
+    Returns: results, img, see UQ_functions.contour_statistics.
+    """
+    if store is None:
+        store = default_store()
+    if not store:
+        return calculate_statistics(con, filepaths, pool)
+    paths = filepaths.paths if hasattr(filepaths, "paths") else filepaths
+    files = {}
+    for f in paths:
+        files[UQF.plantname_from_filename(f)[1]] = (str(f), store.file_hash(f))
+    key = run_key(con, files)
+    stored = store.get_run(key, list(files))
+    if stored is not None:
+        # the key contains the hash of con, so the stored run was made with these contours
+        stats, shape = stored
+        contours = con if hasattr(con, "labels") else sorted(con, key=lambda x:UQF.get_contour_precedence(x, shape[1]))
+        return stats, UQF.order_img(contours, shape)
+    stats, img = calculate_statistics(con, filepaths, pool)
+    store.put_run(key, UQF.plantname_from_filename(paths[0])[0], con, files, img.shape, stats)
+    return stats, img
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Query or clean the store of masks and results.")
+    parser.add_argument("--store", default=STORE, help="the database (default: {})".format(DEFAULT_STORE))
+    commands = parser.add_subparsers(dest="command")
+    query_parser = commands.add_parser("query", help="write the stored results as csv")
+    query_parser.add_argument("--plant", default=None, help="only results of this plant")
+    query_parser.add_argument("--element", default=None, help="only results of this element")
+    query_parser.add_argument("-o", "--output", default=None, help="csv file to write (default: standard output)")
+    evict_parser = commands.add_parser("evict", help="remove masks until they fit in a size")
+    evict_parser.add_argument("max_bytes", type=int, help="the maximum size of the masks in bytes")
+    commands.add_parser("clear", help="remove everything from the store")
+    commands.add_parser("stats", help="show the size of the store")
+    args = parser.parse_args(args)
+    if args.command is None:
+        parser.error("use query, evict, clear or stats")
+    return args
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    store = ResultStore(args.store)
+    if args.command == "query":
+        results = store.query(args.plant, args.element)
+        columns = ["run", "plant", "created", "settings", "contour", "element"] + UQF.STATISTICS
+        stream = open(args.output, "w", newline="") if args.output else sys.stdout
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        for r in results:
+            r["settings"] = json.dumps(r["settings"]) if r["settings"] else ""
+            writer.writerow([r.get(name, "") for name in columns])
+        if args.output:
+            stream.close()
+    elif args.command == "evict":
+        store.evict(args.max_bytes)
+    elif args.command == "clear":
+        store.clear()
+    print(json.dumps(store.stats()), file=sys.stderr)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Threshold methods that share one cached histogram per image.
+
+The histogram of an image is calculated once with np.bincount and kept as
+long as the (read-only) image exists, so trying another method or element
+does not go over the pixels again. All methods work on this integer
+histogram:
+- first_valley: the same threshold as UQ_functions.hist_thresholding.
+- balanced: the same threshold as UQ_functions.balanced_hist_thresholding.
+- otsu: maximizes the variance between the two classes.
+- triangle: the largest distance between the histogram and the line from its peak to its far end.
+- percentile: keeps the brightest pixels above a percentile.
+A pixel is in the mask if its value is larger than the threshold, as with
+cv2.THRESH_BINARY.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import threading
+import weakref
+from sys import argv
+import numpy as np
+
+#settings
+DEFAULT_METHOD = "first_valley"
+PERCENTILE = 90
+GUI_METHODS = {"Auto":"first_valley", "Balanced":"balanced", "Otsu":"otsu", "Triangle":"triangle", "Percentile":"percentile"}
+
+_histograms = {} # key:id of the image, value:(weak reference to the image, histogram)
+_lock = threading.Lock()
+
+#functions
+def histogram(array):
+    """Calculates the histogram of an integer image, cached for read-only images.
+
+    Input: array, a uint8 or uint16 numpy array.
+    Returns: hist, a read-only int64 array with the number of pixels of every value.
+    """
+    if array.dtype not in [np.uint8, np.uint16]:
+        raise ValueError("a histogram needs a uint8 or uint16 image, not {}".format(array.dtype))
+    key = id(array)
+    with _lock:
+        entry = _histograms.get(key)
+    if entry is not None and entry[0]() is array:
+        return entry[1]
+    hist = np.bincount(array.ravel(), minlength=256 if array.dtype == np.uint8 else 1)
+    hist.flags.writeable = False
+    if not array.flags.writeable:
+        # only read-only images are cached, other arrays could still change
+        def forget(ref, key=key):
+            with _lock:
+                if key in _histograms and _histograms[key][0] is ref:
+                    del _histograms[key]
+        with _lock:
+            _histograms[key] = (weakref.ref(array, forget), hist)
+    return hist
+
+def clear_cache():
+    """Removes all cached histograms."""
+    with _lock:
+        _histograms.clear()
+
+def threshold(array, method=DEFAULT_METHOD, percentile=PERCENTILE):
+    """Finds the threshold of an image.
+
+    Input: array, a uint8 or uint16 numpy array.
+    Input: method, one of METHODS.
+    Input: percentile, the percentile used by the percentile method.
+    Returns: th, the threshold, the mask is array > th.
+    """
+    return threshold_from_hist(histogram(array), method, percentile)
+
+def threshold_from_hist(hist, method=DEFAULT_METHOD, percentile=PERCENTILE):
+    """Finds the threshold from a histogram.
+
+    Input: hist, an integer array with the number of pixels of every value.
+    Input: method, one of METHODS.
+    Input: percentile, the percentile used by the percentile method.
+    Returns: th, the threshold.
+    """
+    if method not in METHODS:
+        raise ValueError("unknown threshold method {}, use one of {}".format(method, ", ".join(METHODS)))
+    hist = np.asarray(hist, dtype=np.int64)
+    if not hist.any():
+        raise ValueError("the image has no pixels")
+    if method == "percentile":
+        return percentile_threshold(hist, percentile)
+    return METHODS[method](hist)
+
+def first_valley(hist):
+    """The threshold of UQ_functions.hist_thresholding from a histogram.
+
+    The histogram is put in the same 25 bins between the lowest and the
+    highest value, and the threshold is the start of the first bin that is
+    higher than the bin before it after the histogram went down.
+    Input: hist, an integer array with the number of pixels of every value.
+    Returns: th, the left edge of that bin.
+    """
+    used = np.nonzero(hist)[0]
+    dtype = np.uint8 if len(hist) <= 256 else np.uint16
+    values = np.arange(used[0], used[-1] + 1, dtype=dtype)
+    bins_hist, bins = np.histogram(values, bins=25, weights=hist[used[0]:used[-1] + 1])
+    nonzero = np.nonzero(bins_hist)[0]
+    steps = np.diff(bins_hist[nonzero])
+    down = np.nonzero(steps < 0)[0]
+    if len(down):
+        up = np.nonzero(steps[down[0] + 1:] > 0)[0]
+        if len(up):
+            return bins[nonzero[down[0] + up[0] + 2]]
+    raise ValueError("the histogram has no valley, use another threshold method")
+
+def balanced(hist):
+    """The threshold of UQ_functions.balanced_hist_thresholding from a histogram.
+
+    The weights left and right of the middle are taken from the cumulative
+    sum, so every step of the balance is a constant time update.
+    Input: hist, an integer array with the number of pixels of every value.
+    Returns: i_m, the threshold.
+    """
+    used = np.nonzero(hist)[0]
+    total = [0] + np.cumsum(hist).tolist() + [int(hist.sum())] * 2
+    i_s, i_e = int(used[0]), int(used[-1])
+    i_m = (i_s + i_e)//2
+    while i_s != i_e:
+        w_l = total[i_m + 1] - total[i_s]
+        w_r = total[i_e + 1] - total[i_m + 1]
+        if w_r > w_l:
+            i_e -= 1
+            if (i_s + i_e)//2 < i_m:
+                i_m -= 1
+        else:
+            i_s += 1
+            if (i_s + i_e)//2 >= i_m:
+                i_m += 1
+    return i_m
+
+def otsu(hist):
+    """Otsu's threshold, which maximizes the variance between background and foreground.
+
+    Input: hist, an integer array with the number of pixels of every value.
+    Returns: th, the threshold.
+    """
+    hist = hist.astype(np.float64)
+    values = np.arange(len(hist))
+    w0 = np.cumsum(hist)
+    m0 = np.cumsum(hist * values)
+    total, mean_total = w0[-1], m0[-1]
+    w1 = total - w0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean_total * w0 - total * m0)**2 / (w0 * w1)
+    between[~np.isfinite(between)] = 0
+    return int(np.argmax(between))
+
+def triangle(hist):
+    """The triangle threshold, as cv2.THRESH_TRIANGLE.
+
+    Input: hist, an integer array with the number of pixels of every value.
+    Returns: th, the threshold.
+    """
+    n = len(hist)
+    used = np.nonzero(hist)[0]
+    left = max(int(used[0]) - 1, 0)
+    right = min(int(used[-1]) + 1, n - 1)
+    peak = int(np.argmax(hist))
+    flipped = peak - left < right - peak
+    if flipped:
+        hist = hist[::-1]
+        left, peak = n - 1 - right, n - 1 - peak
+    i = np.arange(left + 1, peak + 1)
+    distance = int(hist[peak]) * i + (left - peak) * hist[left + 1:peak + 1]
+    th = left
+    if len(i) and distance.max() > 0:
+        th = int(i[np.argmax(distance)])
+    th -= 1
+    return n - 1 - th if flipped else th
+
+def percentile_threshold(hist, percentile=PERCENTILE):
+    """The threshold below which the given percentage of the pixels is.
+
+    Input: hist, an integer array with the number of pixels of every value.
+    Input: percentile, a number between 0 and 100.
+    Returns: th, the lowest value with at least percentile percent of the pixels at or below it.
+    """
+    cumulative = np.cumsum(hist)
+    return int(np.searchsorted(cumulative, cumulative[-1] * percentile / 100))
+
+METHODS = {"first_valley":first_valley, "balanced":balanced, "otsu":otsu, "triangle":triangle, "percentile":percentile_threshold}
+
+#main
+if __name__ == "__main__":
+    import UQ_functions as UQF
+    img, _, _ = UQF.load_image(argv[1])
+    for method in METHODS:
+        try:
+            print(method, threshold(img, method))
+        except ValueError as error:
+            print(method, error)
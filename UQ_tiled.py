@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""Tiled processing of scans that are too large to load in memory.
+
+The element maps are memory mapped (parsed .txt/.csv files are written to
+the disk cache as .npy files, see UQ_cache.py, members of a container are
+read chunk by chunk, see UQ_container.py) and processed in bands of
+rows. The histogram for the threshold (see UQ_threshold.py) is built
+band by band. Every band is
+thresholded and labeled with open-cv, and labels of plants that cross the
+border between two bands are joined afterwards. Holes in a plant are found
+as background areas that do not touch the border of the image, so the
+plants, areas and sums are the same as those of UQ_functions.plant_labels.
+Only one band of every element map is in memory at a time.
+
+Usage:
+    results, plants = quantify_tiled(files, "K")
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import os
+import tempfile
+from sys import argv
+from pathlib import Path
+import cv2
+import numpy as np
+import UQ_cache
+import UQ_container
+import UQ_functions as UQF
+import UQ_parser
+import UQ_threshold
+
+#settings
+BAND_ROWS = 512
+MIN_AREA = UQF.MIN_AREA # fraction of the image
+
+#classes
+class ElementMaps:
+    """The memory mapped element maps of one plant.
+
+    Usage:
+        with ElementMaps(files) as maps:
+            maps.arrays["K"][0:512]
+    """
+    def __init__(self, files):
+        """Opens all files, parsing .txt and .csv files to .npy files if needed.
+
+        Input: files, a list of filepaths of the elements of one plant.
+        """
+        self.temps = []
+        self.arrays = {} # key:element, value:memory mapped array
+        self.counts = {} # key:element, value:True for count files, False for images
+        for f in files:
+            _, el = UQF.plantname_from_filename(f)
+            self.arrays[el], self.counts[el] = self.open_map(f)
+        shapes = {a.shape for a in self.arrays.values()}
+        if len(shapes) != 1:
+            self.close()
+            raise ValueError("the element maps have different shapes: {}".format(sorted(shapes)))
+        self.shape = shapes.pop()
+
+    def open_map(self, filename):
+        """Opens one element map.
+
+        Input: filename, a string with the path of a .txt, .csv or image file.
+        Returns: array, a read-only (memory mapped) numpy array, or a UQ_container.MemberArray.
+        Returns: counts, True if the array has counts, False for an image.
+        """
+        if UQ_container.is_member(filename):
+            return UQ_container.MemberArray(filename), True
+        filename = Path(filename)
+        if filename.suffix not in [".txt", ".csv"]:
+            image, array = UQF.read_image(filename)
+            if image is None:
+                raise ValueError("could not read {}".format(filename.name))
+            if array is not None:
+                return array, True
+            return image, False
+        array = UQ_cache.load_cached_array(filename)
+        if array is not None:
+            return array, True
+        sidecar = None
+        if UQ_cache.cache_enabled():
+            temp, sidecar = UQ_cache.sidecar_temp_path(filename)
+        else:
+            fd, temp = tempfile.mkstemp(suffix=".npy")
+            os.close(fd)
+            temp = Path(temp)
+        with UQ_parser.CountFile(filename, UQ_parser.count_file_skiprows(filename)) as cf:
+            out = np.lib.format.open_memmap(str(temp), mode="w+", dtype=np.uint16, shape=cf.shape)
+            cf.read(out)
+            out.flush()
+            del out
+        if sidecar is not None:
+            UQ_cache.commit_sidecar(temp, sidecar)
+            array = UQ_cache.load_cached_array(filename)
+            if array is not None:
+                return array, True
+            temp = sidecar
+        else:
+            self.temps.append(temp)
+        return np.load(str(temp), mmap_mode="r"), True
+
+    def close(self):
+        """Closes the maps and removes temporary files."""
+        self.arrays = {}
+        for temp in self.temps:
+            UQ_cache.remove_file(temp)
+        self.temps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Components:
+    """The connected components of all bands and how they are joined.
+
+    Every band adds its foreground components (8-connected, like the
+    contours of open-cv) and background components (4-connected). For
+    every component the area, the bounding box, the element sums and the
+    component directly above its topmost pixel are kept. The component
+    above the top of a hole is the plant around it, the component above the
+    top of a plant is the background around it.
+    """
+    def __init__(self, shape, elements):
+        """Creates an empty table.
+
+        Input: shape, the shape of the whole image.
+        Input: elements, a list of the elements to sum.
+        """
+        self.shape = shape
+        self.elements = elements
+        self.count = 0
+        self.pairs = []
+        self.columns = {name:[] for name in ["foreground", "area", "top", "left", "bottom", "right", "first", "above", "border"]}
+        self.sums = {el:[] for el in elements}
+        self.last_row = None
+        self.last_foreground = None
+
+    def add_band(self, start, mask, values):
+        """Labels one band and adds its components.
+
+        Input: start, the first row of the band in the image.
+        Input: mask, a uint8 array with 1 for foreground pixels of the band.
+        Input: values, a dictionary with key:element, value:the values of the band.
+        """
+        rows, cols = mask.shape
+        nf, fg, fg_stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        nb, bg, bg_stats, _ = cv2.connectedComponentsWithStats(1 - mask, connectivity=4)
+        # one local id per component: foreground first, then background
+        local = np.where(mask == 1, fg - 1, bg + (nf - 2)).astype(np.int64)
+        stats = np.concatenate([fg_stats[1:], bg_stats[1:]])
+        n = len(stats)
+        ids = self.count + local
+        # the first pixel of every component is on its top row:
+        _, first = np.unique(local, return_index=True)
+        first_row, first_col = first // cols, first % cols
+        above = np.full(n, -1, dtype=np.int64)
+        inside = first_row > 0
+        above[inside] = ids[first_row[inside] - 1, first_col[inside]]
+        if self.last_row is not None:
+            top = ~inside
+            above[top] = self.last_row[first_col[top]]
+            self.join(self.last_row, ids[0], self.last_foreground, mask[0] == 1)
+        left, top_row, width, height, area = stats.T
+        foreground = np.arange(n) < nf - 1
+        border = (left == 0) | (left + width == cols)
+        border |= (top_row == 0) & (start == 0)
+        border |= (top_row + height == rows) & (start + rows == self.shape[0])
+        for name, column in [("foreground", foreground), ("area", area), ("top", start + top_row), ("left", left),
+                             ("bottom", start + top_row + height), ("right", left + width),
+                             ("first", (start + first_row) * cols + first_col), ("above", above), ("border", border & ~foreground)]:
+            self.columns[name].append(column)
+        for el in self.elements:
+            self.sums[el].append(UQF.label_sums(local, values[el], n))
+        self.last_row = ids[-1]
+        self.last_foreground = mask[-1] == 1
+        self.count += n
+
+    def join(self, upper, lower, upper_fg, lower_fg):
+        """Stores the pairs of components that touch across the border of two bands.
+
+        Input: upper, the ids of the last row of the upper band.
+        Input: lower, the ids of the first row of the lower band.
+        Input: upper_fg, lower_fg, boolean arrays with the foreground pixels of both rows.
+        """
+        both = upper_fg & lower_fg
+        pairs = [np.stack([upper[both], lower[both]], axis=1)]
+        # foreground is 8-connected, so diagonal neighbours are joined as well
+        diag = upper_fg[:-1] & lower_fg[1:]
+        pairs.append(np.stack([upper[:-1][diag], lower[1:][diag]], axis=1))
+        diag = upper_fg[1:] & lower_fg[:-1]
+        pairs.append(np.stack([upper[1:][diag], lower[:-1][diag]], axis=1))
+        both = ~upper_fg & ~lower_fg
+        pairs.append(np.stack([upper[both], lower[both]], axis=1))
+        pairs = np.concatenate(pairs)
+        if len(pairs):
+            self.pairs.append(np.unique(pairs, axis=0))
+
+    def roots(self):
+        """Joins the components of all bands with union-find.
+
+        Returns: root, an array with the joined component of every component.
+        """
+        parent = np.arange(self.count)
+
+        def find(a):
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            return a
+
+        for pairs in self.pairs:
+            for a, b in pairs.tolist():
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                return parent
+            parent = jumped
+
+    def plants(self, min_area):
+        """Combines the components into filled plants.
+
+        Input: min_area, the minimum filled area of a plant in pixels.
+        Returns: plants, a list of dictionaries with the bounding box, area, first pixel (row * columns + column) and element sums of every plant.
+        """
+        columns = {name:np.concatenate(c) for name, c in self.columns.items()}
+        root = self.roots()
+        n = self.count
+        # the topmost pixel and the component above it of every joined component
+        order = np.lexsort((columns["first"], root))
+        is_first = np.ones(n, dtype=bool)
+        is_first[1:] = root[order][1:] != root[order][:-1]
+        above = np.full(n, -1, dtype=np.int64)
+        above[root[order][is_first]] = columns["above"][order][is_first]
+        above[above >= 0] = root[above[above >= 0]]
+        border = np.zeros(n, dtype=bool)
+        border[root[columns["border"]]] = True
+        # up is the plant a component belongs to, n is the outside of the plants
+        is_root = root == np.arange(n)
+        up = np.where(above >= 0, above, n)
+        up[border] = n
+        outside = np.append(border, True)
+        plant = is_root & columns["foreground"] & outside[up]
+        up[plant] = np.nonzero(plant)[0]
+        up = np.append(up, n)
+        while True:
+            jumped = up[up]
+            if np.array_equal(jumped, up):
+                break
+            up = jumped
+        of = up[root]
+        plant_ids = np.nonzero(plant)[0]
+        index = np.full(n + 1, -1, dtype=np.int64)
+        index[plant_ids] = np.arange(len(plant_ids))
+        labels = index[of]
+        keep = labels >= 0
+        m = len(plant_ids)
+        area = UQF.label_sums(labels[keep], columns["area"][keep], m)
+        sums = {}
+        for el in self.elements:
+            values = np.concatenate(self.sums[el])
+            sums[el] = np.zeros(m, dtype=np.int64)
+            np.add.at(sums[el], labels[keep], values[keep])
+        # the bounding box of a plant is the bounding box of its foreground
+        fg = keep & columns["foreground"]
+        box = {}
+        for name, func, fill in [("top", np.minimum, self.shape[0]), ("left", np.minimum, self.shape[1]), ("bottom", np.maximum, 0), ("right", np.maximum, 0),
+                                 ("first", np.minimum, self.shape[0] * self.shape[1])]:
+            box[name] = np.full(m, fill, dtype=np.int64)
+            func.at(box[name], labels[fg], columns[name][fg])
+        plants = []
+        for i in range(m):
+            if area[i] > min_area:
+                plants.append({"area":int(area[i]), "box":(int(box["left"][i]), int(box["top"][i]),
+                               int(box["right"][i] - box["left"][i]), int(box["bottom"][i] - box["top"][i])), "first":int(box["first"][i]),
+                               "sums":{el:int(sums[el][i]) for el in self.elements}})
+        return plants
+
+#functions
+def bands(nrows, band_rows=BAND_ROWS):
+    """Splits the rows of an image in bands.
+
+    Input: nrows, the number of rows.
+    Input: band_rows, the number of rows of a band.
+    Returns: a list of tuples (first row, last row + 1).
+    """
+    return [(start, min(start + band_rows, nrows)) for start in range(0, nrows, band_rows)]
+
+def map_max(array, band_rows=BAND_ROWS):
+    """Calculates the maximum of an array band by band.
+
+    Input: array, a (memory mapped) numpy array.
+    Returns: the maximum value.
+    """
+    return max(np.max(array[start:stop]) for start, stop in bands(len(array), band_rows))
+
+def band_img(array, start, stop, counts, max_array):
+    """Gets the 8-bit image of a band, as UQ_functions.load_image would show it.
+
+    Input: array, the element map.
+    Input: start, stop, the rows of the band.
+    Input: counts, True if array has counts which are scaled, False for an image.
+    Input: max_array, the maximum of the whole map.
+    Returns: img, a uint8 numpy array.
+    """
+    if counts:
+        return UQF.array_to_img(array[start:stop], max_array)
+    return np.asarray(array[start:stop])
+
+def tiled_threshold(array, counts, band_rows=BAND_ROWS, method=UQ_threshold.DEFAULT_METHOD):
+    """Finds the same threshold as UQ_threshold.threshold without loading the whole image.
+
+    The histogram of all 256 gray values is summed band by band.
+    Input: array, the element map.
+    Input: counts, True if array has counts which are scaled, False for an image.
+    Input: method, the threshold method.
+    Returns: th, the threshold.
+    Returns: max_array, the maximum of the element map.
+    """
+    max_array = map_max(array, band_rows) if counts else None
+    values = np.zeros(256, dtype=np.int64)
+    for start, stop in bands(len(array), band_rows):
+        values += np.bincount(band_img(array, start, stop, counts, max_array).ravel(), minlength=256)
+    return UQ_threshold.threshold_from_hist(values, method), max_array
+
+def quantify_tiled(files, element, manual=None, band_rows=BAND_ROWS, method=UQ_threshold.DEFAULT_METHOD):
+    """Masks and quantifies all elements of one plant band by band.
+
+    Input: files, a list of filepaths with all elements of the plant.
+    Input: element, the element used to create the mask, for example "K".
+    Input: manual, a threshold value or None to find the threshold automatically.
+    Input: band_rows, the number of rows processed at a time.
+    Input: method, the threshold method if manual is None, see UQ_threshold.py.
+    Returns: results, a list of tuples with (element, index, sum) like UQ_functions.area_contours.
+    Returns: plants, a list of dictionaries with the bounding box (x, y, width, height), filled area, first pixel and sums of every plant.
+    """
+    with ElementMaps(files) as maps:
+        if element not in maps.arrays:
+            raise ValueError("element {} not found".format(element))
+        array, counts = maps.arrays[element], maps.counts[element]
+        if manual is None:
+            th, max_array = tiled_threshold(array, counts, band_rows, method)
+        else:
+            th, max_array = manual, map_max(array, band_rows) if counts else None
+        elements = list(maps.arrays)
+        components = Components(maps.shape, elements)
+        for start, stop in bands(maps.shape[0], band_rows):
+            # the same mask as cv2.threshold(img, th, 255, cv2.THRESH_BINARY) for an 8-bit image
+            mask = (band_img(array, start, stop, counts, max_array) > np.floor(th)).astype(np.uint8)
+            components.add_band(start, mask, {el:maps.arrays[el][start:stop] for el in elements})
+    rows, cols = maps.shape
+    plants = components.plants(int(rows * cols * MIN_AREA))
+    # the same order as UQ_functions.plant_labels
+    plants.sort(key=lambda p:(UQF.box_precedence(p["box"][0], p["box"][1], cols), -p["first"]))
+    results = []
+    for i, p in enumerate(plants):
+        for el in elements:
+            results.append((el, i, p["sums"][el]))
+    return results, plants
+
+#main
+if __name__ == "__main__":
+    results, _ = quantify_tiled(argv[2:], argv[1])
+    for el, i, total in results:
+        print(i, el, total)
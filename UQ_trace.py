@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Opt-in timing and memory instrumentation of UQ_functions.py
+
+When enabled, the pipeline functions in UQ_functions are replaced by
+wrappers that record the wall time, the peak allocated memory (with
+tracemalloc) and the arrays going in and out of every call. When disabled
+the original functions are put back, so there is no overhead at all.
+
+The records can be written as a JSON lines log or as a Chrome trace
+(open it in chrome://tracing or https://ui.perfetto.dev).
+Set the environment variable UQ_TRACE to a filename to enable the
+instrumentation when this module is imported (UQ_GUI_code.py and
+UQ_batch.py do) and write the trace when the program exits.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+#settings
+INSTRUMENTED = ["load_image", "mask_from_k", "mask_from_threshold", "plant_labels", "area_contours", "contour_statistics"]
+
+records = []
+_originals = {}
+_local = threading.local()
+_lock = threading.Lock()
+_memory = False
+
+#functions
+def enabled():
+    """Returns True if the instrumentation is enabled."""
+    return bool(_originals)
+
+def enable(memory=True, names=INSTRUMENTED):
+    """Replaces the pipeline functions in UQ_functions by instrumented wrappers.
+
+    Input: memory, if True the peak memory is measured with tracemalloc (slower).
+    Input: names, the names of the functions in UQ_functions to instrument.
+    """
+    global _memory
+    import UQ_functions as UQF # not at the top, so the GUI can import this module before numpy
+    if enabled():
+        return
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    for name in names:
+        fn = getattr(UQF, name)
+        _originals[name] = fn
+        setattr(UQF, name, instrument(fn, name))
+
+def disable():
+    """Puts the original functions back in UQ_functions, the records are kept."""
+    import UQ_functions as UQF
+    for name, fn in _originals.items():
+        setattr(UQF, name, fn)
+    _originals.clear()
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def clear():
+    """Removes all records."""
+    with _lock:
+        del records[:]
+
+def instrument(fn, name):
+    """Wraps a function so every call is recorded.
+
+    Input: fn, the function to wrap.
+    Input: name, the name of the stage in the records.
+    Returns: wrapper, the instrumented function.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        measuring = _memory and tracemalloc.is_tracing()
+        if measuring:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        stack.append(0)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            child_peak = stack.pop()
+            record = {"name":name, "start":start, "duration":duration,
+                      "pid":os.getpid(), "tid":threading.get_ident()}
+            if measuring:
+                _, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, child_peak)
+                record["peak_bytes"] = max(0, peak - current)
+                if stack:
+                    stack[-1] = max(stack[-1], peak)
+        record["inputs"] = describe_arrays(args)
+        record["outputs"] = describe_arrays(result if isinstance(result, tuple) else (result,))
+        with _lock:
+            records.append(record)
+        return result
+    return wrapper
+
+def run_traced(fn, *args):
+    """Runs a function with the instrumentation enabled and returns the new records.
+
+    Meant for worker processes, which cannot add to the records of the main process.
+    Input: fn, the function to run.
+    Input: args, the arguments of the function.
+    Returns: result, the return value of fn.
+    Returns: new_records, a list with the records of this call.
+    """
+    enable()
+    clear()
+    result = fn(*args)
+    with _lock:
+        new_records = list(records)
+    return result, new_records
+
+def describe_arrays(values):
+    """Describes the numpy arrays among values.
+
+    Arrays are recognized by their shape, dtype and nbytes, so numpy is
+    not imported by this module.
+    Input: values, a tuple of values.
+    Returns: a list of dictionaries with the shape, dtype and size of every array, and the length of every list.
+    """
+    arrays = []
+    for v in values:
+        if all(hasattr(v, a) for a in ("shape", "dtype", "nbytes")):
+            arrays.append({"shape":list(v.shape), "dtype":str(v.dtype), "nbytes":int(v.nbytes)})
+        elif isinstance(v, list):
+            arrays.append({"len":len(v)})
+    return arrays
+
+def summary():
+    """Summarizes the records per stage.
+
+    Returns: stages, a dictionary with key:stage name, value:dictionary with calls, total_s, max_s, peak_bytes and bytes_in.
+    """
+    stages = {}
+    with _lock:
+        current = list(records)
+    for r in current:
+        s = stages.setdefault(r["name"], {"calls":0, "total_s":0.0, "max_s":0.0, "peak_bytes":0, "bytes_in":0})
+        s["calls"] += 1
+        s["total_s"] += r["duration"]
+        s["max_s"] = max(s["max_s"], r["duration"])
+        s["peak_bytes"] = max(s["peak_bytes"], r.get("peak_bytes", 0))
+        s["bytes_in"] += sum(a.get("nbytes", 0) for a in r["inputs"])
+    return stages
+
+def summary_lines():
+    """Formats the summary as text lines, for example for the GUI.
+
+    Returns: lines, a list of strings, one per stage.
+    """
+    lines = []
+    for name, s in sorted(summary().items(), key=lambda item:-item[1]["total_s"]):
+        lines.append("{}: {} calls, {:.3f} s total, {:.3f} s max, peak {:.1f} MB".format(
+            name, s["calls"], s["total_s"], s["max_s"], s["peak_bytes"] / 1024**2))
+    return lines
+
+def write_log(filename):
+    """Writes all records as JSON lines.
+
+    Input: filename, the path of the log file.
+    """
+    with _lock:
+        current = list(records)
+    with open(filename, "w") as stream:
+        for r in current:
+            stream.write(json.dumps(r) + "\n")
+
+def write_chrome_trace(filename):
+    """Writes all records in the Chrome trace event format.
+
+    Input: filename, the path of the JSON file.
+    """
+    with _lock:
+        current = list(records)
+    events = []
+    for r in current:
+        args = {k:r[k] for k in ("peak_bytes", "inputs", "outputs") if k in r}
+        events.append({"name":r["name"], "cat":"UQ_functions", "ph":"X", "pid":r["pid"], "tid":r["tid"],
+                       "ts":r["start"] * 1e6, "dur":r["duration"] * 1e6, "args":args})
+    with open(filename, "w") as stream:
+        json.dump({"traceEvents":events, "displayTimeUnit":"ms"}, stream)
+
+def write(filename):
+    """Writes the records as a JSON lines log (.jsonl) or a Chrome trace (other suffixes).
+
+    Input: filename, the path of the output file.
+    """
+    if str(filename).endswith(".jsonl"):
+        write_log(filename)
+    else:
+        write_chrome_trace(filename)
+
+#main
+if os.environ.get("UQ_TRACE"):
+    enable()
+    atexit.register(write, os.environ["UQ_TRACE"])
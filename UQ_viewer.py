@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Zoom and pan viewer for large element images.
+
+An image is shown from a pyramid: the full resolution image and versions
+that are every time half as large. When the view is zoomed out a smaller
+level is drawn, and only the tiles of that level that are visible are
+converted to pixmaps, so a large scan does not have to be scaled on every
+repaint. The pyramid is built with numpy and open-cv, so it can be built
+in a background thread; the pixmaps are made in the GUI thread when they
+are first drawn. numpy and open-cv are imported on first use, the main
+window creates its views before they are needed.
+
+Usage:
+    view = ZoomView()
+    view.set_pyramid(build_pyramid(img))
+
+Mouse wheel: zoom around the mouse. Drag: pan. Double click: fit the image in the view.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+from collections import OrderedDict
+from PyQt5 import QtWidgets, QtGui, QtCore
+
+#settings
+TILE = 256 # width and height of the tiles in pixels
+MAX_TILES = 1024 # number of tile pixmaps kept per image, 64 MB for 8-bit tiles
+MAX_ZOOM = 32 # largest number of screen pixels per image pixel
+
+#classes
+class PyramidItem(QtWidgets.QGraphicsItem):
+    """Graphics item that draws the visible tiles of the right pyramid level.
+
+    The item has the size of the full resolution image, so scene
+    coordinates are pixels of the original image at every zoom level.
+    """
+    def __init__(self, levels, parent=None):
+        """Creates the item.
+
+        Input: levels, a list of uint8 arrays made with build_pyramid.
+        """
+        super().__init__(parent)
+        self.levels = levels
+        rows, cols = levels[0].shape[:2]
+        # the size of one pixel of every level in pixels of the full image:
+        self.factors = [(cols / level.shape[1], rows / level.shape[0]) for level in levels]
+        self.tiles = OrderedDict() # key:(level, tile row, tile column), value:QPixmap
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        """The rectangle of the full resolution image."""
+        rows, cols = self.levels[0].shape[:2]
+        return QtCore.QRectF(0, 0, cols, rows)
+
+    def paint(self, painter, option, widget=None):
+        """Draws the tiles that are in the exposed rectangle."""
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = choose_level(self.factors, scale)
+        fx, fy = self.factors[level]
+        rows, cols = self.levels[level].shape[:2]
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        first_row, last_row = int(exposed.top() / fy) // TILE, min(int(exposed.bottom() / fy), rows - 1) // TILE
+        first_col, last_col = int(exposed.left() / fx) // TILE, min(int(exposed.right() / fx), cols - 1) // TILE
+        for tile_row in range(first_row, last_row + 1):
+            for tile_col in range(first_col, last_col + 1):
+                pixmap = self.tile(level, tile_row, tile_col)
+                target = QtCore.QRectF(tile_col * TILE * fx, tile_row * TILE * fy, pixmap.width() * fx, pixmap.height() * fy)
+                painter.drawPixmap(target, pixmap, QtCore.QRectF(pixmap.rect()))
+
+    def tile(self, level, tile_row, tile_col):
+        """Gets the pixmap of a tile, it is made the first time it is drawn.
+
+        Input: level, the pyramid level.
+        Input: tile_row, tile_col, the position of the tile in tiles.
+        Returns: pixmap, a QPixmap of at most TILE x TILE pixels.
+        """
+        key = (level, tile_row, tile_col)
+        pixmap = self.tiles.pop(key, None)
+        if pixmap is None:
+            import numpy as np
+            img = self.levels[level]
+            part = np.ascontiguousarray(img[tile_row * TILE:(tile_row + 1) * TILE, tile_col * TILE:(tile_col + 1) * TILE])
+            pixmap = QtGui.QPixmap.fromImage(to_qimage(part))
+            if len(self.tiles) >= MAX_TILES:
+                self.tiles.popitem(last=False)
+        self.tiles[key] = pixmap
+        return pixmap
+
+class ZoomView(QtWidgets.QGraphicsView):
+    """Graphics view with zooming on the mouse wheel and panning by dragging.
+
+    The image fits in the view until the user zooms, double click to fit it again.
+    """
+    def __init__(self, parent=None):
+        """Creates an empty view."""
+        super().__init__(parent)
+        self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
+        self.setResizeAnchor(QtWidgets.QGraphicsView.AnchorViewCenter)
+        self.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
+        self.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        self.fitted = True
+        self.path = None
+        self.loaded = False
+
+    def show_text(self, text):
+        """Shows a text instead of an image, for example while the image is loaded.
+
+        Input: text, a string.
+        """
+        scene = QtWidgets.QGraphicsScene(self)
+        scene.addText(text)
+        self.replace_scene(scene)
+        self.resetTransform()
+        self.fitted = False
+
+    def set_pyramid(self, levels):
+        """Shows an image pyramid made with build_pyramid.
+
+        Input: levels, a list of uint8 arrays.
+        """
+        scene = QtWidgets.QGraphicsScene(self)
+        scene.addItem(PyramidItem(levels))
+        self.replace_scene(scene)
+        self.fit()
+
+    def replace_scene(self, scene):
+        """Shows a new scene and deletes the previous scene of this view.
+
+        Input: scene, a QGraphicsScene.
+        """
+        old = self.scene()
+        self.setScene(scene)
+        if old is not None and old.parent() is self:
+            old.deleteLater()
+
+    def fit(self):
+        """Fits the whole scene in the view."""
+        if self.scene() is not None:
+            self.fitInView(self.scene().sceneRect(), QtCore.Qt.KeepAspectRatio)
+        self.fitted = True
+
+    def wheelEvent(self, event):
+        """Zooms in or out around the mouse."""
+        factor = 1.25 ** (event.angleDelta().y() / 120)
+        if self.transform().m11() * factor > MAX_ZOOM:
+            factor = MAX_ZOOM / self.transform().m11()
+        self.scale(factor, factor)
+        self.fitted = False
+
+    def mouseDoubleClickEvent(self, event):
+        """Fits the image in the view again."""
+        self.fit()
+
+    def resizeEvent(self, event):
+        """Keeps the image fitted when the view is resized, unless the user zoomed."""
+        super().resizeEvent(event)
+        if self.fitted:
+            self.fit()
+
+#functions
+def build_pyramid(img, min_size=TILE):
+    """Builds the levels of an image pyramid.
+
+    Every level is half as large as the previous one, averaged with
+    cv2.INTER_AREA, until it fits in min_size x min_size pixels.
+    Input: img, a uint8 numpy array.
+    Input: min_size, the size at which no smaller level is made.
+    Returns: levels, a list of uint8 arrays, levels[0] is img.
+    """
+    import cv2
+    levels = [img]
+    while max(levels[-1].shape[:2]) > min_size:
+        rows, cols = levels[-1].shape[:2]
+        levels.append(cv2.resize(levels[-1], ((cols + 1) // 2, (rows + 1) // 2), interpolation=cv2.INTER_AREA))
+    return levels
+
+def choose_level(factors, scale):
+    """Chooses the smallest level that still has a pixel for every screen pixel.
+
+    Input: factors, a list with the (x, y) size of a pixel of every level in full image pixels.
+    Input: scale, the number of screen pixels per full image pixel.
+    Returns: level, the index of the level.
+    """
+    level = 0
+    for i, (fx, fy) in enumerate(factors):
+        if max(fx, fy) * scale <= 1:
+            level = i
+    return level
+
+def to_qimage(img):
+    """Converts a contiguous uint8 array to a QImage that owns its data.
+
+    Input: img, a 2D uint8 numpy array.
+    Returns: a grayscale QImage.
+    """
+    return QtGui.QImage(img.data, img.shape[1], img.shape[0], img.strides[0], QtGui.QImage.Format_Grayscale8).copy()
+
+def load_pyramid(path):
+    """Loads an element file and builds its pyramid, used in a background thread.
+
+    Input: path, a string with the path of the element file.
+    Returns: levels, see build_pyramid.
+    """
+    import UQ_functions as UQF
+    img, _, _ = UQF.load_image(path)
+    return build_pyramid(img)
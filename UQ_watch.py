@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Watch a directory and quantify every plant when all its element files have arrived.
+
+The instrument writes <plant> - <element>.txt files into a directory over
+hours. This program polls the directory, waits until a file has not
+changed for --settle seconds (judged from its modification time when it
+is first seen), groups the files per plant with one file per element
+(see UQ_catalog.SUFFIX_ORDER) and quantifies a plant like
+UQ_batch.py does as soon as it is complete: when it has all elements
+given with --elements, or, without --elements, when it has the mask
+element and no file of the plant changed for --quiet seconds. The plants
+are quantified in a pool of worker processes and the rows are appended
+to the output csv file as soon as a plant is done.
+
+The files of every handled plant are recorded with their size and
+modification time in a state file next to the output, so after a restart
+only new plants and plants whose files changed are quantified. A plant
+that failed (for example because the store was locked or a file was
+still being copied) is quantified again once after every restart, and
+again during a run when one of its files changes.
+
+Usage: UQ_watch.py <directory> [--elements K,Ca,Zn] [--element K] [--manual 40 | --method otsu] [--workers 4] [--output results.csv] [--interval 5] [--settle 10] [--once]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from pathlib import Path
+import UQ_batch
+import UQ_catalog
+import UQ_functions as UQF
+import UQ_threshold
+
+#settings
+STATE_VERSION = 1
+STATE_SUFFIX = ".state.json"
+
+#classes
+class Watcher:
+    """Keeps track of the files in a watched directory and of the handled plants.
+
+    files: key:filename, value:(signature, time the signature was first seen)
+    state: key:plantname, value:dictionary with the files (filename:signature) of the last run, status and error
+    """
+    def __init__(self, dirname, output, element="K", manual=None, method=UQ_threshold.DEFAULT_METHOD, elements=None,
+                 settle=10, quiet=60, statistics=False, store=True, state_file=None, log=sys.stderr):
+        """Creates a watcher and reads the state of earlier runs.
+
+        Input: dirname, the directory to watch.
+        Input: output, the csv file to append the results to.
+        Input: element, manual, method, statistics, store, see UQ_batch.quantify_plant.
+        Input: elements, a list with the elements of a complete plant or None, see is_complete.
+        Input: settle, the number of seconds a file must be unchanged before it is used.
+        Input: quiet, without elements, the number of seconds no file of a plant may change before it is complete.
+        Input: state_file, the file with the handled plants, by default <output>.state.json.
+        Input: log, the stream to write progress to.
+        """
+        self.dirname = Path(dirname)
+        self.output = Path(output)
+        self.element = element
+        self.manual = manual
+        self.method = method
+        self.elements = set(elements) if elements else None
+        self.settle = settle
+        self.quiet = quiet
+        self.statistics = statistics
+        self.store = store
+        self.state_file = Path(state_file) if state_file else self.output.with_name(self.output.name + STATE_SUFFIX)
+        self.log = log
+        self.files = {}
+        self.ignored = set() # the reported files of an element that has another, preferred file
+        self.running = {} # key:future, value:(plantname, signatures of its files)
+        self.failed = set() # the plants that failed during this run, they are not retried until a file changes
+        self.state = load_state(self.state_file)
+
+    def scan(self, now=None):
+        """Lists the valid files of the directory and remembers since when they are unchanged.
+
+        A new file counts as unchanged since its modification time, a file
+        that changes while it is watched as unchanged since the scan that
+        saw the change.
+        Input: now, the time.monotonic() of the scan.
+        """
+        now = time.monotonic() if now is None else now
+        wall = time.time()
+        current = {}
+        with os.scandir(str(self.dirname)) as entries:
+            for entry in entries:
+                if UQF.is_valid_filename(entry.name) and entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except OSError: # removed since the listing
+                        continue
+                    signature = [stat.st_size, stat.st_mtime_ns]
+                    previous = self.files.get(entry.name)
+                    if previous is not None and previous[0] == signature:
+                        current[entry.name] = previous
+                    elif previous is not None:
+                        current[entry.name] = (signature, now)
+                    else:
+                        current[entry.name] = (signature, now - max(0.0, wall - stat.st_mtime))
+        self.files = current
+
+    def plants(self):
+        """Groups the files per plant with one file per element, like UQ_batch.plant_groups.
+
+        The other files of an element are reported once and not used.
+        Returns: plantdict, a dictionary with key:plantname, value:dictionary with key:filename, value:(signature, since).
+        """
+        catalog = UQ_catalog.Catalog()
+        catalog.add_files(sorted(self.files))
+        for used, ignored in catalog.duplicates:
+            if ignored not in self.ignored:
+                print("Ignored {}, using {}".format(ignored, used), file=self.log, flush=True)
+                self.ignored.add(ignored)
+        return {plantname:{name:self.files[name] for name in catalog.plant_paths(plantname)} for plantname in catalog.plants()}
+
+    def is_complete(self, files, now):
+        """Checks if all files of a plant are there and unchanged for long enough.
+
+        Input: files, a dictionary with key:filename, value:(signature, since) of one plant.
+        Input: now, the time.monotonic() of the last scan.
+        Returns: True if the plant can be quantified.
+        """
+        if any(now - since < self.settle for _, since in files.values()):
+            return False
+        elements = {UQF.plantname_from_filename(name)[1] for name in files}
+        if self.elements is not None:
+            return self.elements <= elements
+        return self.element in elements and now - max(since for _, since in files.values()) >= self.quiet
+
+    def ready(self, now):
+        """Finds the complete plants that are not handled yet and not running.
+
+        A plant is handled when the files of the last run are unchanged and
+        the run was done or failed during this run of the watcher.
+        Input: now, the time.monotonic() of the last scan.
+        Returns: a list of (plantname, files), files is a dictionary with key:filename, value:signature.
+        """
+        running = {plantname for plantname, _ in self.running.values()}
+        found = []
+        for plantname, files in sorted(self.plants().items()):
+            if plantname in running or not self.is_complete(files, now):
+                continue
+            signatures = {name:signature for name, (signature, _) in files.items()}
+            handled = self.state.get(plantname)
+            if handled is not None and handled["files"] == signatures and (handled["status"] == "done" or plantname in self.failed):
+                continue
+            found.append((plantname, signatures))
+        return found
+
+    def submit(self, pool, now=None):
+        """Starts the quantification of all complete plants.
+
+        Input: pool, a ProcessPoolExecutor.
+        Input: now, the time.monotonic() of the last scan.
+        Returns: the number of started plants.
+        """
+        found = self.ready(time.monotonic() if now is None else now)
+        for plantname, signatures in found:
+            if plantname in self.state:
+                reason = "files changed" if self.state[plantname]["files"] != signatures else "failed before"
+                print("{}: {}, quantifying again".format(plantname, reason), file=self.log, flush=True)
+            files = sorted(str(self.dirname / name) for name in signatures)
+            future = pool.submit(UQ_batch.run_plant, plantname, files, self.element, self.manual, False, self.method, self.statistics, self.store)
+            self.running[future] = (plantname, signatures)
+        return len(found)
+
+    def collect(self, timeout=None):
+        """Waits for running plants and appends their results.
+
+        Input: timeout, the number of seconds to wait for a plant to finish, None waits for all.
+        Returns: the number of finished plants.
+        """
+        if not self.running:
+            return 0
+        when = FIRST_COMPLETED if timeout is not None else ALL_COMPLETED
+        done, _ = wait(list(self.running), timeout=timeout, return_when=when)
+        for future in done:
+            plantname, signatures = self.running.pop(future)
+            _, rows, error = future.result()
+            self.finish(plantname, signatures, rows, error)
+        return len(done)
+
+    def finish(self, plantname, signatures, rows, error):
+        """Appends the rows of a finished plant and records it in the state file.
+
+        Input: plantname, the name of the plant.
+        Input: signatures, a dictionary with key:filename, value:signature of the quantified files.
+        Input: rows, the rows of UQ_batch.run_plant.
+        Input: error, None or the error message of a failed plant.
+        """
+        if error is None:
+            append_rows(self.output, rows, UQ_batch.RESULT_HEADER + UQ_batch.STATISTICS if self.statistics else UQ_batch.RESULT_HEADER)
+            msg = "{} contours".format(len({row[1] for row in rows}))
+        else:
+            msg = "failed, {}".format(error)
+            self.failed.add(plantname)
+        print("{}: {}".format(plantname, msg), file=self.log, flush=True)
+        self.state[plantname] = {"files":signatures, "status":"failed" if error else "done", "error":error,
+                                 "time":time.strftime("%Y-%m-%dT%H:%M:%S")}
+        save_state(self.state_file, self.state)
+
+    def run(self, workers=None, interval=5, once=False):
+        """Watches the directory until interrupted.
+
+        Input: workers, the number of worker processes, by default the number of cpus.
+        Input: interval, the number of seconds between two scans.
+        Input: once, if True the complete plants are quantified once and the function returns.
+        """
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as pool:
+            if once:
+                self.scan()
+                self.submit(pool)
+                self.collect()
+                return
+            print("Watching {} every {} s".format(self.dirname, interval), file=self.log, flush=True)
+            while True:
+                self.scan()
+                self.submit(pool)
+                if self.running:
+                    self.collect(timeout=interval)
+                else:
+                    time.sleep(interval)
+
+#functions
+def load_state(filename):
+    """Reads the handled plants of earlier runs.
+
+    Input: filename, the Path of the state file.
+    Returns: state, a dictionary with key:plantname, value:dictionary with files, status, error and time.
+    """
+    try:
+        with filename.open() as stream:
+            data = json.load(stream)
+    except FileNotFoundError:
+        return {}
+    if data.get("version") != STATE_VERSION:
+        raise ValueError("{} is not a state file of this version".format(filename))
+    return data["plants"]
+
+def save_state(filename, state):
+    """Writes the handled plants to a temporary file that is then renamed.
+
+    Input: filename, the Path of the state file.
+    Input: state, see load_state.
+    """
+    temp = filename.with_name(filename.name + ".tmp")
+    with temp.open("w") as stream:
+        json.dump({"version":STATE_VERSION, "plants":state}, stream, indent=1, sort_keys=True)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(str(temp), str(filename))
+
+def append_rows(filename, rows, header):
+    """Appends rows to a csv file, the header is written when the file is new.
+
+    The rows are flushed to disk before the plant is recorded as handled,
+    so an interrupted run never records a plant without its rows.
+    Input: filename, the Path of the csv file.
+    Input: rows, a list of tuples.
+    Input: header, a list with the column names.
+    """
+    new = not filename.exists() or filename.stat().st_size == 0
+    with filename.open("a", newline="") as stream:
+        writer = csv.writer(stream)
+        if new:
+            writer.writerow(header)
+        writer.writerows(rows)
+        stream.flush()
+        os.fsync(stream.fileno())
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Quantify the plants in a directory as soon as all their element files have arrived.")
+    parser.add_argument("directory", help="directory the instrument writes <plantname> - <element>.<suffix> files to")
+    parser.add_argument("--elements", default=None, help="comma separated elements of a complete plant, for example K,Ca,Zn")
+    parser.add_argument("-e", "--element", default="K", help="element used to create the mask (default: K)")
+    parser.add_argument("-m", "--manual", type=int, default=None, help="manual threshold (0-255) instead of an automatic threshold")
+    parser.add_argument("--method", default=UQ_threshold.DEFAULT_METHOD, choices=list(UQ_threshold.METHODS), help="automatic threshold method (default: first_valley)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    parser.add_argument("-o", "--output", default="UQ_results.csv", help="csv file to append the results to")
+    parser.add_argument("--state", default=None, help="file with the handled plants (default: <output>{})".format(STATE_SUFFIX))
+    parser.add_argument("--interval", type=float, default=5, help="seconds between two scans of the directory (default: 5)")
+    parser.add_argument("--settle", type=float, default=10, help="seconds a file must be unchanged before it is used (default: 10)")
+    parser.add_argument("--quiet", type=float, default=60, help="without --elements, seconds no file of a plant may change before it is complete (default: 60)")
+    parser.add_argument("--once", action="store_true", help="quantify the complete plants once and stop instead of watching")
+    parser.add_argument("--no-store", dest="store", action="store_false", help="do not read or write the result store")
+    parser.add_argument("--statistics", action="store_true", help="also write the area, mean, min, max, std and percentiles of every contour")
+    args = parser.parse_args(args)
+    if args.elements and args.element not in args.elements.split(","):
+        parser.error("the mask element {} is not in --elements".format(args.element))
+    return args
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    watcher = Watcher(args.directory, args.output, args.element, args.manual, args.method,
+                      args.elements.split(",") if args.elements else None, args.settle, args.quiet,
+                      args.statistics, args.store, args.state)
+    try:
+        watcher.run(args.workers, args.interval, args.once)
+    except KeyboardInterrupt:
+        print("Stopped", file=sys.stderr)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Background workers to keep UQ_GUI_code.py responsive.
+
+Loading, masking and quantification run on a QThreadPool. A worker sends
+its result back to the GUI thread with a signal, so the GUI can update
+its widgets safely.
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import traceback
+from PyQt5 import QtCore
+
+#classes
+class WorkerSignals(QtCore.QObject):
+    '''Signals of a Worker.
+
+    result: emitted with the return value of the function.
+    error: emitted with the error message if the function raised an error.
+    done: emitted when the worker is finished, also after an error.
+    '''
+    result = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+    done = QtCore.pyqtSignal()
+
+class Worker(QtCore.QRunnable):
+    '''Runs a function with arguments on a QThreadPool.'''
+    def __init__(self, fn, *args):
+        '''Creates the worker.
+
+        Input: fn, the function to run.
+        Input: args, the arguments of the function.
+        '''
+        QtCore.QRunnable.__init__(self)
+        self.fn = fn
+        self.args = args
+        self.signals = WorkerSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        '''Cancels the worker, the function is not started anymore and no result is sent.'''
+        self.cancelled = True
+
+    def run(self):
+        '''Runs the function, runs on a thread of the pool.'''
+        if not self.cancelled:
+            try:
+                result = self.fn(*self.args)
+            except Exception as error:
+                traceback.print_exc()
+                if not self.cancelled:
+                    self.signals.error.emit("{}: {}".format(type(error).__name__, error))
+            else:
+                if not self.cancelled:
+                    self.signals.result.emit(result)
+        self.signals.done.emit()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Benchmarks of the UQ_functions pipeline on synthetic scans.
+
+Every stage of the pipeline (loading, thresholding, labeling the plants and
+quantification) and the whole quantification of a plant are timed at
+several scan sizes. The result store is only used by the "store hit"
+stage, with a database in the temporary directory, so the timings do not
+depend on (or change) the store of the user. The peak memory of every stage is measured with
+tracemalloc in a separate run, so it does not influence the timings. The
+results are written as JSON, so two runs can be compared.
+
+Usage:
+    bench_pipeline.py [--scales small,medium] [--format txt] [--repeat 3] [--output results.json]
+    bench_pipeline.py --compare old.json new.json
+    bench_pipeline.py --verify [--scales small] [--format txt,csv] [--gains 3,11,20]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import UQ_batch
+import UQ_cache
+import UQ_functions as UQF
+import UQ_stack
+import UQ_store
+import UQ_threshold
+import synthetic
+
+#settings
+SCALES = {
+    "small":{"size":500, "plants":4, "elements":3},
+    "medium":{"size":1000, "plants":12, "elements":4},
+    "large":{"size":2000, "plants":40, "elements":6},
+    "xlarge":{"size":4000, "plants":80, "elements":6},
+}
+
+#functions
+def measure(fn, repeat, setup=None):
+    """Times a function and measures its peak memory.
+
+    Input: fn, the function to benchmark, called without arguments.
+    Input: repeat, the number of timed runs.
+    Input: setup, an optional function that is called (untimed) before every run.
+    Returns: a dictionary with the timings in seconds and the peak memory in bytes.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"repeat":repeat, "min_s":min(times), "median_s":float(np.median(times)),
+            "mean_s":float(np.mean(times)), "peak_bytes":peak}
+
+def no_cache():
+    """Disables the disk cache and the result store and empties the memory cache, so every load parses the file."""
+    UQ_cache.set_cache_dir("")
+    UQ_store.set_store("")
+    UQ_cache.image_cache.clear()
+
+def benchmark_scale(name, scale, fmt, repeat, workdir):
+    """Benchmarks all stages on one synthetic scan.
+
+    Input: name, the name of the scale.
+    Input: scale, a dictionary with the size, number of plants and number of elements.
+    Input: fmt, the file format "txt", "csv" or "tif".
+    Input: repeat, the number of timed runs per stage.
+    Input: workdir, a directory for the synthetic files, the disk cache and the result store.
+    Returns: records, a list of dictionaries with the results per stage.
+    """
+    elements = synthetic.ELEMENTS[:scale["elements"]]
+    maps, _ = synthetic.make_scan(scale["size"], scale["plants"], elements, seed=1)
+    files = synthetic.write_scan(Path(workdir) / name, "Bench {}".format(name), maps, fmt)
+    kfile = files[0]
+    cache_dir = str(Path(workdir) / "cache")
+    store_file = str(Path(workdir) / "results.sqlite")
+
+    def disk_cache_only():
+        UQ_cache.set_cache_dir(cache_dir)
+        UQ_cache.image_cache.clear()
+
+    def warm():
+        UQ_cache.set_cache_dir(cache_dir)
+        UQF.load_image(kfile)
+
+    def store_hit():
+        warm()
+        UQ_store.set_store(store_file)
+        UQ_batch.quantify_plant(name, files, elements[0])
+
+    disk_cache_only()
+    for f in files:
+        UQF.load_image(f)
+    img, _, _ = UQF.load_image(kfile)
+    th = UQF.hist_thresholding(img)
+    _, binary = cv2.threshold(img, th, 255, cv2.THRESH_BINARY)
+    con = UQF.plant_labels(binary)
+    contours = UQF.contouring(binary)
+    stages = [
+        ("load_image cold", lambda: UQF.load_image(kfile), no_cache),
+        ("load_image disk cache", lambda: UQF.load_image(kfile), disk_cache_only),
+        ("load_image memory cache", lambda: UQF.load_image(kfile), warm),
+        ("load elements one by one", lambda: list(UQF.element_arrays(files)), no_cache),
+        ("PlantStack.load", lambda: UQ_stack.PlantStack.load(files), no_cache),
+        ("hist_thresholding", lambda: UQF.hist_thresholding(img), None),
+        ("balanced_hist_thresholding", lambda: UQF.balanced_hist_thresholding(UQF.create_hist(img)), None),
+        ("threshold histogram", lambda: UQ_threshold.histogram(img), UQ_threshold.clear_cache),
+    ] + [
+        ("threshold " + method, lambda method=method: UQ_threshold.threshold(img, method), None) for method in UQ_threshold.METHODS
+    ] + [
+        ("plant_labels", lambda: UQF.plant_labels(binary), None),
+        ("contouring and create_mask", lambda: UQF.create_mask(img, UQF.contouring(binary)), None),
+        ("area_contours of contours", lambda: UQF.area_contours(contours, files), warm),
+        ("area_contours", lambda: UQF.area_contours(con, files), warm),
+        ("contour_statistics", lambda: UQF.contour_statistics(con, files), warm),
+        ("quantify plant cold", lambda: UQ_batch.quantify_plant(name, files, elements[0], store=False), no_cache),
+        ("quantify plant warm", lambda: UQ_batch.quantify_plant(name, files, elements[0], store=False), warm),
+        ("quantify plant store hit", lambda: UQ_batch.quantify_plant(name, files, elements[0]), store_hit),
+    ]
+    records = []
+    for stage, fn, setup in stages:
+        record = {"scale":name, "format":fmt, "stage":stage, "size":scale["size"],
+                  "plants":scale["plants"], "elements":scale["elements"], "contours":len(con)}
+        record.update(measure(fn, repeat, setup))
+        records.append(record)
+        print("{:8} {:28} {:9.4f} s {:9.1f} MB".format(name, stage, record["median_s"], record["peak_bytes"] / 1024**2), flush=True)
+    UQ_store.set_store("")
+    return records
+
+def verify(size, gain, fmt, workdir):
+    """Compares the pipeline with an exact reference on synthetic high-count scans.
+
+    The reference scales with python integers and sums every plant over the
+    filled outer contour that open-cv finds for it, the pipeline must give
+    bit-identical results.
+    Input: size, the width and height of the scan.
+    Input: gain, the factor for the concentration levels, see synthetic.element_map.
+    Input: fmt, the file format "txt", "csv" or "tif".
+    Input: workdir, a directory for the synthetic files.
+    Returns: failures, a list of strings that describe the differences.
+    """
+    elements = synthetic.ELEMENTS[:4]
+    maps, _ = synthetic.make_scan(size, 12, elements, seed=2, gain=gain)
+    files = synthetic.write_scan(Path(workdir) / "verify", "Verify {}".format(fmt), maps, fmt)
+    no_cache()
+    failures = []
+    arrays = {}
+    for f in files:
+        img, _, array = UQF.load_image(f)
+        el = UQF.plantname_from_filename(f)[1]
+        arrays[el] = array if array is not None else img
+        if array is not None:
+            top = int(array.max())
+            exact = np.array([v * 255 // top for v in array.ravel().tolist()], dtype=np.uint8).reshape(array.shape)
+            if not np.array_equal(img, exact):
+                failures.append("{}: 8-bit image differs in {} pixels".format(el, int(np.count_nonzero(img != exact))))
+    img, _, _ = UQF.load_image(files[0])
+    _, binary = cv2.threshold(img, UQ_threshold.threshold(img), 255, cv2.THRESH_BINARY)
+    con = UQF.plant_labels(binary)
+    shape = binary.shape
+    outer = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    contours = []
+    for c in sorted(outer, key=lambda x:UQF.get_contour_precedence(x, shape[1])):
+        mask = np.zeros(shape, dtype=np.uint8)
+        cv2.drawContours(mask, [c], -1, 1, -1)
+        if np.count_nonzero(mask) > int(binary.size * UQF.MIN_AREA):
+            contours.append(mask.astype(bool))
+    if len(contours) != len(con):
+        failures.append("{} plants instead of {}".format(len(con), len(contours)))
+    reference = {}
+    for i, inside in enumerate(contours):
+        for el, array in arrays.items():
+            reference[(el, i)] = (int(np.count_nonzero(inside)), sum(array[inside].tolist()))
+    counts, _ = UQF.area_contours(con, files)
+    stats, _ = UQF.contour_statistics(con, files)
+    for el, i, count in counts:
+        if count != reference.get((el, i), (0, None))[1]:
+            failures.append("area_contours {} contour {}: {} instead of {}".format(el, i, count, reference[(el, i)][1]))
+    for entry in stats:
+        area, total = reference.get((entry["element"], entry["contour"]), (None, None))
+        if (entry["area"], entry["sum"]) != (area, total):
+            failures.append("contour_statistics {} contour {}: area {} sum {} instead of {} {}".format(
+                entry["element"], entry["contour"], entry["area"], entry["sum"], area, total))
+    largest = max(int(a.max()) for a in arrays.values())
+    print("verify {} {}x{} gain {} (max count {}), {} contours: {}".format(
+        fmt, size, size, gain, largest, len(contours), "failed" if failures else "bit-identical"), flush=True)
+    return failures
+
+def environment():
+    """Describes the machine and library versions of a run.
+
+    Returns: a dictionary with the environment.
+    """
+    return {"python":platform.python_version(), "numpy":np.__version__, "opencv":cv2.__version__,
+            "machine":platform.machine(), "system":platform.system(), "processor":platform.processor(),
+            "time":time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(old_file, new_file):
+    """Prints the speed-up of every stage between two result files.
+
+    Input: old_file, the path of the baseline JSON results.
+    Input: new_file, the path of the new JSON results.
+    """
+    def index(filename):
+        with open(filename) as stream:
+            return {(r["scale"], r["format"], r["stage"]):r for r in json.load(stream)["results"]}
+    old, new = index(old_file), index(new_file)
+    print("{:8} {:5} {:28} {:>10} {:>10} {:>8}".format("scale", "fmt", "stage", "old s", "new s", "speedup"))
+    for key in old:
+        if key in new:
+            o, n = old[key]["median_s"], new[key]["median_s"]
+            print("{:8} {:5} {:28} {:10.4f} {:10.4f} {:7.2f}x".format(*key, o, n, o / n if n else float("inf")))
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the UQ_functions pipeline on synthetic scans.")
+    parser.add_argument("--scales", default="small,medium", help="comma separated scales: {}".format(",".join(SCALES)))
+    parser.add_argument("--format", default="txt", help="comma separated formats: txt,csv,tif")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per stage")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write the results to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--verify", action="store_true", help="compare the results with an exact reference on high-count scans instead of timing")
+    parser.add_argument("--gains", default="3,11,20", help="comma separated factors for the concentration levels of --verify")
+    return parser.parse_args(args)
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    UQ_store.set_store("")
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+    if args.verify:
+        failures = []
+        with tempfile.TemporaryDirectory() as workdir:
+            for fmt in args.format.split(","):
+                for name in args.scales.split(","):
+                    for gain in args.gains.split(","):
+                        failures.extend(verify(SCALES[name]["size"], float(gain), fmt, workdir))
+        for failure in failures:
+            print(failure)
+        sys.exit(1 if failures else 0)
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for fmt in args.format.split(","):
+            for name in args.scales.split(","):
+                records.extend(benchmark_scale(name, SCALES[name], fmt, args.repeat, workdir))
+    with open(args.output, "w") as stream:
+        json.dump({"environment":environment(), "results":records}, stream, indent=1)
+    print("Results written to {}".format(args.output))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Benchmark of the start up time of the GUI.
+
+The GUI is started a number of times in a new python process with
+--startup-time, which makes it print the time from the start of
+UQ_GUI_code.py until the first window is shown and quit. Per run the
+wall time from starting the process until that line is printed is measured
+as well (which includes starting python), and the time to import
+UQ_GUI_code on its own. The results are written as JSON, so two runs
+can be compared.
+
+Usage:
+    bench_startup.py [--repeat 5] [--platform offscreen] [--output startup.json]
+    bench_startup.py --compare old.json new.json
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+#settings
+ROOT = Path(__file__).resolve().parent.parent
+IMPORT_CODE = "import time; t = time.perf_counter(); import UQ_GUI_code; print('import {:.6f}'.format(time.perf_counter() - t))"
+
+#functions
+def run_once(command, env):
+    """Runs one process and reads the time it reports.
+
+    Input: command, the command to run, it prints a line '<name> <seconds>' and exits.
+    Input: env, the environment of the process.
+    Returns: wall, the seconds until the line was printed, and reported, the seconds in the line.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=str(ROOT), env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    reported = None
+    for line in process.stdout:
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in ("startup", "import"):
+            wall = time.perf_counter() - start
+            reported = float(parts[1])
+            break
+    process.stdout.close()
+    process.wait()
+    if reported is None:
+        raise RuntimeError("{} did not report its time (exit code {})".format(" ".join(command), process.returncode))
+    return wall, reported
+
+def summarize(stage, times):
+    """Summarizes the timings of a stage.
+
+    Input: stage, the name of the stage.
+    Input: times, a list of seconds.
+    Returns: a dictionary with the timings in seconds.
+    """
+    return {"stage":stage, "repeat":len(times), "min_s":min(times), "median_s":statistics.median(times),
+            "mean_s":statistics.mean(times), "max_s":max(times)}
+
+def benchmark(repeat, qt_platform=None):
+    """Starts the GUI repeat times and imports UQ_GUI_code repeat times.
+
+    The first start is not timed: it may generate the UI module and fill the disk caches.
+    Input: repeat, the number of timed runs.
+    Input: qt_platform, the Qt platform plugin, for example offscreen, by default the normal one.
+    Returns: records, a list of dictionaries, see summarize.
+    """
+    env = dict(os.environ)
+    if qt_platform:
+        env["QT_QPA_PLATFORM"] = qt_platform
+    gui = [sys.executable, "UQ_GUI_code.py", "--startup-time"]
+    imports = [sys.executable, "-c", IMPORT_CODE]
+    run_once(gui, env)
+    times = {"process_to_window":[], "module_to_window":[], "import_gui_module":[]}
+    for _ in range(repeat):
+        wall, reported = run_once(gui, env)
+        times["process_to_window"].append(wall)
+        times["module_to_window"].append(reported)
+        times["import_gui_module"].append(run_once(imports, env)[1])
+    records = []
+    for stage, values in times.items():
+        records.append(summarize(stage, values))
+        print("{:20} {:9.4f} s".format(stage, records[-1]["median_s"]), flush=True)
+    return records
+
+def environment():
+    """Describes the machine of a run.
+
+    Returns: a dictionary with the environment.
+    """
+    return {"python":platform.python_version(), "machine":platform.machine(), "system":platform.system(),
+            "processor":platform.processor(), "time":time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(old_file, new_file):
+    """Prints the speed-up of every stage between two result files.
+
+    Input: old_file, the path of the baseline JSON results.
+    Input: new_file, the path of the new JSON results.
+    """
+    def index(filename):
+        with open(filename) as stream:
+            return {r["stage"]:r for r in json.load(stream)["results"]}
+    old, new = index(old_file), index(new_file)
+    print("{:20} {:>10} {:>10} {:>8}".format("stage", "old s", "new s", "speedup"))
+    for key in old:
+        if key in new:
+            o, n = old[key]["median_s"], new[key]["median_s"]
+            print("{:20} {:10.4f} {:10.4f} {:7.2f}x".format(key, o, n, o / n if n else float("inf")))
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the start up time of the GUI.")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed starts")
+    parser.add_argument("--platform", default=None, help="Qt platform plugin, for example offscreen on a machine without a display")
+    parser.add_argument("--output", default="startup_results.json", help="JSON file to write the results to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    return parser.parse_args(args)
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+    records = benchmark(args.repeat, args.platform)
+    with open(args.output, "w") as stream:
+        json.dump({"environment":environment(), "results":records}, stream, indent=1)
+    print("Results written to {}".format(args.output))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Checks the job server of UQ_server.py on this machine.
+
+A JobServer is started on a free localhost port with one worker process
+and without the result store. The check sends a job that keeps the worker
+busy and then the same job for another plant from several clients at the
+same time, so all but one of them must follow the running job. The rows
+must be the same as UQ_batch.quantify_plant, every client must get the
+progress of the job, invalid requests and a failed job must give errors
+and the server must close cleanly.
+
+Usage: check_server.py [--size 1000] [--clients 4]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import asyncio
+import io
+import json
+import socket
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import UQ_batch
+import UQ_server
+import synthetic
+
+#settings
+STAGES = ["started", "mask", "quantify"] # the progress of a job, in this order
+INVALID = [ # (request line, event)
+    (b"not json\n", "error"),
+    (b'{"op": "unknown"}\n', "error"),
+    (b'{"op": "quantify", "files": []}\n', "error"),
+    (b'{"op": "quantify", "files": ["nodash.txt"]}\n', "error"),
+    (b'{"op": "quantify", "files": ["P - K.txt"], "cleanup": 5}\n', "error"),
+    (b'{"op": "quantify", "files": ["/does/not/exist/P - K.txt"]}\n', "failed"),
+]
+
+#functions
+def start_server(server):
+    """Runs a JobServer on an event loop in a thread.
+
+    Input: server, a JobServer.
+    Returns: loop, thread, the event loop and the thread that runs it.
+    """
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait(60)
+    return loop, thread
+
+def stop_server(server, loop, thread):
+    """Closes a server of start_server and stops its event loop.
+
+    Input: server, loop, thread, see start_server.
+    """
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(60)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(60)
+    loop.close()
+
+def send_line(address, line):
+    """Sends a raw request line and reads its last event.
+
+    Input: address, the (host, port) of the server.
+    Input: line, the bytes of the request.
+    Returns: the last event, a dictionary.
+    """
+    with socket.create_connection(address, timeout=60) as sock:
+        stream = sock.makefile("rwb")
+        stream.write(line)
+        stream.flush()
+        for line in stream:
+            event = json.loads(line.decode("utf-8"))
+            if event["event"] not in ("queued", "progress"):
+                return event
+    return {"event":"closed"}
+
+def check_server(size, clients, workdir):
+    """Runs all checks on a server.
+
+    Input: size, the width and height of the synthetic scans.
+    Input: clients, the number of clients that send the same job.
+    Input: workdir, a directory for the synthetic files.
+    Returns: failures, a list of strings that describe what went wrong.
+    """
+    elements = synthetic.ELEMENTS[:3]
+    busy_maps, _ = synthetic.make_scan(size * 2, 12, elements, seed=3)
+    busy = synthetic.write_scan(Path(workdir) / "busy", "Busy", busy_maps, "txt")
+    maps, _ = synthetic.make_scan(size, 12, elements, seed=4)
+    files = synthetic.write_scan(Path(workdir) / "shared", "Shared", maps, "txt")
+    # the server sorts the files of a request, so its rows have the elements in that order
+    reference = [tuple(row) for row in UQ_batch.quantify_plant("Shared", sorted(files), elements[0], statistics=True, store=False)]
+    failures = []
+
+    server = UQ_server.JobServer("127.0.0.1", 0, workers=1, store=False, log=io.StringIO())
+    loop, thread = start_server(server)
+    address = "{}:{}".format(server.host, server.port)
+    rows, stages = {}, {}
+    def client(i, job_files):
+        stages[i] = []
+        try:
+            rows[i] = UQ_server.submit(job_files, elements[0], statistics=True, address=address, progress=stages[i].append)
+        except Exception as error:
+            rows[i] = error
+    threads = [threading.Thread(target=client, args=("busy", busy))]
+    threads[0].start()
+    while not server.jobs: # the worker is busy, so the next jobs wait in the pool
+        threading.Event().wait(0.01)
+    threads += [threading.Thread(target=client, args=(i, files)) for i in range(clients)]
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join(600)
+
+    for i in range(clients):
+        if isinstance(rows.get(i), Exception):
+            failures.append("client {}: {}".format(i, rows[i]))
+        elif rows.get(i) != reference:
+            failures.append("client {}: the rows differ from quantify_plant".format(i))
+        if stages.get(i) != STAGES:
+            failures.append("client {}: progress {} instead of {}".format(i, stages.get(i), STAGES))
+    status = UQ_server.status(address)
+    if status["shared"] != clients - 1:
+        failures.append("{} of {} requests followed the running job instead of {}".format(status["shared"], clients, clients - 1))
+    if status["finished"] != 2 or status["running"]:
+        failures.append("status after the jobs: {}".format(status))
+    for line, expected in INVALID:
+        event = send_line((server.host, server.port), line)
+        if event["event"] != expected:
+            failures.append("{!r}: {} instead of {}".format(line, event, expected))
+
+    stop_server(server, loop, thread)
+    if thread.is_alive():
+        failures.append("the server did not stop")
+    try:
+        socket.create_connection((server.host, server.port), timeout=5).close()
+        failures.append("the server still accepts connections after close")
+    except OSError:
+        pass
+    print("server {} clients on {}x{} scans, {} shared: {}".format(
+        clients, size, size, status["shared"], "failed" if failures else "ok"), flush=True)
+    return failures
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Check the job server on a free localhost port.")
+    parser.add_argument("--size", type=int, default=1000, help="width and height of the shared scan, the busy scan is twice as large (default: 1000)")
+    parser.add_argument("--clients", type=int, default=4, help="number of clients that send the same job (default: 4)")
+    return parser.parse_args(args)
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    with tempfile.TemporaryDirectory() as workdir:
+        failures = check_server(args.size, args.clients, workdir)
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Generator of synthetic MicroXRF element maps for benchmarks.
+
+A synthetic scan is a tray of elliptic "plants" on a noisy background.
+All elements of a scan share the same plants, but every element has its
+own concentration level and texture, like a real scan. The maps can be
+written as .txt (counts with a header line), .csv (no header) or .tif
+(8-bit scaled) files with the <plantname> - <element>.<suffix> names
+that UQ_GUI_code.py expects.
+
+Usage: synthetic.py <directory> [--size 1000] [--plants 12] [--elements K,Ca,Zn] [--format txt] [--gain 1]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import sys
+from pathlib import Path
+import cv2
+import numpy as np
+
+#settings
+ELEMENTS = ["K", "Ca", "Zn", "Fe", "Mn", "Cu", "S", "P"]
+ELEMENT_LEVELS = {"K":3000, "Ca":1500, "Zn":300, "Fe":200, "Mn":150, "Cu":60, "S":800, "P":600}
+
+#functions
+def plant_layout(shape, nr_plants, rng):
+    """Places elliptic plants on a grid with some random jitter.
+
+    Input: shape, the (rows, columns) of the scan.
+    Input: nr_plants, the number of plants.
+    Input: rng, a numpy random Generator.
+    Returns: labels, an int32 numpy array with 0 for background and i+1 for plant i.
+    """
+    labels = np.zeros(shape, dtype=np.int32)
+    cols = int(np.ceil(np.sqrt(nr_plants * shape[1] / shape[0])))
+    rows = int(np.ceil(nr_plants / cols))
+    cell_h, cell_w = shape[0] / rows, shape[1] / cols
+    for i in range(nr_plants):
+        r, c = divmod(i, cols)
+        center = (int((c + 0.5 + rng.uniform(-0.15, 0.15)) * cell_w),
+                  int((r + 0.5 + rng.uniform(-0.15, 0.15)) * cell_h))
+        axes = (max(2, int(cell_w * rng.uniform(0.2, 0.35))), max(2, int(cell_h * rng.uniform(0.2, 0.35))))
+        cv2.ellipse(labels, center, axes, rng.uniform(0, 180), 0, 360, i + 1, -1)
+    return labels
+
+def element_map(labels, element, noise, rng, gain=1.0):
+    """Creates the count map of one element.
+
+    Input: labels, the plant layout from plant_layout.
+    Input: element, the element name, used for the concentration level.
+    Input: noise, the relative noise level (0 is no noise).
+    Input: rng, a numpy random Generator.
+    Input: gain, a factor for the concentration level, high gains give counts up to 65535.
+    Returns: array, a uint16 numpy array with counts.
+    """
+    level = ELEMENT_LEVELS.get(element, 500) * gain
+    nr_plants = int(labels.max())
+    plant_levels = np.concatenate([[level * 0.02], level * rng.uniform(0.5, 1.5, nr_plants)])
+    mean = plant_levels[labels]
+    # smooth texture inside the plants
+    texture = cv2.GaussianBlur(rng.standard_normal(labels.shape).astype(np.float32), (0, 0), 3)
+    mean = mean * (1 + 0.3 * texture / max(float(np.abs(texture).max()), 1e-9))
+    counts = rng.poisson(np.clip(mean, 0, None)).astype(np.float64)
+    if noise > 0:
+        counts += rng.normal(0, noise * level, labels.shape)
+    return np.clip(np.rint(counts), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+
+def make_scan(size=1000, nr_plants=12, elements=("K", "Ca", "Zn"), noise=0.05, seed=0, gain=1.0):
+    """Creates all element maps of one synthetic scan.
+
+    Input: size, an int (square scan) or a tuple (rows, columns).
+    Input: nr_plants, the number of plants on the scan.
+    Input: elements, a list of element names.
+    Input: noise, the relative noise level.
+    Input: seed, the random seed, the same seed gives the same scan.
+    Input: gain, a factor for the concentration levels, see element_map.
+    Returns: maps, a dictionary with key:element, value:uint16 count map.
+    Returns: labels, the plant layout.
+    """
+    shape = (size, size) if np.isscalar(size) else tuple(size)
+    rng = np.random.default_rng(seed)
+    labels = plant_layout(shape, nr_plants, rng)
+    maps = {el:element_map(labels, el, noise, rng, gain) for el in elements}
+    return maps, labels
+
+def write_map(array, filename):
+    """Writes a count map in the format given by the suffix of filename.
+
+    Input: array, a uint16 numpy array with counts.
+    Input: filename, a Path ending on .txt, .csv or .tif.
+    """
+    if filename.suffix == ".tif":
+        img = (array.astype(np.int64) * 255 // max(int(array.max()), 1)).astype(np.uint8)
+        cv2.imwrite(str(filename), img)
+    else:
+        with open(filename, "w") as stream:
+            if filename.suffix == ".txt":
+                stream.write("{} counts, {} x {}\n".format(filename.stem, *array.shape))
+            np.savetxt(stream, array, fmt="%d", delimiter=",")
+
+def write_scan(dirname, plantname, maps, fmt="txt"):
+    """Writes all element maps of a scan as <plantname> - <element>.<fmt>.
+
+    Input: dirname, the directory to write to.
+    Input: plantname, the name of the scan.
+    Input: maps, a dictionary with key:element, value:count map.
+    Input: fmt, "txt", "csv" or "tif".
+    Returns: files, a list of strings with the written files.
+    """
+    dirname = Path(dirname)
+    dirname.mkdir(parents=True, exist_ok=True)
+    files = []
+    for el, array in maps.items():
+        filename = dirname / "{} - {}.{}".format(plantname, el, fmt)
+        write_map(array, filename)
+        files.append(str(filename))
+    return files
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Write synthetic MicroXRF scans.")
+    parser.add_argument("directory", help="directory to write the scans to")
+    parser.add_argument("--scans", type=int, default=1, help="number of scans")
+    parser.add_argument("--size", type=int, default=1000, help="width and height of a scan in pixels")
+    parser.add_argument("--plants", type=int, default=12, help="number of plants per scan")
+    parser.add_argument("--elements", default="K,Ca,Zn", help="comma separated elements")
+    parser.add_argument("--noise", type=float, default=0.05, help="relative noise level")
+    parser.add_argument("--format", choices=["txt", "csv", "tif"], default="txt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gain", type=float, default=1.0, help="factor for the concentration levels, for example 20 for counts up to 65535")
+    return parser.parse_args(args)
+
+#main
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    for nr in range(args.scans):
+        maps, _ = make_scan(args.size, args.plants, args.elements.split(","), args.noise, args.seed + nr, args.gain)
+        for f in write_scan(args.directory, "Synthetic {}".format(nr), maps, args.format):
+            print(f)
@@ -0,0 +1,47 @@
+"""Tests of UQ_parser.py on small count files with every possible chunk size.
+
+Run with: python -m pytest tests
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import UQ_parser
+
+#settings
+COUNTS = np.arange(60, dtype=np.uint16).reshape(12, 5) * 97
+
+#functions
+def write_counts(path, end, newline="\n"):
+    """Writes COUNTS as a .txt count file with a header line.
+
+    Input: path, the Path of the file.
+    Input: end, the text after the last row.
+    Input: newline, the line ending.
+    Returns: the text of the file.
+    """
+    rows = [",".join(str(v) for v in row) for row in COUNTS]
+    text = newline.join(["header"] + rows) + end.replace("\n", newline)
+    path.write_bytes(text.encode("ascii"))
+    return text
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("end", ["", "\n", "\n\n", "\n\n\n", "\n \n"])
+def test_trailing_blank_lines_at_every_chunk_boundary(tmp_path, newline, end):
+    path = tmp_path / "P - K.txt"
+    text = write_counts(path, end, newline)
+    for chunk_bytes in range(1, len(text) + 2):
+        with UQ_parser.CountFile(path, 1, chunk_bytes=chunk_bytes) as cf:
+            assert np.array_equal(cf.read(), COUNTS), chunk_bytes
+
+def test_whitespace_inside_a_value(tmp_path):
+    path = tmp_path / "P - K.csv"
+    path.write_bytes(b"1, 2 ,3\n4,5 6,7\n")
+    with pytest.raises(ValueError, match="row 1"):
+        UQ_parser.parse_count_file(path)
@@ -1,27 +1,181 @@
 #!/usr/bin/env python3
+"""Batch conversion of count files to lossless TIFF images.
 
-from sys import argv
-import numpy as np
+Every .txt and .csv file in the given files, directories or glob patterns
+is converted to a 16-bit TIFF (or 32-bit with --bits 32) with the exact
+counts, which UQ_functions.load_image reads back as counts. With --preview
+an 8-bit preview scaled like the GUI shows it is written as well. Files
+are converted in a pool of processes, a file is skipped when its outputs
+are newer than the file, and every output is written to a temporary file
+first and then renamed, so an interrupted run never leaves half images.
+
+Usage: txt_tobitmap.py <files, directories or globs> [--output dir] [--bits 16] [--preview] [--workers 4] [--force]
+
+Author: Jan Aarts and Wieske de Swart
+Email: yannickaarts96@gmail.com;wieskedeswart@gmail.com
+"""
+#imports
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import cv2
+import numpy as np
+import UQ_functions as UQF
+import UQ_parser
+
+#settings
+SUFFIXES = [".txt", ".csv"]
+DTYPES = {16:np.uint16, 32:np.uint32}
+PREVIEW_SUFFIX = ".preview.png"
 
+#functions
 def open_txt_np(filename):
-    array = np.loadtxt(filename, delimiter = ",", skiprows = 1, dtype = "uint16")
-    return array
-
-def save_image(array, filename):
-    max_array = np.max(array)
-    array = array * (255/max_array)
-    array = array.astype("uint8")
-    print(filename)
-    f = Path(filename)
-    f = f.with_suffix(".tif")
-    f = f.name
-    f = "{} - {}".format(max_array, f)
-    cv2.imwrite(f, array)
+    """Parses a count file.
+
+    Input: filename, a string or Path of a .txt or .csv file.
+    Returns: array, a uint16 numpy array with the counts.
+    """
+    return UQ_parser.parse_count_file(filename, UQ_parser.count_file_skiprows(filename), workers=1)
+
+def collect_files(inputs):
+    """Finds all count files in a list of files, directories and glob patterns.
+
+    Input: inputs, a list of strings.
+    Returns: files, a sorted list of Paths of .txt and .csv files without duplicates.
+    """
+    files = set()
+    for pattern in inputs:
+        paths = [Path(p) for p in glob.glob(pattern)] or [Path(pattern)]
+        for path in paths:
+            if path.is_dir():
+                files.update(p for p in path.iterdir() if p.suffix in SUFFIXES and p.is_file())
+            elif path.suffix in SUFFIXES and path.is_file():
+                files.add(path)
+    return sorted(files)
+
+def output_paths(filename, output_dir=None):
+    """Gets the paths of the image and the preview of a count file.
+
+    Input: filename, a Path of a count file.
+    Input: output_dir, the directory of the outputs, by default the directory of the file.
+    Returns: tif, preview, the Paths of <name>.tif and <name>.preview.png.
+    """
+    directory = Path(output_dir) if output_dir else filename.parent
+    return directory / (filename.stem + ".tif"), directory / (filename.stem + PREVIEW_SUFFIX)
+
+def is_up_to_date(filename, outputs):
+    """Checks if all outputs exist and are newer than the source file.
+
+    Input: filename, the Path of the source file.
+    Input: outputs, a list of Paths.
+    Returns: True if nothing has to be converted.
+    """
+    source = filename.stat().st_mtime_ns
+    for output in outputs:
+        if not output.is_file() or output.stat().st_mtime_ns < source:
+            return False
+    return True
+
+def write_atomic(filename, img):
+    """Encodes an image and writes it to a temporary file that is then renamed.
+
+    Input: filename, the Path to write, the suffix gives the image format.
+    Input: img, a numpy array.
+    """
+    ok, data = cv2.imencode(filename.suffix, img)
+    if not ok:
+        raise ValueError("could not encode {} as {}".format(img.dtype, filename.suffix))
+    temp = filename.with_name(filename.name + ".tmp")
+    try:
+        with open(str(temp), "wb") as stream:
+            stream.write(data.tobytes())
+        os.replace(str(temp), str(filename))
+    except BaseException:
+        if temp.exists():
+            temp.unlink()
+        raise
+
+def convert_file(filename, output_dir=None, bits=16, preview=False, force=False):
+    """Converts one count file.
+
+    Input: filename, the Path of a .txt or .csv file.
+    Input: output_dir, the directory of the outputs, by default the directory of the file.
+    Input: bits, 16 or 32, the bits per pixel of the TIFF.
+    Input: preview, if True an 8-bit preview is written as well.
+    Input: force, if True the file is converted even if the outputs are up to date.
+    Returns: filename, status ("converted", "skipped" or "failed") and error (None or a string with the error message).
+    """
+    tif, preview_file = output_paths(filename, output_dir)
+    outputs = [tif, preview_file] if preview else [tif]
+    try:
+        if not force and is_up_to_date(filename, outputs):
+            return filename, "skipped", None
+        array = open_txt_np(filename)
+        write_atomic(tif, array.astype(DTYPES[bits], copy=False))
+        if preview:
+            write_atomic(preview_file, UQF.array_to_img(array))
+        return filename, "converted", None
+    except Exception as error:
+        return filename, "failed", "{}: {}".format(type(error).__name__, error)
+
+def convert(inputs, output_dir=None, bits=16, preview=False, workers=None, force=False, log=sys.stderr):
+    """Converts all count files of files, directories and glob patterns.
+
+    Input: inputs, a list of strings.
+    Input: output_dir, bits, preview, force, see convert_file.
+    Input: workers, the number of processes, by default the number of cpus.
+    Input: log, the stream to write progress to.
+    Returns: statuses, a dictionary with key:status, value:number of files.
+    """
+    files = collect_files(inputs)
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    args = [(f, output_dir, bits, preview, force) for f in files]
+    statuses = {"converted":0, "skipped":0, "failed":0}
+    if workers == 1 or len(files) < 2:
+        results = (convert_file(*a) for a in args)
+        report(results, len(files), statuses, log)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            report(pool.map(convert_file, *zip(*args)), len(files), statuses, log)
+    return statuses
+
+def report(results, total, statuses, log):
+    """Writes the status of every converted file.
+
+    Input: results, an iterator with convert_file results.
+    Input: total, the number of files.
+    Input: statuses, a dictionary with the number of files per status, which is updated.
+    Input: log, the stream to write progress to.
+    """
+    for done, (filename, status, error) in enumerate(results, 1):
+        statuses[status] += 1
+        msg = status if error is None else "{}, {}".format(status, error)
+        print("[{}/{}] {}: {}".format(done, total, filename.name, msg), file=log, flush=True)
+
+def parse_args(args):
+    """Parses the command line arguments.
+
+    Input: args, a list of command line arguments.
+    Returns: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Convert .txt and .csv count files to lossless TIFF images.")
+    parser.add_argument("inputs", nargs="+", help="count files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default=None, help="directory for the images (default: next to the count files)")
+    parser.add_argument("-b", "--bits", type=int, default=16, choices=sorted(DTYPES), help="bits per pixel of the TIFF (default: 16)")
+    parser.add_argument("-p", "--preview", action="store_true", help="also write an 8-bit <name>{} preview".format(PREVIEW_SUFFIX))
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    parser.add_argument("-f", "--force", action="store_true", help="convert files even if the images are up to date")
+    return parser.parse_args(args)
 
+#main
 if __name__ == "__main__":
-    filename = argv[1]
-    array = open_txt_np(filename)
-    save_image(array, filename)
-    
+    args = parse_args(sys.argv[1:])
+    statuses = convert(args.inputs, args.output, args.bits, args.preview, args.workers, args.force)
+    print("{converted} converted, {skipped} up to date, {failed} failed".format(**statuses), file=sys.stderr)
+    if statuses["failed"]:
+        sys.exit(1)
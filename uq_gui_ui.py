@@ -0,0 +1,284 @@
+# ui hash: c2f64477d61417266ecc65b4b1255ae4a2564cf0
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'uq_gui.ui'
+#
+# Created by: PyQt5 UI code generator 5.13.0
+#
+# WARNING! All changes made in this file will be lost!
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_UQ_GUI(object):
+    def setupUi(self, UQ_GUI):
+        UQ_GUI.setObjectName("UQ_GUI")
+        UQ_GUI.resize(1063, 849)
+        self.centralwidget = QtWidgets.QWidget(UQ_GUI)
+        self.centralwidget.setEnabled(True)
+        self.centralwidget.setObjectName("centralwidget")
+        self.gridLayout_2 = QtWidgets.QGridLayout(self.centralwidget)
+        self.gridLayout_2.setObjectName("gridLayout_2")
+        self.gridLayout = QtWidgets.QGridLayout()
+        self.gridLayout.setObjectName("gridLayout")
+        self.verticalLayout = QtWidgets.QVBoxLayout()
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        self.label = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.label.setFont(font)
+        self.label.setObjectName("label")
+        self.horizontalLayout_3.addWidget(self.label)
+        self.TB_imagefolder = QtWidgets.QToolButton(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.TB_imagefolder.setFont(font)
+        self.TB_imagefolder.setObjectName("TB_imagefolder")
+        self.horizontalLayout_3.addWidget(self.TB_imagefolder)
+        spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_3.addItem(spacerItem)
+        self.PB_clearimgs = QtWidgets.QPushButton(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.PB_clearimgs.setFont(font)
+        self.PB_clearimgs.setObjectName("PB_clearimgs")
+        self.horizontalLayout_3.addWidget(self.PB_clearimgs)
+        self.verticalLayout.addLayout(self.horizontalLayout_3)
+        self.horizontalLayout_4 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.label_2 = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.label_2.setFont(font)
+        self.label_2.setObjectName("label_2")
+        self.horizontalLayout_4.addWidget(self.label_2)
+        self.CB_selectplant = QtWidgets.QComboBox(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.CB_selectplant.setFont(font)
+        self.CB_selectplant.setObjectName("CB_selectplant")
+        self.horizontalLayout_4.addWidget(self.CB_selectplant)
+        self.verticalLayout.addLayout(self.horizontalLayout_4)
+        self.LW_imgpaths = QtWidgets.QListWidget(self.centralwidget)
+        self.LW_imgpaths.setObjectName("LW_imgpaths")
+        self.verticalLayout.addWidget(self.LW_imgpaths)
+        self.gridLayout.addLayout(self.verticalLayout, 0, 0, 1, 1)
+        self.verticalLayout_2 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_2.setObjectName("verticalLayout_2")
+        self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_2.setObjectName("horizontalLayout_2")
+        self.label_stat = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.label_stat.setFont(font)
+        self.label_stat.setObjectName("label_stat")
+        self.horizontalLayout_2.addWidget(self.label_stat)
+        self.CB_selectstat = QtWidgets.QComboBox(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.CB_selectstat.setFont(font)
+        self.CB_selectstat.setObjectName("CB_selectstat")
+        self.horizontalLayout_2.addWidget(self.CB_selectstat)
+        self.label_4 = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.label_4.setFont(font)
+        self.label_4.setObjectName("label_4")
+        self.horizontalLayout_2.addWidget(self.label_4)
+        self.LE_csvfilename = QtWidgets.QLineEdit(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.LE_csvfilename.setFont(font)
+        self.LE_csvfilename.setObjectName("LE_csvfilename")
+        self.horizontalLayout_2.addWidget(self.LE_csvfilename)
+        self.PB_csvexport = QtWidgets.QPushButton(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.PB_csvexport.setFont(font)
+        self.PB_csvexport.setObjectName("PB_csvexport")
+        self.horizontalLayout_2.addWidget(self.PB_csvexport)
+        self.verticalLayout_2.addLayout(self.horizontalLayout_2)
+        self.Table = QtWidgets.QTableWidget(self.centralwidget)
+        self.Table.setObjectName("Table")
+        self.Table.setColumnCount(0)
+        self.Table.setRowCount(0)
+        self.verticalLayout_2.addWidget(self.Table)
+        self.gridLayout.addLayout(self.verticalLayout_2, 0, 1, 1, 1)
+        self.ImgTabs = QtWidgets.QTabWidget(self.centralwidget)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.ImgTabs.sizePolicy().hasHeightForWidth())
+        self.ImgTabs.setSizePolicy(sizePolicy)
+        self.ImgTabs.setBaseSize(QtCore.QSize(750, 500))
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.ImgTabs.setFont(font)
+        self.ImgTabs.setObjectName("ImgTabs")
+        self.gridLayout.addWidget(self.ImgTabs, 1, 0, 1, 1)
+        self.verticalLayout_3 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_3.setObjectName("verticalLayout_3")
+        self.horizontalLayout = QtWidgets.QHBoxLayout()
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.label_3 = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.label_3.setFont(font)
+        self.label_3.setObjectName("label_3")
+        self.horizontalLayout.addWidget(self.label_3)
+        self.CB_selectthreshold = QtWidgets.QComboBox(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.CB_selectthreshold.setFont(font)
+        self.CB_selectthreshold.setObjectName("CB_selectthreshold")
+        self.CB_selectthreshold.addItem("")
+        self.CB_selectthreshold.addItem("")
+        self.CB_selectthreshold.addItem("")
+        self.CB_selectthreshold.addItem("")
+        self.CB_selectthreshold.addItem("")
+        self.CB_selectthreshold.addItem("")
+        self.horizontalLayout.addWidget(self.CB_selectthreshold)
+        self.CB_selectel = QtWidgets.QComboBox(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.CB_selectel.setFont(font)
+        self.CB_selectel.setObjectName("CB_selectel")
+        self.horizontalLayout.addWidget(self.CB_selectel)
+        self.SB_selectmanualth = QtWidgets.QSpinBox(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.SB_selectmanualth.setFont(font)
+        self.SB_selectmanualth.setMaximum(255)
+        self.SB_selectmanualth.setObjectName("SB_selectmanualth")
+        self.horizontalLayout.addWidget(self.SB_selectmanualth)
+        self.SL_threshold = QtWidgets.QSlider(self.centralwidget)
+        self.SL_threshold.setMinimumSize(QtCore.QSize(120, 0))
+        self.SL_threshold.setMaximum(255)
+        self.SL_threshold.setOrientation(QtCore.Qt.Horizontal)
+        self.SL_threshold.setObjectName("SL_threshold")
+        self.horizontalLayout.addWidget(self.SL_threshold)
+        self.PB_showmask = QtWidgets.QPushButton(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.PB_showmask.setFont(font)
+        self.PB_showmask.setObjectName("PB_showmask")
+        self.horizontalLayout.addWidget(self.PB_showmask)
+        spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout.addItem(spacerItem1)
+        self.PB_applymask = QtWidgets.QPushButton(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.PB_applymask.setFont(font)
+        self.PB_applymask.setObjectName("PB_applymask")
+        self.horizontalLayout.addWidget(self.PB_applymask)
+        self.verticalLayout_3.addLayout(self.horizontalLayout)
+        self.GV_mask = ZoomView(self.centralwidget)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.GV_mask.sizePolicy().hasHeightForWidth())
+        self.GV_mask.setSizePolicy(sizePolicy)
+        self.GV_mask.setMinimumSize(QtCore.QSize(0, 0))
+        self.GV_mask.setMouseTracking(True)
+        self.GV_mask.setObjectName("GV_mask")
+        self.verticalLayout_3.addWidget(self.GV_mask)
+        self.gridLayout.addLayout(self.verticalLayout_3, 1, 1, 1, 1)
+        self.gridLayout.setColumnStretch(0, 1)
+        self.gridLayout.setColumnStretch(1, 1)
+        self.gridLayout.setRowStretch(0, 1)
+        self.gridLayout.setRowStretch(1, 1)
+        self.gridLayout_2.addLayout(self.gridLayout, 0, 0, 1, 1)
+        UQ_GUI.setCentralWidget(self.centralwidget)
+        self.menubar = QtWidgets.QMenuBar(UQ_GUI)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 1063, 26))
+        self.menubar.setObjectName("menubar")
+        self.menuMenu = QtWidgets.QMenu(self.menubar)
+        self.menuMenu.setObjectName("menuMenu")
+        self.menuInfo = QtWidgets.QMenu(self.menubar)
+        self.menuInfo.setObjectName("menuInfo")
+        UQ_GUI.setMenuBar(self.menubar)
+        self.statusbar = QtWidgets.QStatusBar(UQ_GUI)
+        self.statusbar.setObjectName("statusbar")
+        UQ_GUI.setStatusBar(self.statusbar)
+        self.actionOpen = QtWidgets.QAction(UQ_GUI)
+        self.actionOpen.setObjectName("actionOpen")
+        self.actionSave = QtWidgets.QAction(UQ_GUI)
+        self.actionSave.setObjectName("actionSave")
+        self.menu_doc = QtWidgets.QAction(UQ_GUI)
+        self.menu_doc.setObjectName("menu_doc")
+        self.menu_about = QtWidgets.QAction(UQ_GUI)
+        self.menu_about.setObjectName("menu_about")
+        self.menu_opencatalog = QtWidgets.QAction(UQ_GUI)
+        self.menu_opencatalog.setObjectName("menu_opencatalog")
+        self.menu_savecatalog = QtWidgets.QAction(UQ_GUI)
+        self.menu_savecatalog.setObjectName("menu_savecatalog")
+        self.menu_ratios = QtWidgets.QAction(UQ_GUI)
+        self.menu_ratios.setObjectName("menu_ratios")
+        self.menu_exportall = QtWidgets.QAction(UQ_GUI)
+        self.menu_exportall.setObjectName("menu_exportall")
+        self.menu_trace = QtWidgets.QAction(UQ_GUI)
+        self.menu_trace.setCheckable(True)
+        self.menu_trace.setObjectName("menu_trace")
+        self.menu_tracesummary = QtWidgets.QAction(UQ_GUI)
+        self.menu_tracesummary.setObjectName("menu_tracesummary")
+        self.menu_tracesave = QtWidgets.QAction(UQ_GUI)
+        self.menu_tracesave.setObjectName("menu_tracesave")
+        self.menu_github = QtWidgets.QAction(UQ_GUI)
+        self.menu_github.setObjectName("menu_github")
+        self.menuMenu.addAction(self.menu_opencatalog)
+        self.menuMenu.addAction(self.menu_savecatalog)
+        self.menuMenu.addSeparator()
+        self.menuMenu.addAction(self.menu_ratios)
+        self.menuMenu.addAction(self.menu_exportall)
+        self.menuMenu.addSeparator()
+        self.menuMenu.addAction(self.menu_trace)
+        self.menuMenu.addAction(self.menu_tracesummary)
+        self.menuMenu.addAction(self.menu_tracesave)
+        self.menuInfo.addAction(self.menu_doc)
+        self.menuInfo.addAction(self.menu_github)
+        self.menuInfo.addAction(self.menu_about)
+        self.menubar.addAction(self.menuMenu.menuAction())
+        self.menubar.addAction(self.menuInfo.menuAction())
+
+        self.retranslateUi(UQ_GUI)
+        self.ImgTabs.setCurrentIndex(-1)
+        QtCore.QMetaObject.connectSlotsByName(UQ_GUI)
+
+    def retranslateUi(self, UQ_GUI):
+        _translate = QtCore.QCoreApplication.translate
+        UQ_GUI.setWindowTitle(_translate("UQ_GUI", "MicroXRF Analyzer - University of Queensland"))
+        self.label.setText(_translate("UQ_GUI", "Select images:"))
+        self.TB_imagefolder.setText(_translate("UQ_GUI", "..."))
+        self.PB_clearimgs.setText(_translate("UQ_GUI", "Clear all images"))
+        self.label_2.setText(_translate("UQ_GUI", "Select plant:"))
+        self.label_stat.setText(_translate("UQ_GUI", "Show:"))
+        self.label_4.setText(_translate("UQ_GUI", "Filename:"))
+        self.PB_csvexport.setText(_translate("UQ_GUI", "Export as .csv"))
+        self.label_3.setText(_translate("UQ_GUI", "Select threshold:"))
+        self.CB_selectthreshold.setItemText(0, _translate("UQ_GUI", "Auto"))
+        self.CB_selectthreshold.setItemText(1, _translate("UQ_GUI", "Manual"))
+        self.CB_selectthreshold.setItemText(2, _translate("UQ_GUI", "Balanced"))
+        self.CB_selectthreshold.setItemText(3, _translate("UQ_GUI", "Otsu"))
+        self.CB_selectthreshold.setItemText(4, _translate("UQ_GUI", "Triangle"))
+        self.CB_selectthreshold.setItemText(5, _translate("UQ_GUI", "Percentile"))
+        self.SL_threshold.setToolTip(_translate("UQ_GUI", "Manual threshold, the mask is updated while dragging"))
+        self.PB_showmask.setText(_translate("UQ_GUI", "Show mask"))
+        self.PB_applymask.setText(_translate("UQ_GUI", "Apply mask"))
+        self.menuMenu.setTitle(_translate("UQ_GUI", "Menu"))
+        self.menuInfo.setTitle(_translate("UQ_GUI", "Info"))
+        self.actionOpen.setText(_translate("UQ_GUI", "Open"))
+        self.actionSave.setText(_translate("UQ_GUI", "Save"))
+        self.menu_doc.setText(_translate("UQ_GUI", "Documentation"))
+        self.menu_about.setText(_translate("UQ_GUI", "About"))
+        self.menu_opencatalog.setText(_translate("UQ_GUI", "Open catalog..."))
+        self.menu_savecatalog.setText(_translate("UQ_GUI", "Save catalog..."))
+        self.menu_ratios.setText(_translate("UQ_GUI", "Ratios and co-localization..."))
+        self.menu_exportall.setText(_translate("UQ_GUI", "Export all plants..."))
+        self.menu_trace.setText(_translate("UQ_GUI", "Record timings"))
+        self.menu_tracesummary.setText(_translate("UQ_GUI", "Show timing summary"))
+        self.menu_tracesave.setText(_translate("UQ_GUI", "Save timings..."))
+        self.menu_github.setText(_translate("UQ_GUI", "Github"))
+from UQ_viewer import ZoomView